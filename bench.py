@@ -0,0 +1,86 @@
+'''
+.. mindscape -- Mindscape Engine
+bench -- Benchmark Utilities
+============================
+
+This module contains the small amount of shared machinery used by the
+``bench_*.py`` scripts: timing a callable over a number of frames while counting
+GL calls and allocations, and printing the results as a table.
+'''
+
+import gc
+from timeit import default_timer as clock
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc=None
+
+class Result(object):
+	'''The per-frame averages of a :func:`Measure` run.'''
+	def __init__(self, name, frames, time, glcalls, allocs):
+		#: The name of the benchmark.
+		self.name=name
+		#: The number of frames measured.
+		self.frames=frames
+		#: The average wall time per frame, in seconds.
+		self.time=time
+		#: The average number of GL calls per frame (or ``None`` if not counted).
+		self.glcalls=glcalls
+		#: The average allocations per frame (see :func:`Measure`), or ``None`` if not measured.
+		self.allocs=allocs
+
+def Measure(name, func, frames=100, warmup=1, counter=None, allocations=None):
+	'''Call ``func`` ``warmup`` times, then ``frames`` times while measuring,
+and return a :class:`Result`.
+
+If ``counter`` is given, it should be an object with a ``calls`` attribute
+(such as a :class:`gl.RecordingBackend` or :class:`gl.CountingBackend`) whose
+increase is reported as GL calls.
+
+If ``allocations`` is given, it should be a callable returning a running count
+of allocations (such as an instance counter), whose increase is reported.
+Otherwise, allocations are measured as the bytes allocated (the peak traced
+memory above the starting point) per frame if ``tracemalloc`` is available, and
+not at all if it isn't--the garbage collector's counts are net of the objects
+freed, so temporaries wouldn't show.'''
+	for i in xrange(warmup):
+		func()
+	gc.collect()
+	gcwas=gc.isenabled()
+	gc.disable()
+	try:
+		allocs=None
+		if allocations is None and tracemalloc is not None:
+			allocs=0
+			tracemalloc.start()
+			for i in xrange(frames):
+				tracemalloc.clear_traces() #Also resets the peak
+				func()
+				allocs+=tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+		elif allocations is not None:
+			allocs=-allocations()
+		calls=(counter.calls if counter is not None else 0)
+		start=clock()
+		for i in xrange(frames):
+			func()
+		elapsed=clock()-start
+		if allocations is not None:
+			allocs+=allocations()
+	finally:
+		if gcwas:
+			gc.enable()
+	glcalls=(None if counter is None else (counter.calls-calls)/float(frames))
+	return Result(name, frames, elapsed/frames, glcalls, (None if allocs is None else allocs/float(frames)))
+
+def Report(results, out=None):
+	'''Print a table of :class:`Result`\ s to ``out`` (default ``sys.stdout``).'''
+	import sys
+	if out is None:
+		out=sys.stdout
+	out.write('%-24s %8s %12s %12s %14s\n'%('benchmark', 'frames', 'ms/frame', 'GL/frame', 'allocs/frame'))
+	for res in results:
+		gl=('-' if res.glcalls is None else '%.1f'%(res.glcalls,))
+		allocs=('-' if res.allocs is None else '%.1f'%(res.allocs,))
+		out.write('%-24s %8d %12.3f %12s %14s\n'%(res.name, res.frames, res.time*1000, gl, allocs))
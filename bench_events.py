@@ -0,0 +1,85 @@
+'''Input path benchmarks.
+
+Translates a frame's worth of synthetic ``pygame`` events (mostly mouse
+movements, as from a high-rate mouse) into engine events and dispatches them to
+a small handler tree, with and without coalescing and pooling (see
+:class:`event.EventQueue`). The allocations reported are the
+:class:`event.MouseMoveEvent`\ s constructed per frame (see
+:attr:`event.MouseMoveEvent.ALLOCATED`). No window is required. Run as::
+
+	python bench_events.py [frames]
+'''
+
+import sys
+
+import pygame
+from pygame.locals import MOUSEMOTION, KEYDOWN, KEYUP, K_a
+
+from vmath import Vector
+from event import *
+import bench
+
+HEIGHT=480
+
+#: The number of mouse movements per frame.
+MOVES=200
+
+class Handler(EventHandler):
+	def __init__(self, children=()):
+		EventHandler.__init__(self)
+		self.children=list(children)
+		self.handled=0
+		for child in self.children:
+			child.parent=self
+			self.UpdateListening(child.listening, 1)
+	def Handle(self, ev):
+		self.handled+=1
+	def TriggerChildren(self, ev):
+		for child in self.children:
+			if child.listening:
+				child.Trigger(ev)
+
+def Input():
+	evs=[]
+	for i in xrange(MOVES):
+		evs.append(pygame.event.Event(MOUSEMOTION, pos=(i%640, i%480), rel=(1, 1), buttons=(0, 0, 0)))
+		if i%50==0:
+			evs.append(pygame.event.Event(KEYDOWN, key=K_a, unicode=u'a', mod=0))
+			evs.append(pygame.event.Event(KEYUP, key=K_a, mod=0))
+	return evs
+
+def Generic(evs, target):
+	'''The old input path: every event is an :class:`event.Event` with a ``__dict__``.'''
+	def frame():
+		for ev in evs:
+			if ev.type==MOUSEMOTION:
+				target.Trigger(Event(EVENT.MOUSE, subtype=MOUSE.MOVE, pos=Vector(ev.pos[0], HEIGHT-ev.pos[1]),
+									 rel=Vector(ev.rel[0], -ev.rel[1]), buttons=ev.buttons))
+			elif ev.type==KEYDOWN:
+				target.Trigger(Event(EVENT.KBD, subtype=KBD.KEYDOWN, key=ev.key))
+				target.Trigger(Event(EVENT.KBD, subtype=KBD.CHAR, char=ev.unicode))
+			else:
+				target.Trigger(Event(EVENT.KBD, subtype=KBD.KEYUP, key=ev.key))
+	return frame
+
+def Queued(evs, target, coalesce, pool):
+	queue=EventQueue(coalesce, pool)
+	def frame():
+		for ev in evs:
+			for e in Event.FromPygame(ev, HEIGHT, pool):
+				queue.Put(e)
+		queue.Dispatch(target)
+	return frame
+
+if __name__=='__main__':
+	frames=(int(sys.argv[1]) if len(sys.argv)>1 else 200)
+	evs=Input()
+	target=Handler([Handler() for i in xrange(8)])
+	cases=[('generic', Generic(evs, target)),
+		   ('typed', Queued(evs, target, False, False)),
+		   ('typed+pooled', Queued(evs, target, False, True)),
+		   ('typed+coalesced', Queued(evs, target, True, False)),
+		   ('typed+coalesced+pooled', Queued(evs, target, True, True))]
+	#(The generic path makes Events instead, so its allocations aren't counted)
+	allocated=lambda: MouseMoveEvent.ALLOCATED
+	bench.Report([bench.Measure(name, func, frames, allocations=(None if name=='generic' else allocated)) for name, func in cases])
@@ -0,0 +1,94 @@
+'''GL per-call overhead benchmark.
+
+Measures the cost of the immediate-mode calls made by :func:`scenegraph.Vertex.Render`,
+:func:`scenegraph.Face.Render` and :func:`scenegraph.SSSprite.Render` in the
+default mode, in production mode, and in production mode with raw entry points
+(see :func:`engine.Init`). Since the production flags must be set before
+PyOpenGL is imported, each mode is measured in its own interpreter. Unlike the
+other benchmarks, this needs a real GL context (it opens a small window). Run
+as::
+
+	python bench_glcall.py [calls]
+'''
+
+import sys
+import subprocess
+from timeit import default_timer as clock
+
+#: (name, production, raw)
+MODES=[('default', False, False),
+	   ('production', True, False),
+	   ('production+raw', True, True)]
+
+def Run(mode, calls):
+	name, production, raw=[i for i in MODES if i[0]==mode][0]
+	import engine
+	engine.Init(production=production, raw=raw)
+	import pygame
+	from pygame.locals import OPENGL, DOUBLEBUF
+	from gl import GL
+	from vmath import Vector
+	from scenegraph import Vertex, Face, SSSprite
+	pygame.init()
+	pygame.display.set_mode((64, 64), OPENGL|DOUBLEBUF)
+	vert=Vertex(Vector(0, 0, 0, 1), Vector(1, 1, 1, 1), Vector(0, 0, 1), Vector(0, 0, 0))
+	face=Face(GL.GL_POINTS, *[vert]*64)
+	spr=SSSprite()
+	def glvertex():
+		GL.glBegin(GL.GL_POINTS)
+		for i in xrange(calls):
+			GL.glVertex3d(0.0, 0.0, 0.0)
+		GL.glEnd()
+	def glcolor():
+		for i in xrange(calls):
+			GL.glColor4d(1.0, 1.0, 1.0, 1.0)
+	def vertex():
+		GL.glBegin(GL.GL_POINTS)
+		for i in xrange(calls):
+			vert.Render()
+		GL.glEnd()
+	def facerender():
+		for i in xrange(calls//64):
+			face.Render()
+	def sprite():
+		for i in xrange(calls//16):
+			spr.Render()
+	#(name, callable, number of GL calls made)
+	cases=[('glVertex3d', glvertex, calls),
+		   ('glColor4d', glcolor, calls),
+		   ('Vertex.Render', vertex, calls*4),
+		   ('Face.Render', facerender, (calls//64)*(64*4+2)),
+		   ('SSSprite.Render', sprite, (calls//16)*22)]
+	for case, func, n in cases:
+		func() #Warm up (and resolve names)
+		GL.glFinish()
+		start=clock()
+		func()
+		GL.glFinish()
+		sys.stdout.write('%s %r\n'%(case, (clock()-start)/n))
+
+def Main(calls):
+	results={}
+	order=[]
+	for mode, production, raw in MODES:
+		out=subprocess.check_output([sys.executable, __file__, '--mode', mode, str(calls)])
+		for line in out.decode('ascii', 'replace').splitlines():
+			parts=line.split()
+			if len(parts)!=2:
+				continue
+			try:
+				cost=float(parts[1])
+			except ValueError:
+				continue
+			if parts[0] not in results:
+				order.append(parts[0])
+			results.setdefault(parts[0], {})[mode]=cost
+	sys.stdout.write('%-18s'%('ns/GL call',)+''.join(['%18s'%(i[0],) for i in MODES])+'\n')
+	for case in order:
+		sys.stdout.write('%-18s'%(case,)+''.join(['%18.1f'%(results[case].get(i[0], float('nan'))*1e9,) for i in MODES])+'\n')
+
+if __name__=='__main__':
+	if len(sys.argv)>2 and sys.argv[1]=='--mode':
+		Run(sys.argv[2], (int(sys.argv[3]) if len(sys.argv)>3 else 100000))
+	else:
+		Main(int(sys.argv[1]) if len(sys.argv)>1 else 100000)
@@ -0,0 +1,51 @@
+'''Engine startup benchmark.
+
+Imports each engine module in a fresh interpreter and reports how long the
+import took, along with which of the heavy dependencies (``pygame``, ``OpenGL``,
+``numpy``, ``ode``) it pulled in. Each import is repeated, and the fastest run
+is kept. Run as::
+
+	python bench_import.py [repeats]
+'''
+
+import os
+import sys
+import subprocess
+
+#: The modules to import, in order.
+MODULES=['log', 'vmath', 'gl', 'event', 'replay', 'scheduler', 'prof', 'engine', 'scenegraph', 'layout', 'phys', 'npphys', 'physproc', 'pipeline']
+#: The dependencies that are reported if loaded.
+HEAVY=['numpy', 'pygame', 'OpenGL', 'ode']
+
+SNIPPET='''import sys
+from timeit import default_timer as clock
+start=clock()
+import %s
+end=clock()
+sys.stdout.write('%%r %%s\\n'%%(end-start, ','.join([m for m in %r if m in sys.modules]) or '-'))
+'''
+
+def Time(module, repeats):
+	'''Returns ``(seconds, heavy modules loaded)`` for the fastest of ``repeats``
+imports of ``module``, or ``(None, error)`` if it failed to import.'''
+	best=None
+	loaded='-'
+	here=os.path.dirname(os.path.abspath(__file__))
+	for i in xrange(repeats):
+		proc=subprocess.Popen([sys.executable, '-c', SNIPPET%(module, HEAVY)], cwd=here,
+							  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out, err=proc.communicate()
+		if proc.returncode:
+			return None, err.decode('ascii', 'replace').strip().splitlines()[-1]
+		t, loaded=out.decode('ascii', 'replace').split()[-2:]
+		t=float(t)
+		if best is None or t<best:
+			best=t
+	return best, loaded
+
+if __name__=='__main__':
+	repeats=(int(sys.argv[1]) if len(sys.argv)>1 else 5)
+	sys.stdout.write('%-12s %10s  %s\n'%('module', 'ms', 'loaded'))
+	for module in MODULES:
+		t, loaded=Time(module, repeats)
+		sys.stdout.write('%-12s %10s  %s\n'%(module, ('-' if t is None else '%.1f'%(t*1000,)), loaded))
@@ -0,0 +1,77 @@
+'''Long list benchmark.
+
+Shows a list of a number of items, in a window-sized container, both as one
+:class:`layout.Label` per item (in a :class:`layout.Grid` with a row for each)
+and as a :class:`layout.VirtualList`, and measures the cost of a frame in which
+the list is scrolled by one row, through a :class:`gl.RecordingBackend`. The
+time taken to build each list, and the number of labels made, is printed too.
+Run as::
+
+	python bench_list.py [frames]
+'''
+
+import sys
+from timeit import default_timer as clock
+
+import pygame
+
+from vmath import Vector
+from gl import GL, RecordingBackend
+from layout import *
+import bench
+
+pygame.init()
+
+WIDTH, HEIGHT=640, 480
+
+backend=RecordingBackend((0, 0, WIDTH, HEIGHT), record=False)
+GL.Use(backend)
+
+#: The numbers of items to measure.
+COUNTS=[1000, 10000]
+
+#: The height of a row, in pixels.
+ROW=30
+
+def Text(index):
+	return 'Item %d'%(index,)
+
+def Eager(n):
+	'''A label per item. Scrolling shifts them all up, by shrinking a spacer row
+above the first item below zero.'''
+	font=pygame.font.SysFont(pygame.font.get_default_font(), 30)
+	visible=HEIGHT//ROW
+	#Item 0 is at the top (below the spacer); the first cell takes up the (negative) remainder at the bottom
+	spacer=LayoutCell(0, 0)
+	rows=LayoutVector(*([LayoutCell()]+[LayoutCell(0, ROW) for i in xrange(n)]+[spacer]))
+	con=Container(Grid(rows, 1))
+	labels=[Label(con.grid.cols[0], rows[n-i], text=Text(i), font=font, parent=con) for i in xrange(n)]
+	state={'top': 0}
+	def frame():
+		top=state['top']=(state['top']+1)%(n-visible)
+		spacer.fixed=-top*ROW
+		with con:
+			con.Render()
+	return frame, len(labels)
+
+def Virtual(n):
+	'''A :class:`layout.VirtualList` of the items.'''
+	con=Container(Grid(1, 1))
+	vl=VirtualList(*con.grid.CellPair(0, 0), source=Text, count=n, rowheight=ROW, parent=con)
+	def frame():
+		vl.ScrollTo((vl.top+1)%(n-vl.visible))
+		with con:
+			con.Render()
+	frame()
+	return frame, len(vl.bound)+len(vl.spare)
+
+if __name__=='__main__':
+	frames=(int(sys.argv[1]) if len(sys.argv)>1 else 20)
+	results=[]
+	for n in COUNTS:
+		for name, build in (('labels', Eager), ('virtual', Virtual)):
+			start=clock()
+			frame, labels=build(n)
+			print '%s (%d): built in %.1fms, %d labels'%(name, n, (clock()-start)*1000, labels)
+			results.append(bench.Measure('%s (%d)'%(name, n), frame, frames, counter=backend))
+	bench.Report(results)
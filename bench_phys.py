@@ -0,0 +1,88 @@
+'''Physics step benchmark.
+
+Drops a number of spheres and boxes onto a floor and measures the cost of one
+physics step, once they have had time to pile up, with each available backend
+(:class:`npphys.NumpyBackend` always; :class:`phys.ODEBackend` if PyODE is
+installed). Stacked bodies, which come to rest, are also measured with and
+without sleeping (:class:`phys.Sleep`). The broadphase
+pairs and narrowphase tests of the last step are printed, to check that they
+scale with the number of bodies (and fall to nearly nothing once the pile is
+asleep). Run as::
+
+	python bench_phys.py [steps]
+'''
+
+import sys
+import random
+
+from vmath import Vector
+import phys
+import npphys
+import bench
+
+#: The numbers of bodies to measure.
+COUNTS=[100, 1000, 5000]
+
+def Backends():
+	backends=[('numpy', npphys.NumpyBackend)]
+	try:
+		import ode
+	except ImportError:
+		pass
+	else:
+		backends.append(('ode', phys.ODEBackend))
+	return backends
+
+def Pile(backend, n, sleep=None, settle=60):
+	env=phys.Environment(phys.STYPE.HASH, gravity=Vector(0, -9.8, 0), sim=phys.SIM.QUICK, backend=backend, sleep=sleep)
+	side=int((n/10.0)**0.5)+1
+	floor=phys.Box(env, Vector(4*side, 1, 4*side))
+	floor.pos=Vector(0, -0.5, 0)
+	rand=random.Random(1)
+	for i in xrange(n):
+		if i%4:
+			geom=phys.Sphere(env, 0.5)
+		else:
+			geom=phys.Box(env, Vector(1, 1, 1))
+		body=phys.Body(env, geom.BuildMass(1.0))
+		geom.Attach(body)
+		body.pos=Vector(rand.uniform(-side, side), rand.uniform(1, 10), rand.uniform(-side, side))
+	for i in xrange(settle):
+		env.Step()
+	return env
+
+def Stacks(backend, n, sleep=None, settle=300):
+	'''Like :func:`Pile`, but with the bodies stacked in neat columns, four high,
+so that they come to rest.'''
+	env=phys.Environment(phys.STYPE.HASH, gravity=Vector(0, -9.8, 0), sim=phys.SIM.QUICK, backend=backend, sleep=sleep)
+	side=int((n/4.0)**0.5)+1
+	floor=phys.Box(env, Vector(2*side, 1, 2*side))
+	floor.pos=Vector(0, -0.5, 0)
+	for i in xrange(n):
+		if i%4:
+			geom=phys.Sphere(env, 0.5)
+		else:
+			geom=phys.Box(env, Vector(1, 1, 1))
+		body=phys.Body(env, geom.BuildMass(1.0))
+		geom.Attach(body)
+		column, level=divmod(i, 4)
+		x, z=divmod(column, side)
+		body.pos=Vector(1.5*x-0.75*side, 0.55+1.05*level, 1.5*z-0.75*side)
+	for i in xrange(settle):
+		env.Step()
+	return env
+
+#: The scenes to measure, as ``(name, builder, sleep)``.
+SCENES=[('pile', Pile, None), ('stacks', Stacks, None), ('stacks+sleep', Stacks, phys.Sleep())]
+
+if __name__=='__main__':
+	steps=(int(sys.argv[1]) if len(sys.argv)>1 else 20)
+	results=[]
+	for n in COUNTS:
+		for name, backend in Backends():
+			for scene, build, sleep in SCENES:
+				label='%s %s (%d)'%(name, scene, n)
+				env=build(backend(), n, sleep)
+				results.append(bench.Measure(label, env.Step, steps))
+				print '%s: %d pairs, %d tests, %d contacts'%(label, env.pairs, env.tests, env.contacts)
+	bench.Report(results)
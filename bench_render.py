@@ -0,0 +1,142 @@
+'''Scenegraph rendering benchmarks.
+
+Every scene is rendered through a :class:`gl.RecordingBackend`, so no window or
+GL context is required, and the GL call counts are deterministic. Some scenes
+are also drawn through a :class:`pipeline.Pipeline`, both with and without its
+update phase on another thread, and (for comparison) directly. Each of these
+frames ends with a buffer swap, modeled by sleeping for :data:`SWAP` (which,
+like a real swap, releases the GIL); the threaded pipeline updates the next
+frame during it. Run as::
+
+	python bench_render.py [frames]
+'''
+
+import sys
+import time
+
+import pygame
+
+from vmath import Vector
+from gl import GL, RecordingBackend
+from scenegraph import *
+from layout import *
+from pipeline import Pipeline
+import bench
+
+pygame.init()
+
+WIDTH, HEIGHT=640, 480
+
+backend=RecordingBackend((0, 0, WIDTH, HEIGHT), record=False)
+GL.Use(backend)
+
+def NewScene():
+	cam=PerspectiveCamera(Vector(3, 3, 3), Vector(0, 0, 0), Vector(0, 1, 0), 75, float(WIDTH)/HEIGHT, 0.1, 100)
+	sc=Scene(cam)
+	sc.modifications.add(ModBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA))
+	sc.enable.add(GL.GL_DEPTH_TEST)
+	sc.enable.add(GL.GL_BLEND)
+	sc.disable.add(GL.GL_LIGHTING)
+	return sc
+
+def Quad(**kwargs):
+	return Mesh(Face(GL.GL_QUADS, Vertex(Vector(-1, -1, 0), Vector(1, 0, 0, 1), tex=Vector(0, 0)),
+								  Vertex(Vector(1, -1, 0), Vector(0, 1, 0, 1), tex=Vector(1, 0)),
+								  Vertex(Vector(1, 1, 0), Vector(0, 0, 1, 1), tex=Vector(1, 1)),
+								  Vertex(Vector(-1, 1, 0), Vector(1, 1, 1, 1), tex=Vector(0, 1))), **kwargs)
+
+def Deep(n=200):
+	sc=NewScene()
+	par=sc
+	for i in xrange(n):
+		par=Quad(parent=par, transform=PRSTransform(pos=Vector(0, 0, 0.01)))
+	return sc
+
+def Wide(n=1000, bounds=None):
+	sc=NewScene()
+	for i in xrange(n):
+		Quad(parent=sc, transform=PRSTransform(pos=Vector(i%32, i//32, 0)), bounds=bounds)
+	return sc
+
+def Textures(n=200):
+	sc=NewScene()
+	for i in xrange(n):
+		surf=pygame.Surface((16, 16), pygame.SRCALPHA)
+		surf.fill((i%256, 0, 0, 255))
+		Quad(parent=sc, texture=Texture(surf))
+	return sc
+
+def Labels(n=100):
+	sc=NewScene()
+	side=int(n**0.5)
+	con=Container(Grid(side, side), parent=sc)
+	for y in xrange(side):
+		for x in xrange(side):
+			Label(*con.grid.CellPair(x, y), text='Label %d'%(y*side+x,), bcol=Vector(0, 0, 0.5, 0.5), parent=con)
+	return sc
+
+def Widgets(n=400, batched=False):
+	'''A grid of ``n`` labels and sliders, in a (possibly batched) container.'''
+	sc=NewScene()
+	side=int(n**0.5)
+	con=Container(Grid(side, side), batched=batched, parent=sc)
+	font=pygame.font.SysFont(pygame.font.get_default_font(), 16)
+	for y in xrange(side):
+		for x in xrange(side):
+			i=y*side+x
+			if i%2:
+				Slider(*con.grid.CellPair(x, y), value=(i%10)/10.0, font=font, bcol=Vector(0, 0.5, 0.5, 0.5), parent=con)
+			else:
+				Label(*con.grid.CellPair(x, y), text='Label %d'%(i,), font=font, bcol=Vector(0, 0, 0.5, 0.5), parent=con)
+	return sc
+
+def BigMesh(n=10000, compile=False):
+	sc=NewScene()
+	verts=[Vertex(Vector(i%100, i//100, 0), Vector(1, 1, 1, 1), Vector(0, 0, 1)) for i in xrange(n-n%3)]
+	Mesh(Face(GL.GL_TRIANGLES, *verts), parent=sc, compile=compile)
+	return sc
+
+BENCHMARKS=[('deep (200)', Deep),
+			('wide (1000)', Wide),
+			('textures (200)', Textures),
+			('labels (100)', Labels),
+			('widgets (400)', Widgets),
+			('widgets (400, batched)', lambda: Widgets(batched=True)),
+			('bigmesh (10k)', BigMesh),
+			('bigmesh (10k, compiled)', lambda: BigMesh(compile=True))]
+
+#: The time, in seconds, a buffer swap is taken to wait for the display.
+SWAP=0.004
+
+def Swap():
+	time.sleep(SWAP)
+
+#: The scenes also drawn through a pipeline, as ``(name, builder)``.
+PIPELINED=[('deep (200)', Deep),
+		   ('wide (1000)', Wide),
+		   ('wide (1000, culled)', lambda: Wide(bounds=1.5))]
+
+def Frame(sc):
+	def frame():
+		with sc:
+			sc.Render()
+	return frame
+
+if __name__=='__main__':
+	frames=(int(sys.argv[1]) if len(sys.argv)>1 else 50)
+	results=[]
+	for name, build in BENCHMARKS:
+		results.append(bench.Measure(name, Frame(build()), frames, counter=backend))
+	for name, build in PIPELINED:
+		draw=Frame(build())
+		def direct():
+			draw()
+			Swap()
+		results.append(bench.Measure('%s, direct'%(name,), direct, frames, counter=backend))
+		for mode, threaded in (('pipeline', False), ('threaded', True)):
+			pipe=Pipeline(build(), threaded=threaded)
+			try:
+				results.append(bench.Measure('%s, %s'%(name, mode), lambda: pipe.Frame(Swap), frames, counter=backend))
+			finally:
+				pipe.Close()
+	bench.Report(results)
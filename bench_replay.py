@@ -0,0 +1,85 @@
+'''Input replay benchmark.
+
+Replays a recorded input session (see :mod:`replay`; record one with
+``python test_layout.py --record session.rec``) into a UI scene like that of
+``test_layout.py``, rendering every frame through a :class:`gl.RecordingBackend`,
+so that the results are comparable across commits. Without a log, a synthetic
+session (sweeping the mouse across the window, with a button held every other
+pass, and some typing) is used. The scene is measured as usual, with its
+:class:`layout.Container` retained (drawn from a texture except when changed),
+and through a :class:`layout.DamageRenderer` (redrawing only what changed).
+Run as::
+
+	python bench_replay.py [session.rec] [repeats]
+'''
+
+import sys
+import io
+
+import pygame
+
+from vmath import Vector
+from gl import GL, RecordingBackend
+from scenegraph import *
+from layout import *
+from event import MouseMoveEvent, MouseButtonEvent, KeyEvent, MOUSE, KBD
+from replay import Recorder, Replayer, Play
+import bench
+
+pygame.init()
+
+WIDTH, HEIGHT=640, 480
+
+backend=RecordingBackend((0, 0, WIDTH, HEIGHT), record=False)
+GL.Use(backend)
+
+def UIScene(retained=False):
+	cam=PerspectiveCamera(Vector(3, 3, 3), Vector(0, 0, 0), Vector(0, 1, 0), 75, float(WIDTH)/HEIGHT, 0.1, 100)
+	sc=Scene(cam)
+	con=Container(Grid(3, 2), retained=retained, parent=sc)
+	Label(*con.grid.CellPair(0, 0), text='Hello world!', fcol=Vector(1, 0, 0, 1), bcol=Vector(0.5, 0.5, 0, 0.5), parent=con)
+	Label(*con.grid.CellPair(1, 0), text='I\'m fine today', align=ALIGN.LEFT|ALIGN.TOP, parent=con)
+	Label(*con.grid.CellPair(1, 1), text='How are you?', align=ALIGN.FILLX, parent=con)
+	Slider(*con.grid.CellPair(0, 1), bcol=Vector(0, 0.5, 0.5, 0.5), parent=con)
+	return sc
+
+def Synthetic(frames=300, moves=8):
+	'''Returns a file object containing a synthetic session of ``frames`` frames.'''
+	f=io.BytesIO()
+	with Recorder(f) as rec:
+		for frame in xrange(frames):
+			held=(frame//60)%2
+			if frame%60==0:
+				rec.Record(MouseButtonEvent((MOUSE.BUTTONDOWN if held else MOUSE.BUTTONUP), Vector(0, 0), 0))
+			for i in xrange(moves):
+				x=((frame*moves+i)*3)%WIDTH
+				rec.Record(MouseMoveEvent(Vector(x, (x*HEIGHT)//WIDTH), Vector(3, 2), (held, 0, 0)))
+			if frame%30==0:
+				rec.Record(KeyEvent(KBD.KEYDOWN, key=pygame.K_a))
+				rec.Record(KeyEvent(KBD.CHAR, char=u'a'))
+				rec.Record(KeyEvent(KBD.KEYUP, key=pygame.K_a))
+			rec.NextFrame()
+	f.seek(0)
+	return f
+
+if __name__=='__main__':
+	args=sys.argv[1:]
+	log=(args.pop(0) if args and not args[0].isdigit() else Synthetic())
+	repeats=(int(args[0]) if args else 5)
+	replayer=Replayer(log)
+	results=[]
+	for name, retained, damage in (('replay', False, False), ('retained', True, False), ('damage', False, True)):
+		sc=UIScene(retained)
+		if damage:
+			renderer=DamageRenderer(sc)
+			play=lambda: Play(replayer, sc, step=lambda dt: renderer.Render(), render=False)
+		else:
+			play=lambda: Play(replayer, sc)
+		res=bench.Measure('%s (%d frames)'%(name, replayer.frames), play, repeats, counter=backend)
+		#Report per frame, rather than per replay
+		res.time/=replayer.frames
+		res.glcalls/=replayer.frames
+		if res.allocs is not None:
+			res.allocs/=replayer.frames
+		results.append(res)
+	bench.Report(results)
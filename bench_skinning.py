@@ -0,0 +1,95 @@
+'''Skeletal animation benchmark.
+
+Builds a tube of vertices around a chain of bones (each vertex influenced by the
+four nearest bones), plays a bending :class:`scenegraph.Animation` on it, and
+measures the cost of a frame of just skinning (:func:`scenegraph.AnimatedMesh.Skin`)
+and of rendering, with the upload to the vertex buffer, through a
+:class:`gl.RecordingBackend`. The number of vertices skinned per millisecond is
+printed for each. Run as::
+
+	python bench_skinning.py [frames]
+'''
+
+import sys
+
+import numpy
+
+from gl import GL, RecordingBackend
+from scenegraph import *
+import bench
+
+backend=RecordingBackend(record=False)
+GL.Use(backend)
+
+#: The numbers of vertices to measure.
+COUNTS=[1000, 10000, 100000]
+
+#: The number of bones in the chain.
+BONES=32
+
+#: The number of bones influencing each vertex.
+INFLUENCES=4
+
+#: The number of vertices around the tube.
+AROUND=16
+
+def Tube(n):
+	'''Returns an :class:`scenegraph.AnimatedMesh` of (about) ``n`` vertices.'''
+	rings=max(2, n//AROUND)
+	length=float(BONES)
+	angle=numpy.linspace(0, 2*numpy.pi, AROUND, endpoint=False)
+	x=numpy.repeat(numpy.linspace(0, length, rings), AROUND)
+	normals=numpy.zeros((rings*AROUND, 3))
+	normals[:, 1]=numpy.tile(numpy.cos(angle), rings)
+	normals[:, 2]=numpy.tile(numpy.sin(angle), rings)
+	positions=normals*0.5
+	positions[:, 0]=x
+	#Two triangles per quad between each ring and the next
+	ring=numpy.arange(rings-1)[:, None]*AROUND
+	step=numpy.arange(AROUND)[None, :]
+	a=(ring+step).ravel()
+	b=(ring+(step+1)%AROUND).ravel()
+	indices=numpy.column_stack([a, b, a+AROUND, b, b+AROUND, a+AROUND])
+	#The nearest bones, weighted by closeness
+	first=numpy.clip(numpy.floor(x).astype(int)-INFLUENCES//2+1, 0, BONES-INFLUENCES)
+	bones=first[:, None]+numpy.arange(INFLUENCES)
+	weights=1.0/(1.0+numpy.abs(x[:, None]-(bones+0.5)))**4
+	weights/=weights.sum(axis=1)[:, None]
+	bind=numpy.tile(numpy.eye(4), (BONES, 1, 1))
+	bind[:, 0, 3]=numpy.arange(BONES)
+	skeleton=Skeleton(numpy.arange(BONES)-1, bind)
+	#Every bone bends back and forth about z
+	times=numpy.linspace(0, 2, 9)
+	bend=0.1*numpy.sin(numpy.pi*times)
+	pos=numpy.zeros((len(times), BONES, 3))
+	pos[:, 1:, 0]=1
+	quat=numpy.zeros((len(times), BONES, 4))
+	quat[:, :, 0]=numpy.cos(bend/2)[:, None]
+	quat[:, :, 3]=numpy.sin(bend/2)[:, None]
+	return AnimatedMesh(positions, normals, indices, skeleton, bones, weights, animation=Animation(times, pos, quat))
+
+def Skinning(n):
+	mesh=Tube(n)
+	def frame():
+		mesh.time+=1/60.0
+		mesh.Skin()
+	return frame, len(mesh.bind)
+
+def Rendering(n):
+	mesh=Tube(n)
+	def frame():
+		mesh.time+=1/60.0
+		with mesh:
+			mesh.Render()
+	return frame, len(mesh.bind)
+
+if __name__=='__main__':
+	frames=(int(sys.argv[1]) if len(sys.argv)>1 else 20)
+	results=[]
+	for n in COUNTS:
+		for name, build in (('skin', Skinning), ('render', Rendering)):
+			frame, verts=build(n)
+			res=bench.Measure('%s (%d)'%(name, verts), frame, frames, counter=backend)
+			print '%s (%d): %.0f vertices/ms'%(name, verts, verts/(res.time*1000))
+			results.append(res)
+	bench.Report(results)
@@ -0,0 +1,74 @@
+'''Physics-to-scenegraph transform sync benchmark.
+
+Creates a number of bodies, each linked to a scene node, and measures the cost
+of updating every node's transform from its body once per frame, both one body
+at a time (:func:`phys.Body.Apply`) and batched (:func:`phys.Binding.Sync`).
+Neither case steps the simulation. Finally, the same bodies are simulated in a
+worker process (:class:`physproc.PhysicsProcess`), and the cost to the render
+loop of reading their poses from shared memory (:func:`physproc.Binding.Sync`)
+is measured while the worker steps them. Run as::
+
+	python bench_sync.py [frames]
+'''
+
+import sys
+import time
+
+from vmath import Vector
+from scenegraph import Renderable
+import phys
+import physproc
+import bench
+
+#: The numbers of bodies to measure.
+COUNTS=[1000, 10000]
+
+def Bodies(n):
+	env=phys.Environment()
+	bodies=[]
+	for i in xrange(n):
+		body=phys.Body(env)
+		body.pos=Vector(i%100, (i//100)%100, i//10000)
+		bodies.append(body)
+	env.alpha=0.5
+	return env, bodies, [Renderable() for i in xrange(n)]
+
+def PerBody(n):
+	env, bodies, nodes=Bodies(n)
+	pairs=zip(bodies, nodes)
+	def frame():
+		for body, node in pairs:
+			body.Apply(node.transform)
+	return frame
+
+def Batched(n):
+	env, bodies, nodes=Bodies(n)
+	binding=phys.Binding(env)
+	for body, node in zip(bodies, nodes):
+		binding.Link(body, node)
+	return binding.Sync
+
+def Process(n):
+	'''Returns a started :class:`physproc.PhysicsProcess` with ``n`` bodies, and a
+:class:`physproc.Binding` of them.'''
+	proc=physproc.PhysicsProcess(capacity=n, commands=n+16)
+	proc.Start()
+	binding=physproc.Binding(proc)
+	for i in xrange(n):
+		binding.Link(proc.AddSphere(0.5, Vector(i%100, (i//100)%100, i//10000)), Renderable())
+	while proc.Latest().count<n:
+		time.sleep(0.01)
+	return proc, binding
+
+if __name__=='__main__':
+	frames=(int(sys.argv[1]) if len(sys.argv)>1 else 20)
+	results=[]
+	for n in COUNTS:
+		results.append(bench.Measure('per-body (%d)'%(n,), PerBody(n), frames))
+		results.append(bench.Measure('batched (%d)'%(n,), Batched(n), frames))
+		proc, binding=Process(n)
+		try:
+			results.append(bench.Measure('process (%d)'%(n,), binding.Sync, frames))
+		finally:
+			proc.Stop()
+	bench.Report(results)
@@ -0,0 +1,67 @@
+'''
+.. mindscape -- Mindscape Engine
+engine -- Engine Setup
+======================
+
+This module contains the engine's initialization entry point, :func:`Init`,
+which should be called once, before anything else in the engine is imported,
+e.g.::
+
+	import engine
+	engine.Init(production=True)
+
+	from scenegraph import *
+
+This module deliberately imports nothing heavy, so that it may be imported (and
+:func:`Init` called) before PyOpenGL is.
+'''
+
+import sys
+
+import log
+from log import main, DV1, DV2, DV3, obCode
+logger=main.getChild('engine')
+
+#: Whether or not :func:`Init` set up production mode.
+production=False
+
+#: The PyOpenGL flags set by :func:`Init` in production mode.
+PRODUCTION_FLAGS={'ERROR_CHECKING': False, #No glGetError after every call
+				  'ERROR_LOGGING': False, #No logging wrapper around every call
+				  'CONTEXT_CHECKING': False, #No check for a current context on every call
+				  'ARRAY_SIZE_CHECKING': False, #No verification of array argument sizes
+				  'STORE_POINTERS': False} #Don't keep converted arrays alive after calls
+
+def Init(production=False, raw=None, logfile='log.txt', loglevel=DV3):
+	'''Initialize the engine.
+
+Logging is directed to ``logfile`` at ``loglevel`` (see :func:`log.Init`),
+unless ``logfile`` is ``None``.
+
+If ``production`` is true, PyOpenGL is configured (by setting the module flags
+in :data:`PRODUCTION_FLAGS`) to skip its per-call error checking, error logging,
+context checking and array conversion bookkeeping. These flags only take effect
+if they are set before ``OpenGL`` is first imported, so a warning is logged if
+it already has been.
+
+If ``raw`` is true (by default, it's the same as ``production``), the :data:`gl.GL`
+dispatch is given a :class:`gl.PyOpenGLBackend` that calls the hottest functions
+through their raw ``ctypes`` entry points (see :attr:`gl.PyOpenGLBackend.RAW`).
+
+.. warning::
+
+	In production mode, GL errors go unreported. Develop without it.'''
+	if logfile is not None:
+		log.Init(logfile, loglevel)
+	if raw is None:
+		raw=production
+	if production:
+		if 'OpenGL' in sys.modules:
+			logger.warning('OpenGL was imported before engine.Init(); production flags may not take effect')
+		import OpenGL
+		for flag, val in PRODUCTION_FLAGS.iteritems():
+			setattr(OpenGL, flag, val)
+	globals()['production']=production
+	from gl import GL, PyOpenGLBackend
+	GL.Use(PyOpenGLBackend(raw=raw))
+	logger.info('Engine initialized (production=%r, raw=%r)', production, raw)
@@ -7,9 +7,6 @@ This module defines events that may be used anywhere that an event-driven
 system is required.
 '''
 
-import pygame
-from pygame.locals import *
-
 from vmath import Vector
 from log import main, DV1, DV2, DV3, obCode
 logger=main.getChild('event')
@@ -20,6 +17,10 @@ class EVENT:
 	KBD=1
 	#: An event relating to the mouse (button press, release, mouse move, ...)
 	MOUSE=2
+	#: A timer fired (see :func:`scheduler.Scheduler.Post`). The subtype is chosen by whoever set the timer.
+	TIMER=3
+	#: Two physics geometries began or stopped touching (see :attr:`phys.Geometry.notify`).
+	CONTACT=4
 
 class KBD:
 	'''An enumeration containing event subtypes for the :attr:`EVENT.KBD` event.'''
@@ -81,53 +82,294 @@ class MOUSE:
 	#:    attribute.
 	MOVE=4
 
-class Event(object):
+class CONTACT:
+	'''An enumeration containing event subtypes for the :attr:`EVENT.CONTACT` event.'''
+	#: The geometries began touching this step.
+	BEGIN=1
+	#: The geometries stopped touching this step.
+	END=2
+
+class BaseEvent(object):
+	'''The base class of all events. It holds only the fields common to every
+event, in ``__slots__``: :attr:`type` and :attr:`subtype`. The typed event
+classes (:class:`KeyEvent`, :class:`MouseMoveEvent`, :class:`MouseButtonEvent`,
+and :class:`WheelEvent`) add their own fields as slots too, so they carry no
+per-instance ``__dict__``; :class:`Event` may be given arbitrary attributes.'''
+	__slots__=('type', 'subtype')
+	def Fields(self):
+		'''Returns a list of ``(name, value)`` pairs for every field set on this event.'''
+		fields=[]
+		for cls in reversed(type(self).__mro__):
+			for name in cls.__dict__.get('__slots__', ()):
+				if hasattr(self, name):
+					fields.append((name, getattr(self, name)))
+		fields.extend(sorted(getattr(self, '__dict__', {}).items()))
+		return fields
+	def __repr__(self):
+		return '<'+' '.join([type(self).__name__]+['='.join((k, repr(v))) for k, v in self.Fields()])+'>'
+
+class Event(BaseEvent):
 	'''An :class:`Event` contains all of the information needed to pass an
 event to a system which uses events.
 
 Events may be given arbitrary attributes from the keyword arguments passed to
 the constructor. A later ``type=...`` in the keyword arguments will override
-the specified event type given as a positional parameter, if one is provided.'''
+the specified event type given as a positional parameter, if one is provided.
+The ``subtype`` defaults to ``None``.
+
+.. note::
+
+	The engine itself generates the typed (and cheaper) subclasses of
+	:class:`BaseEvent`; this class is for application-defined events.'''
 	def __init__(self, type, **kwargs):
 		#: The event type (one of the :class:`EVENT` values). Other attributes depend on the event.
 		self.type=type
+		#: The event subtype (e.g., one of the :class:`KBD` values), if any.
+		self.subtype=None
 		for k, v in kwargs.iteritems():
 			setattr(self, k , v)
 	@classmethod
-	def FromPygame(cls, ev):
+	def FromPygame(cls, ev, height=None, pool=False):
+		'''Generates the events corresponding to the ``pygame`` event ``ev``,
+as instances of the typed :class:`BaseEvent` subclasses.
+
+Mouse positions are flipped to have their origin at the bottom of the window,
+which is ``height`` pixels tall; if not given, the height of the display surface
+is queried (per event). See :class:`EventQueue`, which avoids this. If ``pool``
+is true, :class:`MouseMoveEvent`\ s are taken from the pool (see
+:func:`MouseMoveEvent.Acquire`).'''
+		import pygame
 ##		print 'Processing event:', ev
-		if ev.type==KEYDOWN:
-			yield cls(EVENT.KBD, subtype=KBD.KEYDOWN, key=ev.key)
-			if ev.unicode:
-				yield cls(EVENT.KBD, subtype=KBD.CHAR, char=ev.unicode)
-		elif ev.type==KEYUP:
-			yield cls(EVENT.KBD, subtype=KBD.KEYUP, key=ev.key)
-		elif ev.type==MOUSEMOTION:
+		if height is None and ev.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
 			height=pygame.display.get_surface().get_height()
-			yield cls(EVENT.MOUSE, subtype=MOUSE.MOVE, pos=Vector(ev.pos[0], height-ev.pos[1]), rel=Vector(ev.rel[0], -ev.rel[1]), buttons=ev.buttons)
-		elif ev.type==MOUSEBUTTONDOWN:
+		if ev.type==pygame.KEYDOWN:
+			yield KeyEvent(KBD.KEYDOWN, key=ev.key)
+			if ev.unicode:
+				yield KeyEvent(KBD.CHAR, char=ev.unicode)
+		elif ev.type==pygame.KEYUP:
+			yield KeyEvent(KBD.KEYUP, key=ev.key)
+		elif ev.type==pygame.MOUSEMOTION:
+			pos, rel=ev.pos, ev.rel
+			if pool:
+				yield MouseMoveEvent.Acquire(pos[0], height-pos[1], rel[0], -rel[1], ev.buttons)
+			else:
+				yield MouseMoveEvent(Vector(pos[0], height-pos[1]), Vector(rel[0], -rel[1]), ev.buttons)
+		elif ev.type==pygame.MOUSEBUTTONDOWN:
 			pygame.event.set_grab(True)
-			height=pygame.display.get_surface().get_height()
-			yield cls(EVENT.MOUSE, subtype=MOUSE.BUTTONDOWN, pos=Vector(ev.pos[0], height-ev.pos[1]), button=ev.button-1)
-		elif ev.type==MOUSEBUTTONUP:
+			yield MouseButtonEvent(MOUSE.BUTTONDOWN, Vector(ev.pos[0], height-ev.pos[1]), ev.button-1)
+		elif ev.type==pygame.MOUSEBUTTONUP:
 			pygame.event.set_grab(False)
-			height=pygame.display.get_surface().get_height()
-			yield cls(EVENT.MOUSE, subtype=MOUSE.BUTTONUP, pos=Vector(ev.pos[0], height-ev.pos[1]), button=ev.button-1)
-	def __repr__(self):
-		return '<Event '+' '.join(['='.join((k, repr(v))) for k, v in self.__dict__.iteritems()])+'>'
+			yield MouseButtonEvent(MOUSE.BUTTONUP, Vector(ev.pos[0], height-ev.pos[1]), ev.button-1)
+		elif ev.type==getattr(pygame, 'MOUSEWHEEL', None):
+			if height is None:
+				height=pygame.display.get_surface().get_height()
+			x, y=pygame.mouse.get_pos()
+			yield WheelEvent(Vector(x, height-y), Vector(ev.x, ev.y))
+
+class KeyEvent(BaseEvent):
+	'''An :attr:`EVENT.KBD` event. ``key`` is set for :attr:`KBD.KEYDOWN` and
+:attr:`KBD.KEYUP`, and ``char`` for :attr:`KBD.CHAR`; the other is ``None``.'''
+	__slots__=('key', 'char')
+	def __init__(self, subtype, key=None, char=None):
+		self.type=EVENT.KBD
+		self.subtype=subtype
+		#: The ``pygame`` key code.
+		self.key=key
+		#: The (unicode) character typed.
+		self.char=char
+
+class MouseEvent(BaseEvent):
+	'''The base class of :attr:`EVENT.MOUSE` events, all of which have a ``pos``
+(a 2D :class:`vmath.Vector` in window coordinates, with the origin at the
+bottom left--but see :class:`layout.Container`, which makes it relative).'''
+	__slots__=('pos',)
+
+class MouseMoveEvent(MouseEvent):
+	'''A :attr:`MOUSE.MOVE` event, with ``rel`` (a 2D :class:`vmath.Vector` of
+the movement) and ``buttons`` (a tuple of button states).
+
+Mouse movements are by far the most frequent event, so a pool of them is kept:
+:func:`Acquire` reuses a released instance (and its :class:`vmath.Vector`\ s) if
+one is available, and :func:`Release` returns one to the pool. Only instances
+from :func:`Acquire` are :attr:`pooled`; others (and their vectors) belong to
+whoever made them, and are never changed or released. Handlers must not keep
+references to (or the ``pos``/``rel`` of) pooled events after handling them;
+copy what you need.'''
+	__slots__=('rel', 'buttons', 'pooled')
+	#: The pool of released events (class attr).
+	POOL=[]
+	#: The largest number of events kept in the pool (class attr); enough for a
+	#: frame's worth of movements from a high-rate mouse, if they aren't coalesced.
+	POOL_SIZE=1024
+	#: The number of instances ever constructed (class attr); :func:`Acquire`
+	#: doesn't add to it when it reuses one.
+	ALLOCATED=0
+	def __init__(self, pos, rel, buttons):
+		MouseMoveEvent.ALLOCATED+=1
+		self.type=EVENT.MOUSE
+		self.subtype=MOUSE.MOVE
+		self.pos=pos
+		self.rel=rel
+		self.buttons=buttons
+		#: Whether or not this instance (and its vectors) came from :func:`Acquire`.
+		self.pooled=False
+	@classmethod
+	def Acquire(cls, x, y, dx, dy, buttons):
+		'''Returns a :class:`MouseMoveEvent` at ``(x, y)`` moved by ``(dx, dy)``,
+reusing a pooled instance if possible.'''
+		if cls.POOL:
+			ev=cls.POOL.pop()
+			pos, rel=ev.pos, ev.rel
+			pos[0]=x
+			pos[1]=y
+			rel[0]=dx
+			rel[1]=dy
+			ev.buttons=buttons
+			return ev
+		ev=cls(Vector(x, y), Vector(dx, dy), buttons)
+		ev.pooled=True
+		return ev
+	def Release(self):
+		'''Return this event to the pool, if it is :attr:`pooled`.'''
+		if self.pooled and len(self.POOL)<self.POOL_SIZE:
+			self.POOL.append(self)
+
+class MouseButtonEvent(MouseEvent):
+	'''A :attr:`MOUSE.BUTTONDOWN` or :attr:`MOUSE.BUTTONUP` event, with a
+(zero-based) ``button``.'''
+	__slots__=('button',)
+	def __init__(self, subtype, pos, button):
+		self.type=EVENT.MOUSE
+		self.subtype=subtype
+		self.pos=pos
+		self.button=button
+
+class WheelEvent(MouseEvent):
+	'''A :attr:`MOUSE.WHEEL` event, with a ``delta`` (a 2D :class:`vmath.Vector`
+of the scroll amount on each axis). This is only generated if the version of
+``pygame`` in use reports wheel events separately from buttons.'''
+	__slots__=('delta',)
+	def __init__(self, pos, delta):
+		self.type=EVENT.MOUSE
+		self.subtype=MOUSE.WHEEL
+		self.pos=pos
+		self.delta=delta
+
+class TimerEvent(BaseEvent):
+	'''An :attr:`EVENT.TIMER` event, posted by a :class:`scheduler.Scheduler`.
+``count`` is the number of times the timer has fired (including this one), and
+``time`` is the scheduler time at which it fired.'''
+	__slots__=('count', 'time')
+	def __init__(self, subtype, count, time):
+		self.type=EVENT.TIMER
+		self.subtype=subtype
+		self.count=count
+		self.time=time
+
+class ContactEvent(BaseEvent):
+	'''An :attr:`EVENT.CONTACT` event, posted by a :class:`phys.Environment`.
+``a`` and ``b`` are the :class:`phys.Geometry` objects involved, ``point`` and
+``normal`` (3D :class:`vmath.Vector`\ s) are the point and normal of (one of)
+their contacts, and ``depth`` is the penetration depth. For :attr:`CONTACT.END`,
+these are as of the last step the geometries touched, but ``depth`` is zero.
+(The point isn't named ``pos``, as that would make a :class:`layout.Container`
+route the event by screen position.)'''
+	__slots__=('a', 'b', 'point', 'normal', 'depth')
+	def __init__(self, subtype, a, b, point, normal, depth):
+		self.type=EVENT.CONTACT
+		self.subtype=subtype
+		self.a=a
+		self.b=b
+		self.point=point
+		self.normal=normal
+		self.depth=depth
 
 class EventHandler(object):
+	'''An :class:`EventHandler` is anything that can receive :class:`Event`\ s.
+
+Handlers only receive the events they have subscribed to (see :func:`Subscribe`),
+identified by ``(type, subtype)`` pairs, where a ``subtype`` of ``None`` matches
+any subtype of that type, and a ``type`` of ``None`` matches everything. Each
+handler also keeps :attr:`listening`, a summary of the subscriptions of itself
+and everything below it (for handlers that have a ``parent`` attribute, such as
+:class:`scenegraph.Renderable`), so that :func:`Trigger` can skip whole subtrees
+in which nothing is listening. The cost of an event is thereby proportional to
+the number of interested handlers, rather than the size of the scene.
+
+The initial subscriptions are taken from :attr:`INTERESTS`.'''
+	#: A list of ``(type, subtype)`` pairs subscribed to on construction (class attr).
+	#: If ``None`` (the default), a class which overrides :func:`Handle` subscribes
+	#: to everything, and any other subscribes to nothing.
+	INTERESTS=None
+	def __init__(self):
+		#: The ``set`` of ``(type, subtype)`` pairs this handler is subscribed to.
+		self.interests=set()
+		#: A ``dict`` mapping ``(type, subtype)`` pairs to the number of
+		#: subscriptions to them by this handler and its descendants.
+		self.listening={}
+		interests=self.INTERESTS
+		if interests is None:
+			handle=type(self).Handle
+			if getattr(handle, '__func__', handle) is not _BaseHandle:
+				interests=[(None, None)]
+			else:
+				interests=()
+		for key in interests:
+			self.Subscribe(*key)
+	def Subscribe(self, type=None, subtype=None):
+		'''Receive events of the given ``type`` and ``subtype`` (either of which may be ``None``; see above).'''
+		key=(type, subtype)
+		if key not in self.interests:
+			self.interests.add(key)
+			self.UpdateListening({key: 1}, 1)
+	def Unsubscribe(self, type=None, subtype=None):
+		'''Stop receiving events of the given ``type`` and ``subtype`` (as given to :func:`Subscribe`).'''
+		key=(type, subtype)
+		if key in self.interests:
+			self.interests.discard(key)
+			self.UpdateListening({key: 1}, -1)
+	def UpdateListening(self, counts, sign):
+		'''Add (if ``sign`` is 1) or remove (if -1) the subscription ``counts``
+(a ``dict`` like :attr:`listening`) to this handler's :attr:`listening`, and to
+that of all of its ancestors.'''
+		node=self
+		while node is not None:
+			listening=node.listening
+			for key, n in counts.iteritems():
+				n=listening.get(key, 0)+sign*n
+				if n>0:
+					listening[key]=n
+				else:
+					listening.pop(key, None)
+			node=getattr(node, 'parent', None)
+	@staticmethod
+	def _Matches(keys, ev):
+		if not keys:
+			return False
+		t=ev.type
+		return (t, getattr(ev, 'subtype', None)) in keys or (t, None) in keys or (None, None) in keys
+	def Wants(self, ev):
+		'''Returns true if this handler, or any handler below it, is subscribed to ``ev``.'''
+		return self._Matches(self.listening, ev)
+	def Listens(self, ev):
+		'''Returns true if this handler itself is subscribed to ``ev``.'''
+		return self._Matches(self.interests, ev)
 	def Trigger(self, ev):
 		'''Trigger an :class:`Event`.
 
 .. note::
 
 	Triggering an :class:`Event` is not the same as handling an event; triggering
-	will inevitably cause handling by this object, and may cause handling
-	by children (based on the propagation policy--how the subclass defines
-	:func:`TriggerChildren`. Handling the :class:`Event` is done by :func:`Handle`,
-	which actually causes the :class:`EventHandler` to process the event.'''
-		self.Handle(ev)
+	will inevitably cause handling by this object (if it is subscribed to the
+	event), and may cause handling by children (based on the propagation
+	policy--how the subclass defines :func:`TriggerChildren`. Handling the
+	:class:`Event` is done by :func:`Handle`, which actually causes the
+	:class:`EventHandler` to process the event. If nothing at or below this
+	handler is subscribed to the event, this does nothing at all.'''
+		if not self.Wants(ev):
+			return
+		if self.Listens(ev):
+			self.Handle(ev)
 		self.TriggerChildren(ev)
 	def Handle(self, ev):
 		'''Handle an :class:`Event`. By default, this does nothing.
@@ -146,4 +388,124 @@ they have some kind of propagation policy; otherwise, it may be left derived
 	Since :class:`scenegraph.Renderable` is a direct subclass of this, and has
 	children, it's a fair expectation that it has implemented the propagation
 	policy.'''
-		pass
\ No newline at end of file
+		pass
+
+_BaseHandle=EventHandler.__dict__['Handle']
+
+class EventQueue(object):
+	'''An :class:`EventQueue` collects the engine :class:`Event`\ s for a frame
+and dispatches them as a batch. A main loop using one looks like::
+
+	events=EventQueue()
+	while not events.quit:
+		events.Pump()
+		events.Dispatch(scene)
+		...
+
+:func:`Pump` drains ``pygame``'s queue in one call, translating the events with
+:func:`Event.FromPygame`. The window height needed for that translation is
+cached until the window is resized. If :attr:`coalesce` is true (the default),
+consecutive :attr:`MOUSE.MOVE` events with the same ``buttons`` are merged into
+one, whose ``pos`` is the latest position and whose ``rel`` is the sum of the
+movements, so a high-rate mouse costs one dispatch per frame rather than
+hundreds. If :attr:`pool` is true, mouse movements are pooled (see
+:class:`MouseMoveEvent`), so that they cost no allocations at all.
+
+If a :attr:`recorder` is set, every batch is recorded (see :mod:`replay`)
+before it is dispatched.'''
+	def __init__(self, coalesce=True, pool=False):
+		#: Whether or not to merge consecutive mouse movements.
+		self.coalesce=coalesce
+		#: Whether or not to use (and recycle) pooled :class:`MouseMoveEvent`\ s.
+		self.pool=pool
+		#: A list of :class:`Event`\ s waiting for the next :func:`Dispatch`.
+		self.pending=[]
+		#: Set to ``True`` once a ``pygame.QUIT`` event has been seen.
+		self.quit=False
+		#: The cached window height, or ``None`` if it must be queried.
+		self.height=None
+		#: The number of ``pygame`` events received.
+		self.received=0
+		#: The number of :class:`Event`\ s queued (after translation, before coalescing).
+		self.queued=0
+		#: The number of :class:`Event`\ s merged into a previous one.
+		self.coalesced=0
+		#: The number of :class:`Event`\ s dispatched.
+		self.dispatched=0
+		#: The number of calls to :func:`Dispatch`.
+		self.batches=0
+		#: A :class:`replay.Recorder` to which each dispatched batch is written, or ``None``.
+		self.recorder=None
+	def Height(self):
+		'''Returns the (cached) height of the display surface.'''
+		if self.height is None:
+			import pygame
+			self.height=pygame.display.get_surface().get_height()
+		return self.height
+	def Pump(self):
+		'''Move all events from ``pygame``'s queue into :attr:`pending`.'''
+		import pygame
+		from pygame.locals import QUIT, VIDEORESIZE, MOUSEMOTION, MOUSEBUTTONDOWN, MOUSEBUTTONUP
+		mousetypes=(MOUSEMOTION, MOUSEBUTTONDOWN, MOUSEBUTTONUP)
+		evs=pygame.event.get()
+		self.received+=len(evs)
+		for ev in evs:
+			if ev.type==QUIT:
+				self.quit=True
+			elif ev.type==VIDEORESIZE:
+				self.height=None
+			else:
+				height=(self.Height() if ev.type in mousetypes else None)
+				for e in Event.FromPygame(ev, height, self.pool):
+					self.Put(e)
+	def Put(self, ev):
+		'''Queue an :class:`Event` (from any source) for the next :func:`Dispatch`,
+coalescing it if possible.'''
+		self.queued+=1
+		if self.coalesce and ev.type==EVENT.MOUSE and ev.subtype==MOUSE.MOVE and self.pending:
+			last=self.pending[-1]
+			if last.type==EVENT.MOUSE and last.subtype==MOUSE.MOVE and last.buttons==ev.buttons:
+				#(Only pooled events' vectors may be changed in place)
+				if getattr(last, 'pooled', False):
+					pos, rel, lrel=ev.pos, ev.rel, last.rel
+					last.pos[0]=pos[0]
+					last.pos[1]=pos[1]
+					lrel[0]+=rel[0]
+					lrel[1]+=rel[1]
+					if getattr(ev, 'pooled', False):
+						ev.Release()
+				else:
+					last.pos=ev.pos
+					last.rel=last.rel+ev.rel
+				self.coalesced+=1
+				return
+		self.pending.append(ev)
+	def Dispatch(self, target):
+		'''Trigger every pending :class:`Event` on ``target`` (usually a
+:class:`scenegraph.Scene`), in order, and empty the queue. Returns the list of
+events dispatched.
+
+.. note::
+
+	If :attr:`pool` is set, the pooled :class:`MouseMoveEvent`\ s are released back
+	to the pool afterward, and so must not be used after this returns.'''
+		batch=self.pending
+		self.pending=[]
+		recorder=self.recorder
+		if recorder is not None:
+			for ev in batch:
+				recorder.Record(ev)
+			recorder.NextFrame()
+		for ev in batch:
+			target.Trigger(ev)
+		if self.pool:
+			for ev in batch:
+				if type(ev) is MouseMoveEvent and ev.pooled:
+					ev.Release()
+		self.dispatched+=len(batch)
+		self.batches+=1
+		return batch
+	def Stats(self):
+		'''Returns a ``dict`` of the counters kept by this queue.'''
+		return {'received': self.received, 'queued': self.queued, 'coalesced': self.coalesced,
+				'dispatched': self.dispatched, 'batches': self.batches}
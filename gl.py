@@ -0,0 +1,230 @@
+'''
+.. mindscape -- Mindscape Engine
+gl -- GL Dispatch
+=================
+
+This module provides a pluggable dispatch layer between the engine and the GL.
+Rather than importing PyOpenGL directly, the engine modules call through the
+:data:`GL` object, e.g.::
+
+	GL.glBegin(GL.GL_QUADS)
+
+:data:`GL` resolves names (functions and constants alike) against the current
+:class:`Backend` the first time they are used, and caches them as plain
+attributes, so the cost of a call is that of an instance attribute lookup. The
+backend may be replaced at any time with :func:`Dispatch.Use`:
+
+* :class:`PyOpenGLBackend` (the default) calls PyOpenGL, and needs a context.
+  Optionally, it calls the hottest functions through their raw entry points.
+* :class:`CountingBackend` wraps another backend and counts the calls made.
+* :class:`RecordingBackend` needs no context at all; it logs the calls and
+  their arguments, and returns plausible values for the few calls the engine
+  reads results from (``glGenTextures``, ``glGetIntegerv(GL_VIEWPORT)``, ...).
+  This is what allows rendering to be benchmarked deterministically.
+'''
+
+from log import main, DV1, DV2, DV3, obCode
+logger=main.getChild('gl')
+
+class Backend(object):
+	'''The base class of all GL backends. A backend need only implement :func:`Resolve`.'''
+	def Resolve(self, name):
+		'''Return the function or constant called ``name`` (as named in PyOpenGL).
+
+.. note::
+
+	This must be defined by a subclass.'''
+		raise NotImplementedError('Backend must define .Resolve()')
+
+class PyOpenGLBackend(Backend):
+	'''A :class:`Backend` that resolves names from ``OpenGL.GL`` (or ``OpenGL.GLU``,
+for names beginning with ``glu`` or ``GLU_``). This requires a current context for
+any of the functions to work. PyOpenGL is not imported until the first name is
+resolved.
+
+If ``raw`` is true, the functions named in :attr:`RAW` are instead resolved from
+PyOpenGL's raw (``ctypes``) entry points, bypassing any Python-level wrapper.
+These accept only scalar arguments of the right type, which is what the engine
+passes them. See :func:`engine.Init` for the rest of "production mode".'''
+	#: The names of the (hot) functions resolved raw when ``raw`` is set.
+	RAW=set(['glBegin', 'glEnd', 'glVertex2d', 'glVertex3d', 'glVertex4d', 'glVertex4f',
+			 'glColor4d', 'glTexCoord2d', 'glTexCoord3d', 'glNormal3d',
+			 'glTranslated', 'glRotated', 'glScaled', 'glPushMatrix', 'glPopMatrix',
+			 'glMatrixMode', 'glLoadIdentity', 'glEnable', 'glDisable',
+			 'glPushAttrib', 'glPopAttrib', 'glBindTexture', 'glCallList', 'glViewport'])
+	def __init__(self, raw=False):
+		#: Whether or not to resolve :attr:`RAW` functions from the raw entry points.
+		self.raw=raw
+		self.gl=None
+		self.glu=None
+		self.rawmods=[]
+	def Load(self):
+		'''Import PyOpenGL (this is done automatically on the first :func:`Resolve`).'''
+		from OpenGL import GL, GLU
+		self.gl=GL
+		self.glu=GLU
+		if self.raw:
+			try:
+				from OpenGL.raw.GL.VERSION import GL_1_0, GL_1_1
+				self.rawmods=[GL_1_0, GL_1_1]
+			except ImportError:
+				import OpenGL.raw.GL
+				self.rawmods=[OpenGL.raw.GL]
+	def Resolve(self, name):
+		if self.gl is None:
+			self.Load()
+		if name.startswith('glu') or name.startswith('GLU_'):
+			return getattr(self.glu, name)
+		if name in self.RAW:
+			for mod in self.rawmods:
+				func=getattr(mod, name, None)
+				if func is not None:
+					return func
+		return getattr(self.gl, name)
+
+class CountingBackend(Backend):
+	'''A :class:`Backend` that wraps another backend (``backend``), counting the
+total number of calls made (in :attr:`calls`) and the calls made to each
+function (in :attr:`counts`). Constants are passed through unchanged.'''
+	def __init__(self, backend):
+		#: The wrapped :class:`Backend`.
+		self.backend=backend
+		#: The total number of calls made.
+		self.calls=0
+		#: A ``dict`` mapping function names to the number of calls made to them.
+		self.counts={}
+	def Resolve(self, name):
+		val=self.backend.Resolve(name)
+		if not callable(val) or not name.startswith('gl'):
+			return val
+		counts=self.counts
+		counts.setdefault(name, 0)
+		def counted(*args, **kwargs):
+			self.calls+=1
+			counts[name]+=1
+			return val(*args, **kwargs)
+		counted.__name__=name
+		return counted
+	def Reset(self):
+		'''Reset all counters to zero.'''
+		self.calls=0
+		for name in self.counts:
+			self.counts[name]=0
+
+class RecordingBackend(Backend):
+	'''A :class:`Backend` that requires no context. Every call is appended to
+:attr:`log` as a ``(name, args)`` tuple (unless ``record`` is false, in which
+case only :attr:`calls` is kept).
+
+Constants are taken from PyOpenGL if it is importable; otherwise, each constant
+is given a distinct (but arbitrary) integer value, so that the engine can still
+run without PyOpenGL installed.
+
+The backend keeps track of just enough state to answer the queries the engine
+makes: the viewport (``glViewport``, and ``glPushAttrib``/``glPopAttrib`` of
+``GL_VIEWPORT_BIT``) and object names (``glGenTextures``, ``glGenLists``, ...).'''
+	#: Functions whose result is a (list of) newly generated object name(s).
+	GENERATORS=set(['glGenTextures', 'glGenBuffers', 'glGenFramebuffers', 'glGenRenderbuffers'])
+	def __init__(self, viewport=(0, 0, 640, 480), record=True):
+		#: A list of ``(name, args)`` tuples.
+		self.log=[]
+		#: Whether or not to append to :attr:`log`.
+		self.record=record
+		#: The total number of calls made.
+		self.calls=0
+		#: The current viewport, as ``[x, y, width, height]``.
+		self.viewport=list(viewport)
+		self._attribs=[]
+		self._next=1
+		try:
+			from OpenGL import GL, GLU
+			self._consts=(GL, GLU)
+		except ImportError:
+			self._consts=()
+		self._fake={}
+		self._special={'glGenLists': self._GenLists,
+					   'glGetIntegerv': self._GetIntegerv,
+					   'glViewport': self._Viewport,
+					   'glPushAttrib': self._PushAttrib,
+					   'glPopAttrib': self._PopAttrib,
+					   'gluProject': self._Project,
+					   'glGetError': lambda: 0}
+	def Clear(self):
+		'''Empty the :attr:`log` and reset :attr:`calls`.'''
+		del self.log[:]
+		self.calls=0
+	def Constant(self, name):
+		'''Return the value of the constant ``name``.'''
+		for mod in self._consts:
+			val=getattr(mod, name, None)
+			if val is not None:
+				return val
+		val=self._fake.get(name)
+		if val is None:
+			val=self._fake[name]=1<<len(self._fake)
+		return val
+	def Resolve(self, name):
+		if not name.startswith('gl'):
+			return self.Constant(name)
+		special=self._special.get(name)
+		if name in self.GENERATORS:
+			special=self._Gen
+		def recorded(*args, **kwargs):
+			self.calls+=1
+			if self.record:
+				self.log.append((name, args))
+			if special is not None:
+				return special(*args, **kwargs)
+		recorded.__name__=name
+		return recorded
+	def _Gen(self, n, *args):
+		names=range(self._next, self._next+n)
+		self._next+=n
+		return (names[0] if n==1 else names)
+	def _GenLists(self, n):
+		base=self._next
+		self._next+=n
+		return base
+	def _GetIntegerv(self, pname, *args):
+		if pname==self.Constant('GL_VIEWPORT'):
+			return list(self.viewport)
+		return [0]
+	def _Viewport(self, x, y, w, h):
+		self.viewport=[x, y, w, h]
+	def _PushAttrib(self, mask):
+		self._attribs.append(list(self.viewport))
+	def _PopAttrib(self):
+		if self._attribs:
+			self.viewport=self._attribs.pop()
+	def _Project(self, *args, **kwargs):
+		return 0.0, 0.0, 0.0
+
+class Dispatch(object):
+	'''The :class:`Dispatch` object forwards attribute lookups to the current
+:class:`Backend`, caching them on itself; see the module documentation. Only one
+(:data:`GL`) should ever be needed. If no backend has been set when the first
+name is resolved, a :class:`PyOpenGLBackend` is used.'''
+	def __init__(self, backend=None):
+		self.__dict__['backend']=backend
+	def Use(self, backend):
+		'''Set the current :class:`Backend`, dropping all cached names. Returns the
+previous backend (which may be ``None``).'''
+		old=self.__dict__['backend']
+		self.__dict__.clear()
+		self.__dict__['backend']=backend
+		logger.debug('GL backend is now %s', type(backend).__name__)
+		return old
+	def Current(self):
+		'''Returns the current :class:`Backend`, creating the default one if needed.'''
+		if self.__dict__['backend'] is None:
+			self.Use(PyOpenGLBackend())
+		return self.__dict__['backend']
+	def __getattr__(self, name):
+		if name.startswith('_'):
+			raise AttributeError(name)
+		val=self.Current().Resolve(name)
+		self.__dict__[name]=val
+		return val
+
+#: The global :class:`Dispatch` through which all engine GL calls are made.
+GL=Dispatch()
@@ -7,16 +7,27 @@ This module provides an interface to a simple layout manager which is entirely
 compatible with the scenegraph (provided that it is rendered after 3D geometry
 and with the depth test turned off). The layout manager is a *tiling* manager,
 which means that it deals with :class:`Grid`\ s.
+
+A :class:`Container` may draw its widgets in batches (see :class:`WidgetBatch`),
+with their text in a shared :class:`TextAtlas`, rather than one by one.
+
+Changes to widgets are tracked as window rectangles (see :class:`Damage`), so
+that a :class:`DamageRenderer` can redraw just the parts of the window that
+changed.
 '''
 
-import pygame
-from pygame.locals import *
-from OpenGL.GL import *
+import threading
+from bisect import bisect_right
 
 from vmath import Vector
-from scenegraph import Renderable, Texture
+from gl import GL
+from scenegraph import Renderable, Texture, ModTexWrap, FrameBuffer
 from event import EVENT, KBD, MOUSE
 from log import main, DV1, DV2, DV3, obCode
+import numpy
+
+import prof
+import scheduler
 logger=main.getChild('layout')
 
 class LayoutCell(object):
@@ -24,16 +35,105 @@ class LayoutCell(object):
 particular, once computations have been undergone by the manager holding (a set)
 of these cells, the :attr:`offset` and :attr:`size` attributes should represent
 the (window coordinate) space that this cell takes up, on one dimension. (Two
-cells are needed for two dimensions.)'''
-	def __init__(self, weight=1.0, fixed=0):
-		#: A floating point number indicating how much space this cell should be given relative to other cells in the same layout.
-		self.weight=weight
-		#: A numeric amount of fixed space this cell must contain (measured in the window coordinate system).
-		self.fixed=fixed
+cells are needed for two dimensions.)
+
+A cell is given its :attr:`fixed` space, and a share of whatever is left over
+in proportion to its :attr:`weight`, but never less than :attr:`min` or more
+than :attr:`max` (the space a cell can't take is shared among the others).
+If :attr:`auto` is set, the cell is also made big enough for the intrinsic
+size of the :class:`Widget`\ s in it (see :func:`Widget.Measure`), which the
+:class:`Container` holding them stores in :attr:`content`.
+
+Changing any of these invalidates the layouts of the
+:class:`LayoutVector`\ s holding the cell, so that they are recomputed.'''
+	def __init__(self, weight=1.0, fixed=0, min=None, max=None, auto=False):
+		#: The :class:`LayoutVector`\ s this cell is in.
+		self.vectors=[]
+		self._weight=weight
+		self._fixed=fixed
+		self._min=min
+		self._max=max
+		self._auto=auto
+		self._content=0
 		#: The offset from the origin on the dimension specifying this cell (-1 if not computed or not in a layout).
 		self.offset=-1
 		#: The size of this cell on this dimension (-1 if not computed or not in a layout).
 		self.size=-1
+	def Invalidate(self):
+		'''Invalidate the layouts of the :class:`LayoutVector`\ s holding this cell.'''
+		for vec in self.vectors:
+			vec.Invalidate()
+	def _get_weight(self):
+		return self._weight
+	def _set_weight(self, weight):
+		self._weight=weight
+		self.Invalidate()
+	#: A floating point number indicating how much space this cell should be given relative to other cells in the same layout.
+	weight=property(_get_weight, _set_weight)
+	def _get_fixed(self):
+		return self._fixed
+	def _set_fixed(self, fixed):
+		self._fixed=fixed
+		self.Invalidate()
+	#: A numeric amount of fixed space this cell must contain (measured in the window coordinate system).
+	fixed=property(_get_fixed, _set_fixed)
+	def _get_min(self):
+		return self._min
+	def _set_min(self, min):
+		self._min=min
+		self.Invalidate()
+	#: The smallest size this cell may have, or ``None`` for no limit.
+	min=property(_get_min, _set_min)
+	def _get_max(self):
+		return self._max
+	def _set_max(self, max):
+		self._max=max
+		self.Invalidate()
+	#: The largest size this cell may have, or ``None`` for no limit.
+	max=property(_get_max, _set_max)
+	def _get_auto(self):
+		return self._auto
+	def _set_auto(self, auto):
+		self._auto=auto
+		self.Invalidate()
+	#: Whether or not this cell is sized to fit its :attr:`content`.
+	auto=property(_get_auto, _set_auto)
+	def _get_content(self):
+		return self._content
+	def _set_content(self, content):
+		if content!=self._content:
+			self._content=content
+			if self._auto:
+				self.Invalidate()
+	#: The intrinsic size of the :class:`Widget`\ s in this cell, as last measured (only used if :attr:`auto`).
+	content=property(_get_content, _set_content)
+	@property
+	def basis(self):
+		'''The size of this cell before any weighted space is shared out: its
+:attr:`fixed` space, or its :attr:`content` if that is larger and :attr:`auto` is set.'''
+		if self._auto and self._content>self._fixed:
+			return self._content
+		return self._fixed
+	def Clamp(self, size, content=None):
+		'''Returns ``size`` limited by :attr:`min` and :attr:`max` (and by
+:attr:`content`, or the ``content`` given, if :attr:`auto`).'''
+		if self._max is not None and size>self._max:
+			size=self._max
+		if self._min is not None and size<self._min:
+			size=self._min
+		if content is None:
+			content=self._content
+		if self._auto and size<content:
+			size=content
+		return size
+	def Span(self, count):
+		'''Returns a list of this cell and the ``count-1`` cells after it (in
+the first :class:`LayoutVector` holding it).'''
+		if count==1:
+			return [self]
+		vec=self.vectors[0]
+		start=vec.IndexOf(self)
+		return vec.cells[start:start+count]
 
 class LayoutVector(object):
 	'''A :class:`LayoutVector` contains a vector (well, a list) of cells arranged
@@ -48,22 +148,123 @@ to construct), or an arbitrary number of positional parameters containing
 that interface).
 
 Furthermore, ``__getitem__``, ``__len__``, and ``__iter__`` are implemented,
-and defer calls to the underlying cell collection.'''
+and defer calls to the underlying cell collection.
+
+The layout is only recomputed when the dimension differs from the last one, or
+after :func:`Invalidate`, which happens automatically when the
+:attr:`LayoutCell.weight` or :attr:`LayoutCell.fixed` of a cell changes. If you
+change :attr:`cells` itself, call :func:`Invalidate` (or use :func:`Append` and
+:func:`Remove`, which do).'''
 	def __init__(self, *cells):
 		if len(cells)==1 and isinstance(cells[0], (int, long)):
 			self.cells=[LayoutCell() for i in xrange(cells[0])]
 		else:
 			self.cells=list(cells)
+		for cell in self.cells:
+			if hasattr(cell, 'vectors'):
+				cell.vectors.append(self)
+		#: The dimension of the last computation, or ``None`` if it is out of date.
+		self.dim=None
+		#: The number of times the layout has actually been computed.
+		self.computes=0
+		#: The :attr:`LayoutCell.offset`\ s of the cells as of the last computation, for :func:`CellAt`.
+		self.offsets=[]
+		self.indices=None
+	def Invalidate(self):
+		'''Force the layout to be recomputed by the next :func:`Compute`.'''
+		self.dim=None
+	def Append(self, cell):
+		'''Add a :class:`LayoutCell` to the end of this vector.'''
+		self.cells.append(cell)
+		cell.vectors.append(self)
+		self.indices=None
+		self.Invalidate()
+	def Remove(self, cell):
+		'''Remove a :class:`LayoutCell` from this vector.'''
+		self.cells.remove(cell)
+		cell.vectors.remove(self)
+		self.indices=None
+		self.Invalidate()
+	def IndexOf(self, cell):
+		'''Returns the index of ``cell`` in :attr:`cells`.'''
+		if self.indices is None or len(self.indices)!=len(self.cells):
+			self.indices=dict((id(c), i) for i, c in enumerate(self.cells))
+		return self.indices[id(cell)]
+	def Natural(self):
+		'''Returns the smallest size this vector's cells fit in without being
+shrunk (the sum of their :attr:`LayoutCell.basis` sizes, as clamped).'''
+		return sum(cell.Clamp(cell.basis) for cell in self.cells)
 	def Compute(self, dim):
 		'''Compute the layout of the cells along this dimension, assuming a size
-along this dimensions of the argument given.'''
-		dim-=sum([i.fixed for i in self.cells]) #Remove fixed allocations from weighting
-		wtotal=sum([i.weight for i in self.cells])
+along this dimensions of the argument given. Returns ``True`` if the layout was
+recomputed, or ``False`` if it was already up to date.'''
+		if dim==self.dim:
+			return False
+		self.dim=dim
+		self.computes+=1
+		cells=self.cells
+		sizes=self.Distribute(cells, dim)
 		offset=0
-		for cell in self.cells:
+		offsets=[]
+		for cell, size in zip(cells, sizes):
 			cell.offset=offset
-			cell.size=cell.fixed+(dim*cell.weight/wtotal)
-			offset+=cell.size
+			offsets.append(offset)
+			cell.size=size
+			offset+=size
+		self.offsets=offsets
+		return True
+	@staticmethod
+	def Distribute(cells, dim):
+		'''Returns the sizes of ``cells`` sharing a dimension ``dim``: each gets its
+:attr:`LayoutCell.basis`, plus the remaining space in proportion to its weight.
+Cells whose share breaks their limits are clamped, and the rest share what's
+left again, until none do; this takes one pass unless a limit is hit, and at
+most one more per cell clamped.'''
+		bases=[cell.basis for cell in cells]
+		weights=[cell.weight for cell in cells]
+		#(Only cells with limits need clamping)
+		limited=[(cell._min is not None or cell._max is not None or cell._auto) for cell in cells]
+		sizes=list(bases)
+		active=[]
+		for i, cell in enumerate(cells):
+			if weights[i]:
+				active.append(i)
+			elif limited[i]:
+				sizes[i]=cell.Clamp(sizes[i])
+		while active:
+			free=dim-sum(sizes)+sum(sizes[i]-bases[i] for i in active)
+			wtotal=sum(weights[i] for i in active)
+			under=[]
+			over=[]
+			violation=0
+			for i in active:
+				size=bases[i]+free*weights[i]/wtotal
+				if not limited[i]:
+					sizes[i]=size
+					continue
+				clamped=cells[i].Clamp(size)
+				sizes[i]=clamped
+				if clamped>size:
+					under.append(i)
+				elif clamped<size:
+					over.append(i)
+				violation+=clamped-size
+			#Freeze the cells that hit their limits in the direction of the total violation (or all, if there is none)
+			if not violation:
+				break
+			frozen=set(under if violation>0 else over)
+			active=[i for i in active if i not in frozen]
+		return sizes
+	def CellAt(self, x):
+		'''Returns the cell containing the coordinate ``x`` as of the last
+:func:`Compute`, or ``None``, by binary search.'''
+		i=bisect_right(self.offsets, x)-1
+		if i<0:
+			return None
+		cell=self.cells[i]
+		if x<cell.offset+cell.size:
+			return cell
+		return None
 	def __getitem__(self, idx):
 		return self.cells[idx]
 	def __len__(self):
@@ -84,11 +285,23 @@ or implementor of that interface.'''
 		self.rows=(LayoutVector(rows) if isinstance(rows, (int, long)) else rows)
 		#: A :class:`LayoutVector` specifyinh layout along the X axis.
 		self.cols=(LayoutVector(cols) if isinstance(cols, (int, long)) else cols)
+		#: Incremented whenever the layout changes, so that anything derived from it can tell when it is stale.
+		self.version=0
 	def Compute(self, dims):
 		'''Compute all :class:`LayoutVector`\ s from the dimension :class:`vmath.Vector`
-given.'''
-		self.rows.Compute(dims.y)
-		self.cols.Compute(dims.x)
+given (which does nothing unless the dimensions or cells have changed; see
+:class:`LayoutVector`). Returns ``True`` if the layout changed.'''
+		rows=self.rows.Compute(dims.y)
+		cols=self.cols.Compute(dims.x)
+		#(Anything else implementing the interface may return None; assume it changed)
+		if rows is not False or cols is not False:
+			self.version+=1
+			return True
+		return False
+	def Invalidate(self):
+		'''Force the layout to be recomputed by the next :func:`Compute`.'''
+		self.rows.Invalidate()
+		self.cols.Invalidate()
 	def CellPair(self, x, y):
 		'''Returns a tuple ``(:class:`LayoutCell`, :class:`LayoutCell`)`` as
 specified by the ``x`` and ``y`` parameters.'''
@@ -97,15 +310,7 @@ specified by the ``x`` and ``y`` parameters.'''
 		'''Returns a tuple ``(:class:`LayoutCell`, :class:`LayoutCell`)`` that
 represents the cell pair at the given position in the layout held by this
 :class:`Grid`. This may be used for various sorts of hit-testing.'''
-		xcell=None
-		ycell=None
-		for cell in self.cols:
-			if pos.x>=cell.offset and pos.x<cell.offset+cell.size:
-				xcell=cell
-		for cell in self.rows:
-			if pos.y>=cell.offset and pos.y<cell.offset+cell.size:
-				ycell=cell
-		return xcell, ycell
+		return self.cols.CellAt(pos.x), self.rows.CellAt(pos.y)
 
 class Widget(Renderable):
 	'''A :class:`Widget` is a special type of :class:`scenegraph.Renderable`
@@ -124,25 +329,115 @@ above. (The matrices are assumed to be identity beforehand, an assumption usuall
 guaranteed by an enclosing :class:`Container`).
 
 The ``xcell`` and ``ycell`` parameters should be set to a cell on corresponding
-layout axes.'''
-	def __init__(self, xcell, ycell, fcol=None, bcol=None, **kwargs):
-		super(Widget, self).__init__(**kwargs)
+layout axes. The widget covers ``xspan`` cells along the x axis, starting at
+``xcell`` (and likewise for ``yspan``).'''
+	#(Widgets set their own viewports, so a pipeline.Pipeline draws them with their container)
+	ATOMIC=True
+	def __init__(self, xcell, ycell, fcol=None, bcol=None, xspan=1, yspan=1, **kwargs):
+		#(Set before the parent is, so that a Container can map the cells)
 		#: A :class:`LayoutCell` along the x axis.
 		self.xcell=xcell
 		#: A :class:`LayoutCell` along the y axis.
 		self.ycell=ycell
+		#: The number of cells covered along the x axis.
+		self.xspan=xspan
+		#: The number of cells covered along the y axis.
+		self.yspan=yspan
+		#: The intrinsic size last returned by :func:`Measure`, or ``None`` if it is out of date.
+		self.measured=None
+		super(Widget, self).__init__(**kwargs)
 		#: A :class:`vmath.Vector` cotaining the foreground color, or ``None`` (whose application differs per widget).
 		self.fcol=fcol
 		#: A :class:`vmath.Vector` containing the background color, or ``None`` (whose application differs per widget).
 		self.bcol=bcol
+	def Invalidate(self):
+		'''Note that this widget's appearance has changed, so that any retained
+:class:`Container` holding it redraws, and its :attr:`rect` is added to any
+:class:`Damage` above it. Widgets call this themselves when their
+own attributes (such as :attr:`Label.text`) change; call it after changing
+anything else that affects drawing.'''
+		rect=False
+		node=self
+		while node is not None:
+			if isinstance(node, Container):
+				node.version+=1
+			damage=getattr(node, 'damage', None)
+			if damage is not None:
+				if rect is False:
+					rect=self.rect
+				damage.Add(rect)
+			node=node.parent
+	@property
+	def rect(self):
+		'''The ``(x, y, width, height)`` this widget covers, in window
+coordinates (that is, with the offsets of the :class:`Widget`\ s containing it
+added), or ``None`` if that isn't known (because it has no cells, like a
+top-level :class:`Container`, or they haven't been laid out).'''
+		if self.xcell is None or self.ycell is None or self.xcell.size<0 or self.ycell.size<0:
+			return None
+		size=self.size
+		x=y=0
+		node=self
+		while isinstance(node, Widget) and node.xcell is not None and node.ycell is not None:
+			x+=node.xcell.offset
+			y+=node.ycell.offset
+			node=node.parent
+		return (int(x), int(y), int(size.x), int(size.y))
+	def Measure(self):
+		'''Returns the intrinsic size of this widget (as a 2D :class:`vmath.Vector`
+in window coordinates): the least space it needs to show its content, which
+:class:`LayoutCell`\ s with :attr:`LayoutCell.auto` set are made to fit. This
+is cached in :attr:`measured` until :func:`InvalidateSize` is called; override
+:func:`Intrinsic` to compute it.'''
+		if self.measured is None:
+			self.measured=self.Intrinsic()
+		return self.measured
+	def Intrinsic(self):
+		'''Computes the intrinsic size (see :func:`Measure`). By default, this is nothing.'''
+		return Vector(0, 0)
+	def InvalidateSize(self):
+		'''Note that the intrinsic size of this widget may have changed, so that
+it (and the :class:`Container`\ s above it) are remeasured before they are next
+laid out. Only the widgets on the way up are remeasured; the layouts of those
+whose cells' sizes actually change are then recomputed.'''
+		node=self
+		while isinstance(node, Widget) and node.measured is not None:
+			node.measured=None
+			node=node.parent
+	def Emit(self, batch, x, y):
+		'''Add this widget's geometry to ``batch`` (a :class:`WidgetBatch`), with
+its lower left corner at ``(x, y)``, returning ``True``; or, if it can't be
+batched, return ``False``, and it is rendered as usual. (By default, widgets
+can't be batched.)'''
+		return False
+	def CellPairs(self):
+		'''Returns a list of the ``(xcell, ycell)`` pairs covered by this widget.'''
+		return [(x, y) for x in self.xcell.Span(self.xspan) for y in self.ycell.Span(self.yspan)]
+	def Move(self, xcell, ycell):
+		'''Move this widget to another pair of cells. (Set :attr:`xcell` and
+:attr:`ycell` through this, so that a :class:`Container` parent can find it.)'''
+		par=self.parent
+		self.Invalidate() #Where it was...
+		if isinstance(par, Container):
+			par.ChildRemoved(self)
+		self.xcell=xcell
+		self.ycell=ycell
+		if isinstance(par, Container):
+			par.ChildAdded(self)
+		self.Invalidate() #...and where it is
 	@property
 	def pos(self):
 		'''A 2D :class:`vmath.Vector` containing the cell positions.'''
 		return Vector(self.xcell.offset, self.ycell.offset)
 	@property
 	def size(self):
-		'''A 2D :class:`vmath.Vector` containing the cell sizes.'''
-		return Vector(self.xcell.size, self.ycell.size)
+		'''A 2D :class:`vmath.Vector` containing the cell sizes (across all of
+the cells spanned).'''
+		if self.xspan==1 and self.yspan==1:
+			return Vector(self.xcell.size, self.ycell.size)
+		xcells=self.xcell.Span(self.xspan)
+		ycells=self.ycell.Span(self.yspan)
+		return Vector(xcells[-1].offset+xcells[-1].size-self.xcell.offset, ycells[-1].offset+ycells[-1].size-self.ycell.offset)
 	def PushState(self):
 		'''Initialize the state (basically, push and set the viewport).
 
@@ -152,11 +447,11 @@ layout axes.'''
 	attributes, including :attr:`scenegraph.Renderable.enable`,
 	:attr:`scenegraph.Renderable.disable`, :attr:`scenegraph.Renderable.modifications`,
 	and so on.'''
-		glPushAttrib(GL_VIEWPORT_BIT)
-		glViewport(*([int(i) for i in self.pos]+[int(i) for i in self.size]))
+		GL.glPushAttrib(GL.GL_VIEWPORT_BIT)
+		GL.glViewport(*([int(i) for i in self.pos]+[int(i) for i in self.size]))
 	def PopState(self):
 		'''Reset the state (basically, pop the viewport).'''
-		glPopAttrib()
+		GL.glPopAttrib()
 
 class Container(Widget):
 	'''A :class:`Container` is a :class:`Widget` that contains other :class:`Widget`\ s.
@@ -165,12 +460,50 @@ In particular, a :class:`Container` is special in that it can accept an
 this container is the *top-level container*, which causes it to do useful duties
 (like set up the identity matrices; see :class:`Widget`).
 
+A :class:`Container` made with ``retained`` set draws its children into a
+texture, and thereafter draws just that, until one of them changes (their text
+or value, or the layout; see :func:`Widget.Invalidate`), at which point the
+texture is redrawn. This suits mostly static panels.
+
+A :class:`Container` made with ``batched`` set has its children (and theirs, and
+so on) :func:`Widget.Emit` their geometry into a :class:`WidgetBatch`, which is
+drawn in a few calls (see :func:`WidgetBatch.Draw`), and only rebuilt when
+something changes. Widgets that can't be batched are rendered as usual,
+afterwards. Nested containers don't render themselves while batched (so their
+``retained`` and ``batched`` settings are ignored).
+
+Before it is laid out, a :class:`Container` measures the children whose intrinsic
+size has changed (see :func:`Widget.Measure`), storing it in the
+:attr:`LayoutCell.content` of their cells, and so on up through any
+:class:`Container`\ s it is in, whose own intrinsic size is that of their grid;
+nested containers thereby size to their contents. This happens in one pass
+down the tree, which skips whatever hasn't changed.
+
 Containers always have a layout system--presently, :attr:`grid` (though the name
 is subject to change). It is logical (but not required) to put :class:`Widget`\ s
 that are in this layout system as children of the :class:`Container`. Other
 :class:`scenegraph.Renderable`\ s should not be made children of :class:`Container`\ s
 due to the odd circumstances under which :class:`Widget`\ s are rendered.'''
-	def __init__(self, grid, xcell=None, ycell=None, **kwargs):
+	def __init__(self, grid, xcell=None, ycell=None, retained=False, batched=False, atlas=None, **kwargs):
+		#: Incremented by :func:`Widget.Invalidate` whenever anything in this container changes.
+		self.version=0
+		#: Whether or not to draw the children into :attr:`cache`, and then only
+		#: that, until something changes (see :func:`Widget.Invalidate`).
+		self.retained=retained
+		#: The :class:`scenegraph.FrameBuffer` holding the children's drawing, if :attr:`retained`.
+		self.cache=None
+		#: The :attr:`version` last drawn into :attr:`cache`, or ``None``.
+		self.cached=None
+		#: The number of times the children have been drawn into :attr:`cache`.
+		self.redraws=0
+		#: Whether or not to draw the children through :attr:`batch`.
+		self.batched=batched
+		#: The :class:`TextAtlas` used when :attr:`batched` (by default, :func:`TextAtlas.Shared`).
+		self.atlas=atlas
+		#: The :class:`WidgetBatch` of the children, if :attr:`batched` (made on the first render).
+		self.batch=None
+		#: The :attr:`version` last built into :attr:`batch`, or ``None``.
+		self.built=None
 		super(Container, self).__init__(xcell, ycell, **kwargs)
 		#: The :class:`Grid` representing the layout.
 		self.grid=grid
@@ -183,45 +516,182 @@ due to the odd circumstances under which :class:`Widget`\ s are rendered.'''
 		#:    Events thusly grabbed are still in the :class:`Widget`'s local coordinate space.
 		#:    This means you may see negative values.
 		self.grab=None
+		#: Maps ``(xcell, ycell)`` pairs to the (first) child widget in those cells, for :func:`ChildAt`.
+		self.cellmap={}
 	def PushState(self):
 		'''Initialize the state. Depending on whether this is a top-level
 container, this may initialize the matrices (without affecting the viewport),
-or it may just set a viewport as with the usual :func:`Widget.PushState`.'''
+or it may just set a viewport as with the usual :func:`Widget.PushState`.
+Either way, the grid is laid out, after :func:`Widget.Measure`\ ing it (if needed).'''
+		self.Measure()
 		if self.xcell is None or self.ycell is None:
 			#Initialize this as if we are a master layout (we probably are)
-			glMatrixMode(GL_PROJECTION)
-			glPushMatrix()
-			glLoadIdentity()
-			glMatrixMode(GL_MODELVIEW)
-			glPushMatrix()
-			glLoadIdentity()
-			self.grid.Compute(Vector(*(glGetIntegerv(GL_VIEWPORT)[2:])))
+			GL.glMatrixMode(GL.GL_PROJECTION)
+			GL.glPushMatrix()
+			GL.glLoadIdentity()
+			GL.glMatrixMode(GL.GL_MODELVIEW)
+			GL.glPushMatrix()
+			GL.glLoadIdentity()
+			if self.grid.Compute(Vector(*(GL.glGetIntegerv(GL.GL_VIEWPORT)[2:]))):
+				self.Invalidate()
 		else:
-			self.grid.Compute(self.size)
+			if self.grid.Compute(self.size):
+				self.Invalidate()
 			super(Container, self).PushState() #Just do what every other widget does
 	def PopState(self):
 		'''Reverts the state, undoing the actions done during :func:`PushState`.'''
 		if self.xcell is None or self.ycell is None:
-			glMatrixMode(GL_PROJECTION)
-			glPopMatrix()
-			glMatrixMode(GL_MODELVIEW)
-			glPopMatrix()
+			GL.glMatrixMode(GL.GL_PROJECTION)
+			GL.glPopMatrix()
+			GL.glMatrixMode(GL.GL_MODELVIEW)
+			GL.glPopMatrix()
 		else:
 			super(Container, self).PopState()
 	def Render(self):
 		'''Render the :class:`Container` (which actually does nothing but
-renders its children via :func:`scenegraph.Renderable.RenderChildren`.'''
-		self.RenderChildren()
+renders its children via :func:`RenderContents`, or, if
+:attr:`retained`, draws :attr:`cache`, redrawing it first if needed).'''
+		if not self.retained:
+			self.RenderContents()
+			return
+		x, y, w, h=GL.glGetIntegerv(GL.GL_VIEWPORT)
+		if self.cache is None:
+			self.cache=FrameBuffer(w, h)
+			self.cached=None
+		elif (w, h)!=(self.cache.width, self.cache.height):
+			self.cache.Resize(w, h)
+			self.cached=None
+		if self.cached!=self.version:
+			with self.cache:
+				GL.glPushAttrib(GL.GL_COLOR_BUFFER_BIT)
+				GL.glClearColor(0, 0, 0, 0)
+				GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+				GL.glPopAttrib()
+				self.RenderContents()
+			#(After drawing, since drawing may change things, like label textures)
+			self.cached=self.version
+			self.redraws+=1
+		self.cache.Draw()
+	def RenderContents(self):
+		'''Render the children, via :func:`scenegraph.Renderable.RenderChildren`,
+or, if :attr:`batched`, :attr:`batch` (rebuilding it first if needed).'''
+		if not self.batched:
+			self.RenderChildren()
+			return
+		x, y, w, h=GL.glGetIntegerv(GL.GL_VIEWPORT)
+		if self.batch is None:
+			self.batch=WidgetBatch(self.atlas or TextAtlas.Shared())
+		batch=self.batch
+		if self.built!=self.version or batch.generation!=batch.atlas.generation:
+			#(Twice, if the atlas was cleared to make room while building)
+			for i in xrange(2):
+				batch.Clear()
+				self.EmitChildren(batch, 0, 0)
+				if batch.generation==batch.atlas.generation:
+					break
+			self.built=self.version
+		batch.Draw(w, h)
+		for child, cx, cy in batch.fallback:
+			if isinstance(child, Widget):
+				size=child.size
+				GL.glPushAttrib(GL.GL_VIEWPORT_BIT)
+				GL.glViewport(x+int(cx), y+int(cy), int(size.x), int(size.y))
+				child.Render()
+				GL.glPopAttrib()
+			else:
+				with child:
+					child.Render()
+	def Emit(self, batch, x, y):
+		'''Lays out the grid, and adds the children to ``batch`` (see :func:`Widget.Emit`).'''
+		if self.xcell is not None and self.ycell is not None:
+			if self.grid.Compute(self.size):
+				self.Invalidate()
+		self.EmitChildren(batch, x, y)
+		return True
+	def EmitChildren(self, batch, x, y):
+		'''Add the children to ``batch``, with this container's lower left corner
+at ``(x, y)``, noting those that can't be batched in :attr:`WidgetBatch.fallback`.'''
+		for child in self.children:
+			if isinstance(child, Widget) and child.xcell is not None and child.ycell is not None:
+				cx=x+child.xcell.offset
+				cy=y+child.ycell.offset
+				if not child.Emit(batch, cx, cy):
+					batch.fallback.append((child, cx, cy))
+			else:
+				batch.fallback.append((child, x, y))
+	def Intrinsic(self):
+		'''Measures the children, storing their sizes in the :attr:`LayoutCell.content`
+of their cells, and returns the natural size of the grid (see :func:`LayoutVector.Natural`).
+If none of the cells are :attr:`LayoutCell.auto`, the children aren't measured
+at all (nor, therefore, remeasured when they change).'''
+		cols=self.grid.cols
+		rows=self.grid.rows
+		if any(cell.auto for cell in cols) or any(cell.auto for cell in rows):
+			widgets=[child for child in self.children if isinstance(child, Widget) and child.xcell is not None and child.ycell is not None]
+			sizes=[child.Measure() for child in widgets]
+			self.Fit(cols, [(child.xcell, child.xspan, size.x) for child, size in zip(widgets, sizes)])
+			self.Fit(rows, [(child.ycell, child.yspan, size.y) for child, size in zip(widgets, sizes)])
+		return Vector(cols.Natural(), rows.Natural())
+	def Prepare(self):
+		'''Measures the children (see :func:`Widget.Measure`), ahead of layout.'''
+		self.Measure()
+	@staticmethod
+	def Fit(vector, extents):
+		'''Sets the :attr:`LayoutCell.content` of the cells in ``vector`` to fit
+``extents``, a list of ``(cell, span, size)``. A size spanning several cells
+that don't fit it already is shared out equally among those that are
+:attr:`LayoutCell.auto`.'''
+		content=dict((id(cell), 0) for cell in vector)
+		spanning=[]
+		for cell, span, size in extents:
+			if span==1:
+				if size>content.get(id(cell), 0):
+					content[id(cell)]=size
+			else:
+				spanning.append((cell, span, size))
+		for cell, span, size in spanning:
+			cells=cell.Span(span)
+			auto=[i for i in cells if i.auto]
+			if not auto:
+				continue
+			#(Sized as they will be, without setting their content yet, so that unchanged cells don't invalidate their layouts)
+			short=size-sum(i.Clamp((max(i.fixed, content[id(i)]) if i.auto else i.fixed), content[id(i)]) for i in cells)
+			if short>0:
+				for i in auto:
+					content[id(i)]=i.Clamp(max(i.fixed, content[id(i)]), content[id(i)])+short/float(len(auto))
+		for cell in vector:
+			cell.content=content[id(cell)]
+	def ChildAdded(self, child):
+		'''Adds ``child`` to the :attr:`cellmap` (as well as doing the usual).'''
+		super(Container, self).ChildAdded(child)
+		if getattr(child, 'xcell', None) is not None and getattr(child, 'ycell', None) is not None:
+			for key in child.CellPairs():
+				self.cellmap.setdefault(key, child)
+		self.Invalidate()
+		self.InvalidateSize()
+	def ChildRemoved(self, child):
+		'''Removes ``child`` from the :attr:`cellmap` (as well as doing the usual).'''
+		super(Container, self).ChildRemoved(child)
+		if getattr(child, 'xcell', None) is not None and getattr(child, 'ycell', None) is not None:
+			for key in child.CellPairs():
+				if self.cellmap.get(key) is child:
+					del self.cellmap[key]
+					#Another child may share the cells
+					for other in self.children:
+						if other is not child and isinstance(other, Widget) and other.xcell is not None and key in other.CellPairs():
+							self.cellmap[key]=other
+							break
+		self.Invalidate()
+		self.InvalidateSize()
 	def ChildAt(self, pos):
 		'''Returns a :class:`Widget` at the position specified, if one exists
-there; otherwise, returns ``None``.'''
-		xc, yc=self.grid.CellsAt(pos)
-		if xc is None or yc is None:
-			return None
-		for child in self.children:
-			if child.xcell is xc and child.ycell is yc:
-				return child
-		return None #Explicit is better than implicit.
+there; otherwise, returns ``None``.
+
+.. note::
+
+	Widgets are found through :attr:`cellmap`, so they must be added with
+	:func:`scenegraph.Renderable.SetParent`, and moved with :func:`Widget.Move`.'''
+		return self.cellmap.get(self.grid.CellsAt(pos))
 	def TriggerChildren(self, ev):
 		'''Overrides the default propagation behavior by ensuring that
 :class:`Event` objects with a ``pos`` attribute are dispatched only to
@@ -270,6 +740,353 @@ and :attr:`grab` attributes, if they are set.
 		self.grab=grab
 ##		print 'Grab set to', grab
 
+class Damage(object):
+	'''A :class:`Damage` collects the rectangles of the window (as ``(x, y,
+width, height)`` in window coordinates) that have changed since it was last
+:func:`Clear`\ ed. Set it as the ``damage`` attribute of a
+:class:`scenegraph.Renderable` (usually done by :class:`DamageRenderer`), and
+:func:`Widget.Invalidate` adds the :attr:`Widget.rect` of any :class:`Widget`
+below it that changes; anything else (such as a 3D view that has moved) must
+be added by hand, or the whole window damaged with :func:`Full`.
+
+Overlapping rectangles are merged by :func:`Rects`; if more than ``limit``
+remain, they are merged into one covering them all, so that a frame is never
+redrawn piecemeal too many times.'''
+	def __init__(self, limit=8):
+		#: The maximum number of rectangles :func:`Rects` returns.
+		self.limit=limit
+		#: The rectangles added since the last :func:`Clear`.
+		self.rects=[]
+		#: Whether or not the whole window is damaged.
+		self.full=True
+	def Add(self, rect):
+		'''Add a rectangle (``None`` meaning the whole window).'''
+		if rect is None:
+			self.full=True
+		elif not self.full and rect[2]>0 and rect[3]>0:
+			self.rects.append(rect)
+	def Full(self):
+		'''Damage the whole window.'''
+		self.full=True
+	def Clear(self):
+		'''Forget all damage (for instance, once it has been redrawn).'''
+		del self.rects[:]
+		self.full=False
+	def __nonzero__(self):
+		return self.full or bool(self.rects)
+	@staticmethod
+	def Union(a, b):
+		'''Returns the smallest rectangle containing rectangles ``a`` and ``b``.'''
+		x=min(a[0], b[0])
+		y=min(a[1], b[1])
+		return (x, y, max(a[0]+a[2], b[0]+b[2])-x, max(a[1]+a[3], b[1]+b[3])-y)
+	@staticmethod
+	def Overlaps(a, b):
+		'''Returns true if rectangles ``a`` and ``b`` overlap.'''
+		return a[0]<b[0]+b[2] and b[0]<a[0]+a[2] and a[1]<b[1]+b[3] and b[1]<a[1]+a[3]
+	def Rects(self, width, height):
+		'''Returns a list of disjoint rectangles covering the damage, clipped to a
+window of ``width`` by ``height``.'''
+		if self.full:
+			return [(0, 0, width, height)]
+		merged=[]
+		for x, y, w, h in self.rects:
+			x0, y0=max(x, 0), max(y, 0)
+			rect=(x0, y0, min(x+w, width)-x0, min(y+h, height)-y0)
+			if rect[2]<=0 or rect[3]<=0:
+				continue
+			#Merge with whatever it overlaps (repeatedly, since the union may overlap more)
+			i=0
+			while i<len(merged):
+				if self.Overlaps(rect, merged[i]):
+					rect=self.Union(rect, merged.pop(i))
+					i=0
+				else:
+					i+=1
+			merged.append(rect)
+		if len(merged)>self.limit:
+			rect=merged[0]
+			for other in merged[1:]:
+				rect=self.Union(rect, other)
+			merged=[rect]
+		return merged
+
+class DamageRenderer(object):
+	'''A :class:`DamageRenderer` renders ``root`` (usually a :class:`scenegraph.Scene`)
+into a window-sized :class:`scenegraph.FrameBuffer` (the "backbuffer"),
+redrawing only the rectangles in its :attr:`damage` (each scissored, after
+clearing it) and keeping the rest from earlier frames, and then draws that to
+the window. When nothing has changed, a frame costs one textured quad.
+
+Call :func:`Render` instead of clearing the window and rendering ``root``::
+
+	renderer=DamageRenderer(scene)
+	while running:
+		...
+		renderer.Render()
+		pygame.display.flip()
+
+Only :class:`Widget`\ s damage themselves; if anything else changes (a 3D
+view animating, say), add its rectangle to :attr:`damage` (or call
+:func:`Damage.Full`) before rendering. Changes made while rendering (such as a
+:class:`Container`'s layout being recomputed) are redrawn the next frame.'''
+	def __init__(self, root, damage=None):
+		#: The :class:`scenegraph.Renderable` rendered.
+		self.root=root
+		if damage is None:
+			damage=Damage()
+		#: The :class:`Damage` collecting changes (also set as ``root.damage``).
+		self.damage=damage
+		root.damage=damage
+		#: The :class:`scenegraph.FrameBuffer` holding the last frame (created on the first :func:`Render`).
+		self.cache=None
+		#: The rectangles redrawn in the last :func:`Render`.
+		self.redrawn=[]
+	def Render(self):
+		'''Redraw the damage into the backbuffer, and draw it to the viewport.'''
+		x, y, w, h=GL.glGetIntegerv(GL.GL_VIEWPORT)
+		if self.cache is None:
+			self.cache=FrameBuffer(w, h, depth=True)
+			self.damage.Full()
+		elif (w, h)!=(self.cache.width, self.cache.height):
+			self.cache.Resize(w, h)
+			self.damage.Full()
+		rects=self.damage.Rects(w, h)
+		#(Cleared first, so that what changes during rendering is kept for the next frame)
+		self.damage.Clear()
+		if rects:
+			with self.cache:
+				GL.glEnable(GL.GL_SCISSOR_TEST)
+				for rect in rects:
+					GL.glScissor(*rect)
+					GL.glClear(GL.GL_COLOR_BUFFER_BIT|GL.GL_DEPTH_BUFFER_BIT)
+					with self.root:
+						self.root.Render()
+		self.redrawn=rects
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.glPushMatrix()
+		GL.glLoadIdentity()
+		GL.glMatrixMode(GL.GL_MODELVIEW)
+		GL.glPushMatrix()
+		GL.glLoadIdentity()
+		self.cache.Draw(blend=False)
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.glPopMatrix()
+		GL.glMatrixMode(GL.GL_MODELVIEW)
+		GL.glPopMatrix()
+
+class TextAtlas(object):
+	'''A :class:`TextAtlas` keeps rendered strings of text in a few large
+textures ("pages") of ``size`` by ``size`` pixels, so that many may be drawn
+with one texture bound (see :class:`WidgetBatch`). Strings are added as they
+are first looked up, packed into rows, and only their own region of the page
+is uploaded. When ``pages`` pages are full, everything is thrown away and the
+atlas starts over (incrementing :attr:`generation`, so that anything holding
+texture coordinates from it can tell they are stale).'''
+	#: The atlas returned by :func:`Shared` (class attr).
+	SHARED=None
+	#: The gap left around each string, in pixels, so that filtering doesn't bleed between them (class attr).
+	PADDING=1
+	def __init__(self, size=1024, pages=4):
+		#: The width and height of each page.
+		self.size=size
+		#: The greatest number of pages.
+		self.maxpages=pages
+		#: A list of the :class:`scenegraph.Texture` pages (each keeping its ``pygame.Surface``).
+		self.pages=[]
+		#: Maps ``(font, text, color)`` to ``(page, width, height, u0, v0, u1, v1)``.
+		self.entries={}
+		#: Incremented whenever the atlas is cleared.
+		self.generation=0
+		#(The page being filled, and the position and height of the row being filled in it)
+		self.page=0
+		self.x=self.y=self.row=0
+	@classmethod
+	def Shared(cls):
+		'''Returns an atlas shared by default by every batched :class:`Container`.'''
+		if cls.SHARED is None:
+			cls.SHARED=cls()
+		return cls.SHARED
+	def Clear(self):
+		'''Forget every string (but keep the pages, to be reused).'''
+		for page in self.pages:
+			page.surf.fill((0, 0, 0, 0))
+			page.Reload()
+		self.entries.clear()
+		self.x=self.y=self.row=0
+		self.page=0
+		self.generation+=1
+	def Lookup(self, font, text, color):
+		'''Returns ``(page, width, height, u0, v0, u1, v1)`` for ``text`` rendered
+in ``font`` in ``color`` (a 3-tuple of bytes), adding it if needed. The texture
+coordinates' origin is the lower left, as usual.'''
+		key=(font, text, color)
+		entry=self.entries.get(key)
+		if entry is None:
+			with Label.FONTLOCK:
+				surf=font.render(text, True, color)
+			entry=self.entries[key]=self.Add(surf)
+		return entry
+	def Add(self, surf):
+		'''Pack ``surf`` into a page and upload it, returning its entry.'''
+		import pygame
+		size=self.size
+		pad=self.PADDING
+		w=min(surf.get_width(), size-2*pad)
+		h=min(surf.get_height(), size-2*pad)
+		if self.x+w+2*pad>size:
+			#Next row
+			self.x=0
+			self.y+=self.row
+			self.row=0
+		if self.page<len(self.pages) and self.y+h+2*pad>size:
+			#This page is full; on to the next (or start over)
+			if self.page+1>=self.maxpages:
+				self.Clear()
+			else:
+				self.page+=1
+				self.x=self.y=self.row=0
+		if self.page>=len(self.pages):
+			surface=pygame.Surface((size, size), pygame.SRCALPHA, 32)
+			surface.fill((0, 0, 0, 0))
+			self.pages.append(Texture(surface, wrap=ModTexWrap(GL.GL_CLAMP_TO_EDGE, GL.GL_CLAMP_TO_EDGE)))
+		page=self.pages[self.page]
+		x=self.x+pad
+		y=self.y+pad
+		page.surf.blit(surf, (x, y), (0, 0, w, h))
+		GL.glBindTexture(GL.GL_TEXTURE_2D, page.id)
+		#(Rows are uploaded bottom to top, as Texture.Reload does)
+		GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, x, size-y-h, w, h, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+						   pygame.image.tostring(page.surf.subsurface((x, y, w, h)), 'RGBA', True))
+		self.x+=w+2*pad
+		self.row=max(self.row, h+2*pad)
+		size=float(size)
+		return (self.page, w, h, x/size, (size-y-h)/size, (x+w)/size, (size-y)/size)
+
+class WidgetBatch(object):
+	'''A :class:`WidgetBatch` collects the rectangles and text of a number of
+:class:`Widget`\ s (see :func:`Widget.Emit`), in window coordinates relative to
+the batching :class:`Container`, into vertex arrays, so that they are drawn in
+one call for all of the untextured rectangles and one per page of the
+:class:`TextAtlas` ``atlas`` used for the text. Everything is clipped to the
+rectangle given with it (usually the cells of its widget), as the viewport
+would clip a widget rendered as usual.
+
+Since the rectangles are drawn first, text is drawn over any rectangle, even
+that of a widget drawn later.'''
+	def __init__(self, atlas):
+		#: The :class:`TextAtlas` holding the text.
+		self.atlas=atlas
+		self.Clear()
+	def Clear(self):
+		'''Empty the batch, to be built again.'''
+		#: A flat list of the coordinates of the rectangles' vertices.
+		self.verts=[]
+		#: A flat list of the colors of the rectangles' vertices.
+		self.colors=[]
+		#: Maps atlas page numbers to a flat list of the vertex coordinates and one of the texture coordinates.
+		self.quads={}
+		#: A list of ``(renderable, x, y)`` that couldn't be batched, to be rendered as usual.
+		self.fallback=[]
+		#: The :attr:`TextAtlas.generation` the text coordinates are from.
+		self.generation=self.atlas.generation
+		self.arrays=None
+	@staticmethod
+	def Clip(rect, tex, clip):
+		'''Clips ``rect`` (``(x0, y0, x1, y1)``) to ``clip``, adjusting the texture
+coordinates ``tex`` (likewise, or ``None``) to match. Returns the two, or
+``None`` if nothing is left.'''
+		x0, y0, x1, y1=rect
+		cx0, cy0, cx1, cy1=clip
+		if x0>=cx1 or y0>=cy1 or x1<=cx0 or y1<=cy0:
+			return None
+		if tex is not None and (x0<cx0 or y0<cy0 or x1>cx1 or y1>cy1):
+			u0, v0, u1, v1=tex
+			du=float(u1-u0)/(x1-x0)
+			dv=float(v1-v0)/(y1-y0)
+			tex=(u0+du*(max(x0, cx0)-x0), v0+dv*(max(y0, cy0)-y0), u1-du*(x1-min(x1, cx1)), v1-dv*(y1-min(y1, cy1)))
+		return (max(x0, cx0), max(y0, cy0), min(x1, cx1), min(y1, cy1)), tex
+	def Rect(self, rect, color, clip=None):
+		'''Add a rectangle (``(x0, y0, x1, y1)``) of ``color`` (a 4-tuple), clipped to ``clip``.'''
+		if clip is not None:
+			clipped=self.Clip(rect, None, clip)
+			if clipped is None:
+				return
+			rect=clipped[0]
+		x0, y0, x1, y1=rect
+		self.verts.extend((x0, y0, x1, y0, x1, y1, x0, y1))
+		self.colors.extend(tuple(color)*4)
+		self.arrays=None
+	def Text(self, font, text, fcol, align, box):
+		'''Add ``text`` in ``font`` and ``fcol`` (a :class:`vmath.Vector`, or
+``None`` for white), aligned in ``box`` (``(x0, y0, x1, y1)``) by ``align``
+(see :class:`ALIGN`) as :func:`Label.RenderText` would, and clipped to it.'''
+		if fcol is None:
+			fcol=Vector(1, 1, 1)
+		page, w, h, u0, v0, u1, v1=self.atlas.Lookup(font, text, tuple(int(255*i) for i in fcol.FastTo3()))
+		bx0, by0, bx1, by1=box
+		x0=(bx0+bx1-w)/2.0
+		y0=(by0+by1-h)/2.0
+		x1=x0+w
+		y1=y0+h
+		if align&ALIGN.LEFT:
+			x0=bx0
+			x1=bx0+w
+		if align&ALIGN.RIGHT:
+			x1=bx1
+			if not align&ALIGN.LEFT:
+				x0=bx1-w
+		if align&ALIGN.BOTTOM:
+			y0=by0
+			y1=by0+h
+		if align&ALIGN.TOP:
+			y1=by1
+			if not align&ALIGN.BOTTOM:
+				y0=by1-h
+		clipped=self.Clip((x0, y0, x1, y1), (u0, v0, u1, v1), box)
+		if clipped is None:
+			return
+		(x0, y0, x1, y1), (u0, v0, u1, v1)=clipped
+		verts, coords=self.quads.setdefault(page, ([], []))
+		verts.extend((x0, y0, x1, y0, x1, y1, x0, y1))
+		coords.extend((u0, v0, u1, v0, u1, v1, u0, v1))
+		self.arrays=None
+	def Draw(self, width, height):
+		'''Draw the batch into a viewport of ``width`` by ``height``, with the
+matrices assumed to be identity (as a :class:`Container` leaves them).'''
+		if self.arrays is None:
+			self.arrays=(numpy.array(self.verts, numpy.float32), numpy.array(self.colors, numpy.float32),
+						 [(self.atlas.pages[page], numpy.array(verts, numpy.float32), numpy.array(coords, numpy.float32)) for page, (verts, coords) in sorted(self.quads.iteritems())])
+		verts, colors, pages=self.arrays
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.glPushMatrix()
+		GL.glLoadIdentity()
+		GL.glOrtho(0, width, 0, height, -1, 1)
+		GL.glPushAttrib(GL.GL_ENABLE_BIT)
+		GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+		GL.glDisable(GL.GL_DEPTH_TEST)
+		GL.glDisable(GL.GL_TEXTURE_2D)
+		GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+		if len(verts):
+			GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+			GL.glVertexPointer(2, GL.GL_FLOAT, 0, verts)
+			GL.glColorPointer(4, GL.GL_FLOAT, 0, colors)
+			GL.glDrawArrays(GL.GL_QUADS, 0, len(verts)//2)
+			GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+		if pages:
+			GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+			GL.glColor4d(1, 1, 1, 1)
+			for tex, verts, coords in pages:
+				with tex:
+					GL.glVertexPointer(2, GL.GL_FLOAT, 0, verts)
+					GL.glTexCoordPointer(2, GL.GL_FLOAT, 0, coords)
+					GL.glDrawArrays(GL.GL_QUADS, 0, len(verts)//2)
+		GL.glPopClientAttrib()
+		GL.glPopAttrib()
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.glPopMatrix()
+		GL.glMatrixMode(GL.GL_MODELVIEW)
+
 class ALIGN:
 	'''An enumeration class of legal values for :attr:`Label.align` and similar
 attributes in derived classes.'''
@@ -303,19 +1120,39 @@ class Label(Widget):
 
 Since this function is useful to some other :class:`Widget`\ s, it's also the
 base class for a few.'''
-	def  __init__(self, xcell, ycell, text='', align=0, font=None, **kwargs):
+	#: Held while rendering any text, since fonts may not be used by two threads at once (class attr).
+	FONTLOCK=threading.Lock()
+	def  __init__(self, xcell, ycell, text='', align=0, font=None, defer=False, **kwargs):
 		super(Label, self).__init__(xcell, ycell, **kwargs)
-		#: A string containing the text to display.
-		self.text=text
+		self._text=text
 		self._oldtext=None
+		#(The text rasterized by Prepare, and its surface, for Update to upload)
+		self._prepared=None
+		#: Whether or not to redraw changed text as a deferred task of the
+		#: :data:`scheduler.active` :class:`scheduler.Scheduler` (if there is one),
+		#: rather than during rendering. The old text is shown until then.
+		self.defer=defer
+		self.task=None
 		#: The alignment mode (a :class:`ALIGN` bit mask).
 		self.align=align
+		if font is None:
+			import pygame
+			font=pygame.font.SysFont(pygame.font.get_default_font(), 30)
 		#: The ``pygame.Font`` object to use for rendering.
-		self.font=(pygame.font.SysFont(pygame.font.get_default_font(), 30) if font is None else font)
+		self.font=font
 		#: The :class:`scenegraph.Texture` used to store the font texture.
 		self.tex=None
 		if self.text:
 			self.Update()
+	def _get_text(self):
+		return self._text
+	def _set_text(self, text):
+		if text is not self._text:
+			self._text=text
+			self.Invalidate()
+			self.InvalidateSize()
+	#: A string containing the text to display.
+	text=property(_get_text, _set_text)
 	def Update(self, text=None):
 		'''Updates the Label, drawing the new :attr:`text` to the :attr:`tex`
 :class:`scenegraph.Texture`.
@@ -335,33 +1172,76 @@ base class for a few.'''
 	as well.'''
 		if text is None:
 			text=self.text
-		fcol=self.fcol
-		if fcol is None:
-			fcol=Vector(1, 1, 1)
-		tsurf=self.font.render(text, True, tuple(255*fcol.FastTo3()))
+		prepared=self._prepared
+		self._prepared=None
+		if prepared is not None and prepared[0] is text:
+			tsurf=prepared[1]
+		else:
+			tsurf=self.Rasterize(text)
 		if self.tex is None:
 			self.tex=Texture()
 		self.tex.surf=tsurf
 		self.tex.Reload()
+	def Rasterize(self, text):
+		'''Returns a ``pygame.Surface`` of ``text`` rendered in :attr:`font` and
+:attr:`Widget.fcol`. (This makes no GL calls.)'''
+		fcol=self.fcol
+		if fcol is None:
+			fcol=Vector(1, 1, 1)
+		with self.FONTLOCK:
+			return self.font.render(text, True, tuple(255*fcol.FastTo3()))
+	def Prepare(self):
+		'''Rasterizes the :attr:`text`, if it has changed, so that the next
+:func:`Update` only has to upload it.'''
+		text=self.text
+		prepared=self._prepared
+		if text and text is not self._oldtext and (prepared is None or prepared[0] is not text):
+			self._prepared=(text, self.Rasterize(text))
+	def Intrinsic(self):
+		'''Returns the size of the rendered :attr:`text`.'''
+		with self.FONTLOCK:
+			return Vector(*self.font.size(self.text))
+	def Emit(self, batch, x, y):
+		'''Adds the background and text to ``batch``.'''
+		size=self.size
+		clip=(x, y, x+size.x, y+size.y)
+		if self.bcol is not None:
+			batch.Rect(clip, self.bcol.FastTo4())
+		if self.text:
+			batch.Text(self.font, self.text, self.fcol, self.align, clip)
+		return True
+	def _DeferredUpdate(self):
+		text=self.text
+		self.Update(text)
+		self._oldtext=text
+		self.task=None
+		self.Invalidate()
 	def Render(self):
 		'''Renders the label using the current viewport.'''
-		glPushAttrib(GL_ENABLE_BIT)
-		glDisable(GL_TEXTURE_2D)
-		glDisable(GL_DEPTH_TEST)
+		GL.glPushAttrib(GL.GL_ENABLE_BIT)
+		GL.glDisable(GL.GL_TEXTURE_2D)
+		GL.glDisable(GL.GL_DEPTH_TEST)
 		if self.bcol is not None:
-			glColor4d(*self.bcol.FastTo4())
-			glRectdv((-1, -1), (1, 1))
+			GL.glColor4d(*self.bcol.FastTo4())
+			GL.glRectdv((-1, -1), (1, 1))
 		if self.text:
 			if self.text is not self._oldtext:
-				self.Update()
-				self._oldtext=self.text
+				if self.defer and self.tex is not None and scheduler.active is not None:
+					if self.task is None:
+						self.task=scheduler.active.Defer(self._DeferredUpdate)
+				else:
+					self.Update()
+					self._oldtext=self.text
 			self.RenderText()
-		glPopAttrib()
+		GL.glPopAttrib()
 	def RenderText(self):
 		'''Renders the text--a process which is usable by subclasses as needed.'''
-		glPushAttrib(GL_ENABLE_BIT)
+		vsz=Vector(*(GL.glGetIntegerv(GL.GL_VIEWPORT)[2:]))
+		if not (vsz.x and vsz.y):
+			#(Nothing would be visible)
+			return
+		GL.glPushAttrib(GL.GL_ENABLE_BIT)
 		tsz=Vector(*self.tex.surf.get_size())
-		vsz=Vector(*(glGetIntegerv(GL_VIEWPORT)[2:]))
 		csz=tsz/vsz
 		minima=-csz
 		maxima=csz.copy()
@@ -380,18 +1260,18 @@ base class for a few.'''
 			if not self.align&ALIGN.BOTTOM:
 				minima.y+=1-csz.y
 		with self.tex:
-			glColor4d(1, 1, 1, 1)
-			glBegin(GL_QUADS)
-			glTexCoord2d(0, 0)
-			glVertex2d(minima.x, minima.y)
-			glTexCoord2d(1, 0)
-			glVertex2d(maxima.x, minima.y)
-			glTexCoord2d(1, 1)
-			glVertex2d(maxima.x, maxima.y)
-			glTexCoord2d(0, 1)
-			glVertex2d(minima.x, maxima.y)
-			glEnd()
-		glPopAttrib()
+			GL.glColor4d(1, 1, 1, 1)
+			GL.glBegin(GL.GL_QUADS)
+			GL.glTexCoord2d(0, 0)
+			GL.glVertex2d(minima.x, minima.y)
+			GL.glTexCoord2d(1, 0)
+			GL.glVertex2d(maxima.x, minima.y)
+			GL.glTexCoord2d(1, 1)
+			GL.glVertex2d(maxima.x, maxima.y)
+			GL.glTexCoord2d(0, 1)
+			GL.glVertex2d(minima.x, maxima.y)
+			GL.glEnd()
+		GL.glPopAttrib()
 
 class ORIENT:
 	'''An enumeration of legal values for the :attr:`Slider.orient` attribute.'''
@@ -405,10 +1285,10 @@ class Slider(Label):
 value by providing an axis between two extreme values; the user is expected to
 use the mouse to select the value as a point within this range; the value is
 readable as the :attr:`value` attribute.'''
+	INTERESTS=[(EVENT.MOUSE, None), (EVENT.KBD, KBD.KEYDOWN)]
 	def __init__(self, xcell, ycell, value=0, min=0, max=1, mapfunc=None, showval=True, orient=ORIENT.HORIZONTAL, hwidth=0.05, hcol=None, kmove=0.05, **kwargs):
 		super(Slider, self).__init__(xcell, ycell, **kwargs)
-		#: The actual value of this :class:`Slider`, as modified by the user (and possibly mapped by :attr:`mapfunc`).
-		self.value=value
+		self._value=value
 		self._oldvalue=None
 		#: The smallest value this should contain.
 		self.min=min
@@ -426,6 +1306,14 @@ readable as the :attr:`value` attribute.'''
 		self.hcol=hcol
 		#: A floating-point in the range [0, 1] specifying how much a keypress should change the value (as a fraction of the entire range).
 		self.kmove=kmove
+	def _get_value(self):
+		return self._value
+	def _set_value(self, value):
+		if value!=self._value:
+			self._value=value
+			self.Invalidate()
+	#: The actual value of this :class:`Slider`, as modified by the user (and possibly mapped by :attr:`mapfunc`).
+	value=property(_get_value, _set_value)
 	@property
 	def range(self):
 		'''The computed difference between :attr:`max` and :attr:`min`.'''
@@ -459,26 +1347,47 @@ should probably be used instead.'''
 		return lambda x, n=n: int(x*n)/float(n)
 	def Render(self):
 		'''Renders the slider.'''
-		glPushAttrib(GL_ENABLE_BIT)
-		glDisable(GL_DEPTH_TEST)
-		glDisable(GL_TEXTURE_2D)
+		GL.glPushAttrib(GL.GL_ENABLE_BIT)
+		GL.glDisable(GL.GL_DEPTH_TEST)
+		GL.glDisable(GL.GL_TEXTURE_2D)
 		if self.bcol is not None:
-			glColor4d(*self.bcol.FastTo4())
-			glRectdv((-1, -1), (1, 1))
-		if self.showval and self.value!=self._oldvalue:
-			self.text=str(self.value)
-			self.Update()
+			GL.glColor4d(*self.bcol.FastTo4())
+			GL.glRectdv((-1, -1), (1, 1))
+		if self.showval:
+			if self.value!=self._oldvalue:
+				self._text=str(self.value) #(Setting value already invalidated this)
+				self.Update()
+				self._oldvalue=self.value
 			self.RenderText()
 		hcol=self.hcol
 		if hcol is None:
 			hcol=Vector(0.5, 0.5, 0.5, 0.5)
-		glColor4d(*hcol.FastTo4())
+		GL.glColor4d(*hcol.FastTo4())
 		pos=self.ratio*2-1
 		if self.orient==ORIENT.HORIZONTAL:
-			glRectdv((pos-self.hwidth, -1), (pos+self.hwidth, 1))
+			GL.glRectdv((pos-self.hwidth, -1), (pos+self.hwidth, 1))
 		else:
-			glRectdv((-1, pos-self.hwidth), (1, pos+self.hwidth))
-		glPopAttrib()
+			GL.glRectdv((-1, pos-self.hwidth), (1, pos+self.hwidth))
+		GL.glPopAttrib()
+	def Emit(self, batch, x, y):
+		'''Adds the background, value and handle to ``batch``.'''
+		size=self.size
+		clip=(x, y, x+size.x, y+size.y)
+		if self.bcol is not None:
+			batch.Rect(clip, self.bcol.FastTo4())
+		if self.showval:
+			batch.Text(self.font, str(self.value), self.fcol, self.align, clip)
+		hcol=self.hcol
+		if hcol is None:
+			hcol=Vector(0.5, 0.5, 0.5, 0.5)
+		#(The handle is in normalized coordinates, as in Render)
+		pos=self.ratio*2-1
+		if self.orient==ORIENT.HORIZONTAL:
+			rect=(x+(pos-self.hwidth+1)*size.x/2, y, x+(pos+self.hwidth+1)*size.x/2, y+size.y)
+		else:
+			rect=(x, y+(pos-self.hwidth+1)*size.y/2, x+size.x, y+(pos+self.hwidth+1)*size.y/2)
+		batch.Rect(rect, hcol.FastTo4(), clip)
+		return True
 	def Handle(self, ev):
 		if ev.type==EVENT.MOUSE:
 ##			print 'Mouse event:', ev
@@ -496,6 +1405,7 @@ should probably be used instead.'''
 				self.parent.SetGrab()
 		elif ev.type==EVENT.KBD:
 			if ev.subtype==KBD.KEYDOWN:
+				from pygame.locals import K_RIGHT, K_UP, K_LEFT, K_DOWN
 				delta=0
 				if ev.key in (K_RIGHT, K_UP):
 					delta=self.range*self.kmove
@@ -503,4 +1413,205 @@ should probably be used instead.'''
 					delta=self.range*-self.kmove
 				if delta:
 					self.value+=delta
-					self.ClampValue()
\ No newline at end of file
+					self.ClampValue()
+
+class VirtualList(Container):
+	'''A :class:`VirtualList` is a scrolling list (or, with ``columns`` greater
+than 1, grid) of ``count`` items, of which only those in view exist as widgets.
+Each row is ``rowheight`` high (in window coordinates), and as many rows as fit
+are shown, the first being item row :attr:`top`.
+
+The widgets are kept in a pool, and recycled as the list scrolls: a widget
+whose item is still in view is just moved to its new cells, and one whose item
+has gone is given one that has come into view, via :func:`Bind`. By default,
+the widgets are :class:`Label`\ s (made with the keyword arguments in the
+``labelargs`` dict, sharing one font),
+whose text is ``source(index)``; to show something else, pass a ``factory``
+(called as ``factory(xcell, ycell, parent=self)`` to make a widget), and
+override :func:`Bind`. The memory and per-frame cost thereby depend on the
+size of the view, rather than of the data.
+
+The mouse wheel scrolls the list by ``step`` rows. If the data changes, call
+:func:`Changed`.'''
+	INTERESTS=[(EVENT.MOUSE, MOUSE.WHEEL)]
+	def __init__(self, xcell, ycell, source, count, rowheight=30, columns=1, step=3, factory=None, labelargs=None, **kwargs):
+		super(VirtualList, self).__init__(Grid(LayoutVector(LayoutCell()), columns), xcell, ycell, **kwargs)
+		#: A callable returning the text of an item, given its index.
+		self.source=source
+		#: The number of items.
+		self.count=count
+		#: The height of a row, in window coordinates.
+		self.rowheight=rowheight
+		#: The number of items per row.
+		self.columns=columns
+		#: The number of rows scrolled per unit of mouse wheel movement.
+		self.step=step
+		labelargs=dict(labelargs or ())
+		if factory is None and 'font' not in labelargs:
+			import pygame
+			labelargs['font']=pygame.font.SysFont(pygame.font.get_default_font(), 30)
+		self.factory=factory
+		self.labelargs=labelargs
+		#: The index of the first row in view.
+		self.top=0
+		#: The number of rows in view.
+		self.visible=0
+		#: Maps the indices of the items in view to their widgets.
+		self.bound={}
+		#: Maps widgets in view to the indices of their items.
+		self.indices={}
+		#: Widgets not in use.
+		self.spare=[]
+		self.dirty=True
+	def Changed(self, count=None):
+		'''Note that the data has changed (and now has ``count`` items, if given),
+so that every item in view is bound again.'''
+		if count is not None:
+			self.count=count
+		for widget in self.bound.values():
+			self.Release(widget)
+		self.bound={}
+		self.indices={}
+		self.ScrollTo(self.top)
+	@property
+	def rows(self):
+		'''The number of rows of items.'''
+		return -(-self.count//self.columns)
+	def ScrollTo(self, top):
+		'''Scroll so that row ``top`` is the first in view (as far as possible).'''
+		top=max(0, min(int(top), self.rows-self.visible))
+		if top!=self.top:
+			self.top=top
+			self.dirty=True
+			self.Invalidate()
+		self.dirty=self.dirty or len(self.bound)<self.VisibleItems()
+	def Scroll(self, rows):
+		'''Scroll down by ``rows`` rows (up, if negative).'''
+		self.ScrollTo(self.top+rows)
+	def VisibleItems(self):
+		'''Returns the number of items in view.'''
+		return max(0, min(self.count-self.top*self.columns, self.visible*self.columns))
+	def Make(self, xcell, ycell):
+		'''Make a widget for the pool.'''
+		if self.factory is not None:
+			return self.factory(xcell, ycell, parent=self)
+		return Label(xcell, ycell, parent=self, **self.labelargs)
+	def Bind(self, widget, index):
+		'''Show the item ``index`` in ``widget``. By default, this sets the text of
+the (:class:`Label`) widget to ``source(index)``.'''
+		widget.text=self.source(index)
+	def Release(self, widget):
+		'''Remove a widget from view, and put it in the pool.'''
+		widget.ClearParent()
+		self.spare.append(widget)
+	def ItemAt(self, pos):
+		'''Returns the index of the item at ``pos`` (in this widget's coordinates), or ``None``.'''
+		return self.indices.get(self.ChildAt(pos))
+	def Resize(self, height):
+		'''Lay out as many rows as fit in ``height``.'''
+		visible=max(0, int(height//self.rowheight))
+		if visible==self.visible:
+			return
+		self.visible=visible
+		#Row 0 is at the top; the remainder is taken up at the bottom
+		cells=[LayoutCell()]+[LayoutCell(0, self.rowheight) for i in xrange(visible)]
+		self.grid.rows=LayoutVector(*cells)
+		self.grid.Invalidate()
+		self.ScrollTo(self.top)
+		self.dirty=True
+	def Refresh(self):
+		'''Bring the widgets up to date with the rows in view, recycling those
+whose items have left the view.'''
+		self.dirty=False
+		rowcells=self.grid.rows.cells
+		colcells=self.grid.cols.cells
+		columns=self.columns
+		first=self.top*columns
+		last=first+self.VisibleItems()
+		bound=self.bound
+		free=[widget for index, widget in bound.iteritems() if not first<=index<last]
+		nbound={}
+		indices={}
+		for index in xrange(first, last):
+			r, c=divmod(index-first, columns)
+			xcell, ycell=colcells[c], rowcells[len(rowcells)-1-r]
+			widget=bound.get(index)
+			if widget is None:
+				if free:
+					widget=free.pop()
+					widget.Move(xcell, ycell)
+				elif self.spare:
+					widget=self.spare.pop()
+					widget.Move(xcell, ycell)
+					widget.SetParent(self)
+				else:
+					widget=self.Make(xcell, ycell)
+				self.Bind(widget, index)
+			elif widget.xcell is not xcell or widget.ycell is not ycell:
+				widget.Move(xcell, ycell)
+			nbound[index]=widget
+			indices[widget]=index
+		for widget in free:
+			self.Release(widget)
+		self.bound=nbound
+		self.indices=indices
+	def PushState(self):
+		'''Lays out and refreshes the rows in view, if needed, then does as :func:`Container.PushState`.'''
+		if self.xcell is None or self.ycell is None:
+			height=GL.glGetIntegerv(GL.GL_VIEWPORT)[3]
+		else:
+			height=self.ycell.size
+		self.Resize(height)
+		if self.dirty:
+			self.Refresh()
+		super(VirtualList, self).PushState()
+	def Emit(self, batch, x, y):
+		'''Lays out and refreshes the rows in view, if needed, then does as :func:`Container.Emit`.'''
+		self.Resize(self.ycell.size)
+		if self.dirty:
+			self.Refresh()
+		return super(VirtualList, self).Emit(batch, x, y)
+	def Handle(self, ev):
+		if ev.type==EVENT.MOUSE and ev.subtype==MOUSE.WHEEL:
+			self.Scroll(-int(ev.delta.y)*self.step)
+
+class ProfileOverlay(Container):
+	'''A :class:`ProfileOverlay` is a :class:`Container` of :class:`Label`\ s
+which displays the average frame time and GL call count of the
+:data:`prof.active` profiler, followed by the ``lines`` nodes with the highest
+own time (see :func:`prof.Profiler.Summary`). The text is refreshed every
+``interval`` renders, since re-rendering the labels' textures is not free.
+
+Extra keyword arguments are passed to each :class:`Label`.'''
+	def __init__(self, xcell=None, ycell=None, lines=5, interval=15, **kwargs):
+		super(ProfileOverlay, self).__init__(Grid(lines+1, 1), xcell, ycell)
+		#: The number of :class:`Renderable`\ s to list.
+		self.lines=lines
+		#: The number of renders between text updates.
+		self.interval=interval
+		self._count=0
+		kwargs.setdefault('align', ALIGN.LEFT)
+		#: A list of :class:`Label`\ s, the first of which holds the frame totals.
+		self.labels=[Label(*self.grid.CellPair(0, len(self.grid.rows)-1-i), parent=self, **kwargs) for i in xrange(lines+1)]
+	def Refresh(self):
+		'''Updates the label text from the active profiler.'''
+		p=prof.active
+		if p is None:
+			for lbl in self.labels:
+				lbl.text=''
+			self.labels[0].text='Profiler disabled'
+			return
+		self.labels[0].text='frame %.2fms gl %d'%(p.FrameTime()*1000, p.FrameGL())
+		summ=p.Summary(self.lines)
+		for i, lbl in enumerate(self.labels[1:]):
+			if i<len(summ):
+				name, own, total, gl=summ[i]
+				lbl.text='%s %.2f/%.2fms gl %d'%(name, own*1000, total*1000, gl)
+			else:
+				lbl.text=''
+	def Render(self):
+		'''Refreshes the text (every :attr:`interval` renders) and renders the labels.'''
+		if self._count%self.interval==0:
+			self.Refresh()
+		self._count+=1
+		super(ProfileOverlay, self).Render()
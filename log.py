@@ -3,14 +3,41 @@
 log -- Logging
 
 This module basically does nothing but set up the ``logging`` module proper.
+Importing it has no side effects beyond creating the :data:`main` logger; no
+output is produced until :func:`Init` is called (usually by :func:`engine.Init`).
+
+Since the engine logs from inside the frame, none of the work of logging is
+allowed to block it:
+
+* :class:`AsyncHandler` hands records to a background thread, which formats
+  and writes them in batches.
+* :class:`RateLimit` keeps any one logger from flooding the output.
+* :class:`FlightRecorder` keeps the most recent records in memory, and only
+  writes them out when an error is logged.
+* :class:`Guard` objects answer "is this level enabled?" with a single
+  attribute lookup, cheaply enough to be left in ``Render`` paths::
+
+	guard=log.Guard(logger)
+	...
+	if guard.DV3:
+		logger.log(DV3, 'Rendering %s', obCode(self))
 
 The entire rest of the ``logging`` namespace is otherwise available on this module.
 '''
 
 from logging import *
 
+import atexit
 import base64
-import binascii
+import struct
+import weakref
+import threading
+import collections
+from timeit import default_timer as clock
+try:
+	import Queue as queue
+except ImportError:
+	import queue
 
 DV1=5
 DV2=2
@@ -20,24 +47,210 @@ addLevelName(DV1, 'DV1') #Debug Verbosity 1
 addLevelName(DV2, 'DV2') #Debug Verbosity 2
 addLevelName(DV3, 'DV3') #Debug Verbosity 3
 
-fm=Formatter('%(levelname)-8s %(relativeCreated)-6d [%(name)s] %(msg)s')
+fm=Formatter('%(levelname)-8s %(relativeCreated)-6d [%(name)s] %(message)s')
 
 main=getLogger('ms')
-main.setLevel(DV3)
+main.setLevel(WARNING) #Until Init() says otherwise
+main.addHandler(NullHandler())
+
+#: The handler installed by :func:`Init`, or ``None``.
+hand=None
+
+class AsyncHandler(Handler):
+	'''An :class:`AsyncHandler` queues records for a background thread, which
+formats them and writes them to ``stream`` in batches of up to ``batch`` records,
+flushing once per batch. The logging thread never waits: if more than ``size``
+records are waiting, further records are dropped (and counted in :attr:`dropped`)
+until the writer catches up.
+
+.. note::
+
+	Records are formatted on the background thread, so arguments passed to a
+	logging call should not be mutated afterward, or the log may show the later
+	value.'''
+	def __init__(self, stream, size=4096, batch=256):
+		Handler.__init__(self)
+		#: The file-like object written to.
+		self.stream=stream
+		#: The largest number of records written per batch.
+		self.batch=batch
+		#: The number of records dropped because the queue was full.
+		self.dropped=0
+		self.queue=queue.Queue(size)
+		self.thread=threading.Thread(target=self._Run, name='log writer')
+		self.thread.daemon=True
+		self.thread.start()
+	def emit(self, record):
+		try:
+			self.queue.put_nowait(record)
+		except queue.Full:
+			self.dropped+=1
+	def _Run(self):
+		q=self.queue
+		while True:
+			records=[q.get()]
+			try:
+				while len(records)<self.batch:
+					records.append(q.get_nowait())
+			except queue.Empty:
+				pass
+			done=(records[-1] is None)
+			lines=[]
+			for record in records:
+				if record is None:
+					continue
+				try:
+					lines.append(self.format(record))
+				except Exception:
+					self.handleError(record)
+			if lines:
+				self.stream.write('\n'.join(lines)+'\n')
+				self.stream.flush()
+			if done:
+				return
+	def close(self):
+		'''Write out everything queued so far, then stop the writer thread.'''
+		if self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join()
+		Handler.close(self)
+
+class RateLimit(Filter):
+	'''A ``logging.Filter`` which passes at most ``rate`` records per second
+(with bursts of up to ``burst`` records) from any one logger. When records from
+a logger are let through again after some were suppressed, the message notes
+how many were lost.'''
+	def __init__(self, rate=50, burst=None):
+		Filter.__init__(self)
+		#: The sustained number of records per second allowed per logger.
+		self.rate=float(rate)
+		#: The largest number of records allowed at once.
+		self.burst=float(rate if burst is None else burst)
+		self.buckets={}
+	def filter(self, record):
+		now=clock()
+		bucket=self.buckets.get(record.name)
+		if bucket is None:
+			bucket=self.buckets[record.name]=[self.burst, now, 0] #Tokens, last time, suppressed
+		bucket[0]=min(self.burst, bucket[0]+(now-bucket[1])*self.rate)
+		bucket[1]=now
+		if bucket[0]<1:
+			bucket[2]+=1
+			return False
+		bucket[0]-=1
+		if bucket[2]:
+			record.msg='%s [%d suppressed]'%(record.msg, bucket[2])
+			bucket[2]=0
+		return True
+
+class FlightRecorder(Handler):
+	'''A :class:`FlightRecorder` keeps the last ``capacity`` records in a ring
+buffer, writing nothing until a record at ``flushlevel`` or above arrives, at
+which point the whole buffer (ending with that record) is passed to ``target``.
+This allows verbose logging to be left on, at little cost, while still getting
+the context leading up to an error.'''
+	def __init__(self, target, capacity=1024, flushlevel=ERROR):
+		Handler.__init__(self)
+		#: The ``logging.Handler`` to which records are flushed.
+		self.target=target
+		#: The level at which the buffer is flushed.
+		self.flushlevel=flushlevel
+		self.buffer=collections.deque(maxlen=capacity)
+	def emit(self, record):
+		self.buffer.append(record)
+		if record.levelno>=self.flushlevel:
+			self.Dump()
+	def Dump(self):
+		'''Pass every buffered record to :attr:`target`, emptying the buffer.'''
+		buf=self.buffer
+		while buf:
+			self.target.handle(buf.popleft())
+	def flush(self):
+		'''Flush :attr:`target` (but not the buffer, which is only written out on
+an error--``logging.shutdown`` flushes every handler at exit).'''
+		self.target.flush()
+	def close(self):
+		self.target.close()
+		Handler.close(self)
+
+class Guard(object):
+	'''A :class:`Guard` has a boolean attribute for each level name (``DV3``,
+``DV2``, ``DV1``, ``DEBUG``, ``INFO``, ``WARNING``, ``ERROR``, ``CRITICAL``)
+which is true iff ``logger`` (by default, :data:`main`) is enabled for that
+level. The attributes are kept up to date by :func:`SetLevel` and :func:`Init`;
+if you change a logger's level directly, call :func:`Refresh`.'''
+	LEVELS={'DV3': DV3, 'DV2': DV2, 'DV1': DV1, 'DEBUG': DEBUG, 'INFO': INFO,
+			'WARNING': WARNING, 'ERROR': ERROR, 'CRITICAL': CRITICAL}
+	#: A ``weakref.WeakSet`` of every :class:`Guard` in use (class attr).
+	ALL=weakref.WeakSet()
+	def __init__(self, logger=None):
+		#: The ``logging.Logger`` this guard reflects.
+		self.logger=(main if logger is None else logger)
+		self.Refresh()
+		self.ALL.add(self)
+	def Refresh(self):
+		'''Recompute the level attributes.'''
+		level=self.logger.getEffectiveLevel()
+		for name, lvl in self.LEVELS.iteritems():
+			setattr(self, name, lvl>=level)
+
+def Refresh():
+	'''Refresh every :class:`Guard`.'''
+	for guard in list(Guard.ALL):
+		guard.Refresh()
+
+def SetLevel(level, logger=None):
+	'''Set the level of ``logger`` (by default, :data:`main`) and refresh the
+:class:`Guard`\ s.'''
+	(main if logger is None else logger).setLevel(level)
+	Refresh()
+
+def Init(path='log.txt', level=DV3, background=True, rate=None, recorder=None):
+	'''Direct the :data:`main` logger's output (at ``level`` and above) to the
+file at ``path`` (which is truncated). Calling this again replaces the previous
+handler.
 
-hand=StreamHandler(open('log.txt', 'w'))
-hand.setLevel(DV3)
-hand.setFormatter(fm)
+If ``background`` is true, the file is written by an :class:`AsyncHandler`. If
+``rate`` is given, each logger is limited to that many records per second (see
+:class:`RateLimit`). If ``recorder`` is given, records are kept in a
+:class:`FlightRecorder` of that capacity, and only written when an error is
+logged.'''
+	global hand
+	if hand is not None:
+		main.removeHandler(hand)
+		hand.close()
+	stream=open(path, 'w')
+	if background:
+		hand=AsyncHandler(stream)
+	else:
+		hand=StreamHandler(stream)
+	hand.setFormatter(fm)
+	if recorder is not None:
+		hand=FlightRecorder(hand, recorder)
+	if rate is not None:
+		hand.addFilter(RateLimit(rate))
+	hand.setLevel(level)
+	main.addHandler(hand)
+	SetLevel(level)
+	main.info('Logging system ready.')
 
-main.addHandler(hand)
+@atexit.register
+def _Shutdown():
+	if hand is not None:
+		hand.close()
 
-main.info('Logging system ready.')
+#: The largest number of entries cached by :func:`obCode` before the cache is emptied.
+OBCODE_CACHE=4096
+_obcodes={}
 
 def obCode(obj):
-	#Fast to bitstring
-	s=''
+	'''Returns a short string identifying ``obj`` (a base64 encoding of its
+``id``). The codes are cached, so repeated calls for the same object cost one
+dictionary lookup.'''
 	i=id(obj)
-	while i>0:
-		s=chr(i%256)
-		i/=256
-	return base64.b64encode(s)
\ No newline at end of file
+	code=_obcodes.get(i)
+	if code is None:
+		if len(_obcodes)>=OBCODE_CACHE:
+			_obcodes.clear()
+		code=_obcodes[i]=base64.urlsafe_b64encode(struct.pack('<Q', i).rstrip('\0')).rstrip('=')
+	return code
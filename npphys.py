@@ -0,0 +1,601 @@
+'''
+.. mindscape -- Mindscape Engine
+npphys -- NumPy Physics
+=======================
+
+This module implements :class:`NumpyBackend`, a :class:`phys.Backend` written
+entirely with ``numpy`` array operations, so that it needs no native libraries.
+It supports spheres and boxes (not triangle meshes), and is intended both as a
+fallback when PyODE isn't installed and as a baseline for benchmarks.
+
+The state of every body (position, velocity, orientation, inverse mass, ...)
+lives in one row of a set of arrays in the :class:`World`, and the state of
+every geometry in a row of the arrays of the :class:`Space`; the objects handed
+out (:class:`NPBody`, :class:`NPGeom`) are just indices into them, with PyODE-like
+accessors. Row 0 of the world is reserved for the static environment (infinite
+mass, never moving), to which geometries without a body belong.
+
+Each step:
+
+* integrates velocities (semi-implicit Euler) under gravity and applied forces;
+* finds candidate pairs of geometries with a uniform grid (geometries much
+  larger than the grid cells, such as floors, are tested against everything),
+  and drops those whose masks don't match, that are excluded, or whose bodies
+  are both asleep (or static);
+* computes contacts (sphere-sphere and sphere-box exactly; box-box as the
+  overlap of their world-space bounding boxes);
+* resolves them with a few iterations of simultaneous (Jacobi) impulses, with
+  restitution and Coulomb friction (see :class:`phys.Contact`), splitting the
+  impulse between all the contacts on a body;
+* integrates positions and orientations, and pushes overlapping bodies apart;
+* puts bodies to sleep (see :class:`phys.Sleep`) once they have been slow for
+  long enough (:attr:`World.idle` is the time each has been slow). Sleeping
+  bodies are treated as static, so that a pile settles from the bottom up, until
+  a body hits them (approaching faster than a resting contact would).
+
+Contacts only apply linear impulses (no torques), so bodies only spin if given
+an angular velocity.
+'''
+
+import numpy
+
+from phys import Backend, SIM
+from log import main, DV1, DV2, DV3, obCode
+logger=main.getChild('npphys')
+
+class GEOM:
+	'''An enumeration of the kinds of geometry supported.'''
+	SPHERE=0
+	BOX=1
+
+def Rotations(quat):
+	'''Returns the ``(N, 3, 3)`` rotation matrices of the ``(N, 4)`` unit quaternions ``quat``.'''
+	w, x, y, z=quat[:, 0], quat[:, 1], quat[:, 2], quat[:, 3]
+	r=numpy.empty((len(quat), 3, 3), numpy.float64)
+	r[:, 0, 0]=1-2*(y*y+z*z)
+	r[:, 0, 1]=2*(x*y-w*z)
+	r[:, 0, 2]=2*(x*z+w*y)
+	r[:, 1, 0]=2*(x*y+w*z)
+	r[:, 1, 1]=1-2*(x*x+z*z)
+	r[:, 1, 2]=2*(y*z-w*x)
+	r[:, 2, 0]=2*(x*z-w*y)
+	r[:, 2, 1]=2*(y*z+w*x)
+	r[:, 2, 2]=1-2*(x*x+y*y)
+	return r
+
+def _Grow(arr, size, fill=0):
+	grown=numpy.empty((size,)+arr.shape[1:], arr.dtype)
+	grown[:len(arr)]=arr
+	grown[len(arr):]=fill
+	return grown
+
+class World(object):
+	'''The bodies of a :class:`NumpyBackend` environment, as arrays with one row per body.'''
+	FIELDS=(('pos', (3,), 0), ('prevpos', (3,), 0), ('vel', (3,), 0), ('force', (3,), 0),
+			('quat', (4,), 0), ('prevquat', (4,), 0), ('angvel', (3,), 0),
+			('invmass', (), 1), ('invinertia', (3,), 2.5), ('idle', (), 0))
+	def __init__(self, capacity=64):
+		for name, shape, fill in self.FIELDS:
+			setattr(self, name, numpy.full((capacity,)+shape, fill, numpy.float64))
+		self.quat[:, 0]=1
+		self.prevquat[:, 0]=1
+		#: The number of rows in use (including the static row 0).
+		self.n=1
+		self.invmass[0]=0
+		self.invinertia[0]=0
+		self.gravity=numpy.zeros(3)
+		#: The :class:`phys.Sleep` parameters, or ``None``.
+		self.sleep=None
+		#: A body is asleep if its :attr:`idle` time is at least this.
+		self.sleeptime=numpy.inf
+	def Wake(self, index):
+		self.idle[index]=0
+	def getGravity(self):
+		return tuple(self.gravity)
+	def setGravity(self, grav):
+		self.gravity[:]=grav
+	def Add(self):
+		'''Returns the index of a new body row.'''
+		if self.n>=len(self.pos):
+			size=2*len(self.pos)
+			for name, shape, fill in self.FIELDS:
+				setattr(self, name, _Grow(getattr(self, name), size, fill))
+			self.quat[self.n:, 0]=1
+			self.prevquat[self.n:, 0]=1
+		index=self.n
+		self.n+=1
+		return index
+
+class NPBody(object):
+	'''A body of a :class:`World`, with PyODE-like accessors.'''
+	__slots__=('world', 'index')
+	def __init__(self, world, index):
+		self.world=world
+		self.index=index
+	def getPosition(self):
+		return tuple(self.world.pos[self.index])
+	def setPosition(self, pos):
+		self.world.pos[self.index]=pos
+		self.world.Wake(self.index)
+	def getQuaternion(self):
+		return tuple(self.world.quat[self.index])
+	def setQuaternion(self, quat):
+		self.world.quat[self.index]=quat
+		self.world.Wake(self.index)
+	def getLinearVel(self):
+		return tuple(self.world.vel[self.index])
+	def setLinearVel(self, vel):
+		self.world.vel[self.index]=vel
+		self.world.Wake(self.index)
+	def getAngularVel(self):
+		return tuple(self.world.angvel[self.index])
+	def setAngularVel(self, vel):
+		self.world.angvel[self.index]=vel
+		self.world.Wake(self.index)
+	def addForce(self, force):
+		self.world.force[self.index]+=force
+		self.world.Wake(self.index)
+	def isEnabled(self):
+		return self.world.idle[self.index]<self.world.sleeptime
+	def enable(self):
+		self.world.Wake(self.index)
+	def disable(self):
+		self.world.idle[self.index]=numpy.inf
+		self.world.vel[self.index]=0
+		self.world.angvel[self.index]=0
+
+class Space(object):
+	'''The geometries of a :class:`NumpyBackend` environment, as arrays with one
+row per geometry. ``cell`` is the size of the broadphase grid cells; if
+``None``, it is twice the largest radius of any geometry attached to a body.'''
+	FIELDS=(('kind', (), numpy.int8, 0), ('body', (), numpy.intp, 0), ('alive', (), bool, False),
+			('radius', (), numpy.float64, 0), ('half', (3,), numpy.float64, 0),
+			('gpos', (3,), numpy.float64, 0), ('gquat', (4,), numpy.float64, 0),
+			('category', (), numpy.uint32, 0xFFFFFFFF), ('collidemask', (), numpy.uint32, 0xFFFFFFFF),
+			('notify', (), bool, False))
+	def __init__(self, world, capacity=64, cell=None):
+		self.world=world
+		for name, shape, dtype, fill in self.FIELDS:
+			setattr(self, name, numpy.full((capacity,)+shape, fill, dtype))
+		self.gquat[:, 0]=1
+		#: The number of rows in use.
+		self.n=0
+		#: The broadphase cell size, or ``None`` for automatic.
+		self.cell=cell
+		#: The number of candidate pairs found by the last broadphase.
+		self.candidates=0
+		#: The sorted keys (see :func:`PairKeys`) of the excluded pairs of geometries.
+		self.excluded=numpy.zeros(0, numpy.int64)
+	def Add(self, kind, radius, half):
+		if self.n>=len(self.kind):
+			size=2*len(self.kind)
+			for name, shape, dtype, fill in self.FIELDS:
+				setattr(self, name, _Grow(getattr(self, name), size, fill))
+			self.gquat[self.n:, 0]=1
+		i=self.n
+		self.n+=1
+		self.kind[i]=kind
+		self.alive[i]=True
+		self.radius[i]=radius
+		self.half[i]=half
+		return NPGeom(self, i)
+	def remove(self, geom):
+		self.alive[geom.index]=False
+
+class NPGeom(object):
+	'''A geometry of a :class:`Space`, with PyODE-like accessors.'''
+	__slots__=('space', 'index')
+	def __init__(self, space, index):
+		self.space=space
+		self.index=index
+	def setBody(self, body):
+		self.space.body[self.index]=(0 if body is None else body.index)
+	def getBody(self):
+		b=self.space.body[self.index]
+		return (None if b==0 else NPBody(self.space.world, b))
+	def getPosition(self):
+		b=self.space.body[self.index]
+		return tuple(self.space.world.pos[b] if b else self.space.gpos[self.index])
+	def setPosition(self, pos):
+		b=self.space.body[self.index]
+		if b:
+			self.space.world.pos[b]=pos
+		else:
+			self.space.gpos[self.index]=pos
+	def getQuaternion(self):
+		b=self.space.body[self.index]
+		return tuple(self.space.world.quat[b] if b else self.space.gquat[self.index])
+	def setQuaternion(self, quat):
+		b=self.space.body[self.index]
+		if b:
+			self.space.world.quat[b]=quat
+		else:
+			self.space.gquat[self.index]=quat
+	def getRadius(self):
+		return self.space.radius[self.index]
+	def setRadius(self, radius):
+		self.space.radius[self.index]=radius
+	def getLengths(self):
+		return tuple(2*self.space.half[self.index])
+	def setLengths(self, dims):
+		half=numpy.asarray(dims, numpy.float64)/2
+		self.space.half[self.index]=half
+		self.space.radius[self.index]=numpy.sqrt(half.dot(half))
+	def getCategoryBits(self):
+		return int(self.space.category[self.index])
+	def setCategoryBits(self, bits):
+		self.space.category[self.index]=bits
+	def getCollideBits(self):
+		return int(self.space.collidemask[self.index])
+	def setCollideBits(self, bits):
+		self.space.collidemask[self.index]=bits
+
+#All 27 neighbouring cells (including the cell itself), and the 13 "after" a
+#cell plus the cell itself, so that each pair of neighbouring cells is visited once.
+_ALL=[(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+_OFFSETS=[off for off in _ALL if off>=(0, 0, 0)]
+_BIAS=1<<20
+
+def _Keys(cells):
+	c=cells+_BIAS
+	return (c[:, 0]<<42)|(c[:, 1]<<21)|c[:, 2]
+
+def PairKeys(i, j):
+	'''Returns an order-independent int64 key for each pair of geometry indices.'''
+	i=numpy.asarray(i, numpy.int64)
+	j=numpy.asarray(j, numpy.int64)
+	return (numpy.minimum(i, j)<<32)|numpy.maximum(i, j)
+
+def _Ranges(starts, counts):
+	'''Returns the concatenation of ``arange(s, s+c)`` for each start and count.'''
+	total=counts.sum()
+	if not total:
+		return numpy.zeros(0, numpy.intp)
+	offsets=numpy.cumsum(counts)-counts
+	return numpy.repeat(starts-offsets, counts)+numpy.arange(total)
+
+class NumpyBackend(Backend):
+	'''A :class:`phys.Backend` implemented with ``numpy``; see the module
+documentation. The space type of the :class:`phys.Environment` is ignored
+(the broadphase is always a uniform grid, with cells of size ``cell``; see
+:class:`Space`), and the simulation type selects the number of impulse
+iterations (:attr:`ITERATIONS`).'''
+	#: The number of impulse iterations per step for each :class:`phys.SIM`.
+	ITERATIONS={SIM.NORMAL: 8, SIM.QUICK: 3}
+	#: The fraction of the overlap corrected each step.
+	CORRECTION=0.4
+	#: The overlap that is tolerated without correction.
+	SLOP=0.005
+	def __init__(self, cell=None):
+		self.cell=cell
+	def World(self, env):
+		return World()
+	def Space(self, env, stype):
+		return Space(env.world, cell=self.cell)
+	def Body(self, env):
+		return NPBody(env.world, env.world.Add())
+	def SetMass(self, body, mass):
+		w=body.world
+		w.invmass[body.index]=(1.0/mass.mass if mass.mass>0 else 0.0)
+		diag=numpy.diag(mass.inertia)
+		w.invinertia[body.index]=numpy.where(diag>0, 1.0/numpy.where(diag>0, diag, 1), 0)
+	def Sphere(self, env, radius):
+		return env.space.Add(GEOM.SPHERE, radius, (radius, radius, radius))
+	def Box(self, env, dims):
+		half=numpy.asarray(dims, numpy.float64)/2
+		return env.space.Add(GEOM.BOX, numpy.sqrt(half.dot(half)), half)
+	def Key(self, geom):
+		return geom.index
+	def SetNotify(self, env, geom, notify):
+		env.space.notify[geom.geom.index]=notify
+	def SetSleep(self, env, sleep):
+		w=env.world
+		w.sleep=sleep
+		w.sleeptime=(numpy.inf if sleep is None else sleep.time)
+	def Exclude(self, env, geom1, geom2, exclude=True):
+		sp=env.space
+		key=PairKeys([geom1.geom.index], [geom2.geom.index])
+		if exclude:
+			sp.excluded=numpy.union1d(sp.excluded, key)
+		else:
+			sp.excluded=numpy.setdiff1d(sp.excluded, key)
+	def TriMeshData(self, vertices, indices):
+		raise NotImplementedError('The NumPy physics backend supports only spheres and boxes')
+	def TriMesh(self, env, data):
+		raise NotImplementedError('The NumPy physics backend supports only spheres and boxes')
+	def Save(self, env):
+		w=env.world
+		w.prevpos[:w.n]=w.pos[:w.n]
+		w.prevquat[:w.n]=w.quat[:w.n]
+	def Reset(self, body):
+		w=body.body.world
+		i=body.body.index
+		w.prevpos[i]=w.pos[i]
+		w.prevquat[i]=w.quat[i]
+	def Poses(self, env, bodies):
+		w=env.world
+		idx=numpy.fromiter((b.body.index for b in bodies), numpy.intp, len(bodies))
+		return w.prevpos[idx], w.pos[idx], w.prevquat[idx], w.quat[idx]
+	def Step(self, env, size):
+		w=env.world
+		n=w.n
+		vel=w.vel[:n]
+		invmass=w.invmass[:n]
+		awake=(invmass>0)&(w.idle[:n]<w.sleeptime)
+		vel[awake]+=(w.gravity+w.force[:n][awake]*invmass[awake, None])*size
+		w.force[:n]=0
+		#Only search around the awake bodies if any are asleep
+		a, b, normal, depth, ga, gb=self.Collide(env, (awake if (awake!=(invmass>0)).any() else None))
+		if w.sleep is not None:
+			start=w.pos[:n].copy()
+			impact=((vel[b]-vel[a])*normal).sum(1)<-self.Rest(env, size)
+		if len(a):
+			self.Resolve(env, a, b, normal, depth, size, awake)
+		w.pos[:n]+=vel*size
+		self.Rotate(w, size)
+		if w.sleep is not None:
+			self.Sleep(w, awake, start, a[impact], b[impact], size)
+		self.Touches(env, ga, gb, normal, depth)
+		return len(a)
+	def Rest(self, env, size):
+		'''Returns the approach speed below which a contact is resting, rather than an impact.'''
+		g=env.world.gravity
+		return env.contact.bouncevel+numpy.sqrt(g.dot(g))*size
+	def Sleep(self, w, awake, start, a, b, size):
+		'''Advance the idle times of the ``awake`` bodies (which were at ``start``
+before the step), wake sleeping bodies hit by moving ones (the impacts ``(a,
+b)``), and stop the bodies that are asleep.'''
+		n=w.n
+		sleep=w.sleep
+		idle=w.idle[:n]
+		#Speed is judged by the distance moved, which is steadier than the velocity of a resting body
+		moved=w.pos[:n]-start
+		slow=(((moved**2).sum(1)<(sleep.linear*size)**2)&((w.angvel[:n]**2).sum(1)<sleep.angular**2))
+		idle[awake]=numpy.where(slow[awake], idle[awake]+size, 0)
+		asleep=idle>=w.sleeptime
+		idle[a[asleep[a]&awake[b]]]=0
+		idle[b[asleep[b]&awake[a]]]=0
+		asleep=idle>=w.sleeptime
+		w.vel[:n][asleep]=0
+		w.angvel[:n][asleep]=0
+	def Touches(self, env, ga, gb, normal, depth):
+		'''Set :attr:`touches` from the contacts between the geometries ``ga`` and
+``gb``. The contact point given is the midpoint of the geometries' centers.'''
+		sp=env.space
+		note=numpy.flatnonzero(sp.notify[ga]|sp.notify[gb])
+		if not len(note):
+			self.touches=()
+			return
+		ga=ga[note]
+		gb=gb[note]
+		center, quat=self.Centers(env, numpy.concatenate((ga, gb)))
+		pos=(center[:len(ga)]+center[len(ga):])/2
+		self.touches=zip(ga.tolist(), gb.tolist(), pos.tolist(), normal[note].tolist(), depth[note].tolist())
+	def Rotate(self, w, size):
+		'''Integrate the orientations of the bodies with nonzero angular velocity.'''
+		n=w.n
+		spin=numpy.flatnonzero(numpy.any(w.angvel[:n]!=0, axis=1))
+		if not len(spin):
+			return
+		q=w.quat[spin]
+		o=w.angvel[spin]
+		dq=numpy.empty_like(q)
+		#0.5*(0, o)*q
+		dq[:, 0]=-(o*q[:, 1:]).sum(1)
+		dq[:, 1:]=q[:, :1]*o+numpy.cross(o, q[:, 1:])
+		q+=0.5*size*dq
+		q/=numpy.sqrt((q*q).sum(1))[:, None]
+		w.quat[spin]=q
+	def Centers(self, env, idx):
+		'''Returns the world positions and orientations of the geometries ``idx``.'''
+		sp=env.space
+		w=env.world
+		body=sp.body[idx]
+		attached=(body>0)[:, None]
+		return (numpy.where(attached, w.pos[body], sp.gpos[idx]),
+				numpy.where(attached, w.quat[body], sp.gquat[idx]))
+	def Pairs(self, env, idx, center, radius, active=None):
+		'''Returns candidate pairs (as positions in ``idx``) of geometries whose
+bounding spheres may overlap. If ``active`` (a boolean array over ``idx``) is
+given, only pairs including an active geometry are returned; only the cells
+around active geometries are searched, so the cost falls with their number.'''
+		sp=env.space
+		body=sp.body[idx]
+		cell=sp.cell
+		if cell is None:
+			moving=radius[body>0]
+			cell=(2*moving.max() if len(moving) else 1.0)
+		large=radius>cell/2
+		small=numpy.flatnonzero(~large)
+		firsts=[]
+		seconds=[]
+		if len(small):
+			cells=numpy.floor(center[small]/cell).astype(numpy.int64)
+			keys=_Keys(cells)
+			order=numpy.argsort(keys, kind='mergesort')
+			sk=keys[order]
+			if active is None:
+				queries=numpy.arange(len(small))
+				offsets=_OFFSETS
+			else:
+				#Search all around each active geometry; a pair of active geometries
+				#is then found from both sides, so keep it from one
+				queries=numpy.flatnonzero(active[small])
+				offsets=_ALL
+				passive=~active[small]
+			for off in offsets:
+				nk=_Keys(cells[queries]+off)
+				lo=numpy.searchsorted(sk, nk, 'left')
+				hi=numpy.searchsorted(sk, nk, 'right')
+				counts=hi-lo
+				first=numpy.repeat(queries, counts)
+				second=order[_Ranges(lo, counts)]
+				if active is not None:
+					keep=passive[second]|(first<second)
+					first=first[keep]
+					second=second[keep]
+				elif off==(0, 0, 0):
+					keep=first<second
+					first=first[keep]
+					second=second[keep]
+				firsts.append(small[first])
+				seconds.append(small[second])
+		for i in numpy.flatnonzero(large):
+			others=numpy.arange(len(idx))
+			others=others[(others!=i)&(~large|(others>i))]
+			if active is not None and not active[i]:
+				others=others[active[others]]
+			firsts.append(numpy.full(len(others), i, numpy.intp))
+			seconds.append(others)
+		if not firsts:
+			return numpy.zeros(0, numpy.intp), numpy.zeros(0, numpy.intp)
+		return numpy.concatenate(firsts), numpy.concatenate(seconds)
+	def Collide(self, env, awake=None):
+		'''Returns the contacts of the current state, as ``(a, b, normal, depth,
+ga, gb)``: the body indices of each pair, the unit normals (pointing from ``a``
+to ``b``), the penetration depths, and the geometry indices of each pair. If
+``awake`` (a boolean array over the bodies) is given, pairs where neither body
+is awake are skipped by the broadphase.'''
+		sp=env.space
+		idx=numpy.flatnonzero(sp.alive[:sp.n])
+		center, quat=self.Centers(env, idx)
+		radius=sp.radius[idx]
+		body=sp.body[idx]
+		i, j=self.Pairs(env, idx, center, radius, (None if awake is None else awake[body]))
+		sp.candidates=len(i)
+		self.pairs=len(i)
+		#Skip pairs on the same body (including both static), pairs whose masks
+		#don't match, and excluded pairs
+		keep=body[i]!=body[j]
+		cat=sp.category[idx]
+		col=sp.collidemask[idx]
+		keep&=((cat[i]&col[j])!=0)&((cat[j]&col[i])!=0)
+		i=i[keep]
+		j=j[keep]
+		if len(sp.excluded):
+			keep=~numpy.in1d(PairKeys(idx[i], idx[j]), sp.excluded, assume_unique=False)
+			i=i[keep]
+			j=j[keep]
+		#...and pairs whose bounding spheres don't meet
+		d=center[j]-center[i]
+		keep=(d*d).sum(1)<(radius[i]+radius[j])**2
+		i=i[keep]
+		j=j[keep]
+		if env.filter is not None and len(i):
+			geoms=env.geoms
+			filt=env.filter
+			keep=numpy.fromiter((filt(geoms.get(p), geoms.get(q)) for p, q in zip(idx[i].tolist(), idx[j].tolist())), bool, len(i))
+			i=i[keep]
+			j=j[keep]
+		self.tests=len(i)
+		kind=sp.kind[idx]
+		#Order each pair so that a sphere, if any, comes second
+		swap=(kind[j]==GEOM.BOX)&(kind[i]==GEOM.SPHERE)
+		i, j=numpy.where(swap, j, i), numpy.where(swap, i, j)
+		half=sp.half[idx]
+		results=[]
+		ss=(kind[i]==GEOM.SPHERE)&(kind[j]==GEOM.SPHERE)
+		if ss.any():
+			results.append(self._SphereSphere(i[ss], j[ss], center, radius))
+		bs=(kind[i]==GEOM.BOX)&(kind[j]==GEOM.SPHERE)
+		if bs.any():
+			results.append(self._BoxSphere(i[bs], j[bs], center, quat, half, radius))
+		bb=(kind[i]==GEOM.BOX)&(kind[j]==GEOM.BOX)
+		if bb.any():
+			results.append(self._BoxBox(i[bb], j[bb], center, quat, half))
+		if not results:
+			none=numpy.zeros(0, numpy.intp)
+			return none, none, numpy.zeros((0, 3)), numpy.zeros(0), none, none
+		a=numpy.concatenate([r[0] for r in results])
+		b=numpy.concatenate([r[1] for r in results])
+		return (body[a], body[b], numpy.concatenate([r[2] for r in results]), numpy.concatenate([r[3] for r in results]),
+				idx[a], idx[b])
+	@staticmethod
+	def _Hits(i, j, normal, depth):
+		hit=depth>0
+		return i[hit], j[hit], normal[hit], depth[hit]
+	def _SphereSphere(self, i, j, center, radius):
+		d=center[j]-center[i]
+		dist=numpy.sqrt((d*d).sum(1))
+		safe=numpy.where(dist>0, dist, 1)
+		normal=numpy.where((dist>0)[:, None], d/safe[:, None], (0, 1, 0))
+		return self._Hits(i, j, normal, radius[i]+radius[j]-dist)
+	def _BoxSphere(self, i, j, center, quat, half, radius):
+		rot=Rotations(quat[i])
+		h=half[i]
+		local=numpy.einsum('kji,kj->ki', rot, center[j]-center[i])
+		clamped=numpy.clip(local, -h, h)
+		closest=center[i]+numpy.einsum('kij,kj->ki', rot, clamped)
+		d=center[j]-closest
+		dist=numpy.sqrt((d*d).sum(1))
+		inside=dist==0
+		safe=numpy.where(inside, 1, dist)
+		normal=d/safe[:, None]
+		depth=radius[j]-dist
+		if inside.any():
+			#The center is inside the box; push out through the nearest face
+			k=numpy.flatnonzero(inside)
+			pen=h[k]-numpy.abs(local[k])
+			axis=numpy.argmin(pen, 1)
+			sign=numpy.where(local[k, axis]<0, -1.0, 1.0)
+			normal[k]=rot[k, :, axis]*sign[:, None]
+			depth[k]=radius[j][k]+pen[numpy.arange(len(k)), axis]
+		return self._Hits(i, j, normal, depth)
+	def _BoxBox(self, i, j, center, quat, half):
+		ext_i=numpy.einsum('kij,kj->ki', numpy.abs(Rotations(quat[i])), half[i])
+		ext_j=numpy.einsum('kij,kj->ki', numpy.abs(Rotations(quat[j])), half[j])
+		d=center[j]-center[i]
+		overlap=ext_i+ext_j-numpy.abs(d)
+		axis=numpy.argmin(overlap, 1)
+		rows=numpy.arange(len(i))
+		depth=overlap[rows, axis]
+		depth[(overlap<=0).any(1)]=0
+		normal=numpy.zeros((len(i), 3))
+		normal[rows, axis]=numpy.where(d[rows, axis]<0, -1.0, 1.0)
+		return self._Hits(i, j, normal, depth)
+	def Resolve(self, env, a, b, normal, depth, size, awake=None):
+		'''Apply contact impulses and position corrections to the bodies. If
+``awake`` (a boolean array over the bodies) is given, the others are treated as
+static.'''
+		w=env.world
+		c=env.contact
+		vel=w.vel
+		wa=w.invmass[a]
+		wb=w.invmass[b]
+		if awake is not None:
+			wa=numpy.where(awake[a], wa, 0)
+			wb=numpy.where(awake[b], wb, 0)
+		wsum=wa+wb
+		ok=wsum>0
+		a, b, normal, depth, wa, wb, wsum=a[ok], b[ok], normal[ok], depth[ok], wa[ok], wb[ok], wsum[ok]
+		#Each body's share of the impulse is divided among its contacts
+		share=numpy.bincount(numpy.concatenate((a, b)), minlength=w.n).astype(numpy.float64)
+		share[0]=1
+		wa=wa/share[a]
+		wb=wb/share[b]
+		vn0=((vel[b]-vel[a])*normal).sum(1)
+		#Don't bounce off resting contacts: the speed gained from gravity in one step isn't an impact
+		rest=self.Rest(env, size)
+		target=numpy.where(vn0<-rest, -c.bounce*vn0, 0.0)
+		acc=numpy.zeros(len(a))
+		for it in xrange(self.ITERATIONS.get(env.sim, 8)):
+			vn=((vel[b]-vel[a])*normal).sum(1)
+			new=numpy.maximum(acc+(target-vn)/wsum, 0)
+			dj=(new-acc)[:, None]*normal
+			acc=new
+			numpy.add.at(vel, a, -dj*wa[:, None])
+			numpy.add.at(vel, b, dj*wb[:, None])
+		#Friction: remove as much of the tangential velocity as the normal impulse allows
+		rv=vel[b]-vel[a]
+		vt=rv-((rv*normal).sum(1))[:, None]*normal
+		speed=numpy.sqrt((vt*vt).sum(1))
+		jt=numpy.minimum(speed/wsum, c.mu*acc)
+		dj=vt*(jt/numpy.where(speed>0, speed, 1))[:, None]
+		numpy.add.at(vel, a, dj*wa[:, None])
+		numpy.add.at(vel, b, -dj*wb[:, None])
+		vel[0]=0
+		#Push overlapping bodies apart
+		corr=(numpy.maximum(depth-self.SLOP, 0)*self.CORRECTION/wsum)[:, None]*normal
+		numpy.add.at(w.pos, a, -corr*wa[:, None])
+		numpy.add.at(w.pos, b, corr*wb[:, None])
+		w.pos[0]=0
@@ -5,13 +5,37 @@ phys -- Physics
 
 Implements an interface for physics engines in the Mindscape engine.
 
-Currently, this uses PyODE, but any other library with a similar interface can
-be used as a stand-in.
+The classes in this module (:class:`Environment`, :class:`Body`, :class:`Mass`,
+and the :class:`Geometry` types) are independent of the engine that actually
+simulates them, which is a :class:`Backend`:
+
+* :class:`ODEBackend` uses PyODE (which is not imported until it is needed).
+* :class:`npphys.NumpyBackend` is a pure NumPy engine for spheres and boxes. It
+  needs no native dependencies, simulates thousands of bodies with array
+  operations, and serves as a baseline for benchmarks.
+
+An :class:`Environment` uses the backend it's given, or, by default,
+:func:`DefaultBackend`: ODE if it is installed, and NumPy otherwise.
+
+Collisions may be controlled per geometry, with category and collide bit masks
+(two geometries are tested only if each one's category is in the other's collide
+mask), per pair (:func:`Environment.Exclude`, or an :attr:`Environment.filter`
+callback), and by letting resting bodies fall asleep (see :class:`Sleep`), after
+which they cost nothing until something touches them. Geometries with
+:attr:`Geometry.notify` set generate :class:`event.ContactEvent`\ s when they
+begin and end touching something.
 '''
 
-import ode
+import weakref
+
+import numpy
 
-from vmath import Vector
+from vmath import Vector, Slerp, SlerpArray, AxisAngle
+from gl import GL
+from scenegraph import TransformStore, StoreTransform, PRSTransform
+from event import ContactEvent, CONTACT
+from log import main, DV1, DV2, DV3, obCode
+logger=main.getChild('phys')
 
 class STYPE:
 	SIMPLE=1
@@ -22,92 +46,679 @@ class SIM:
 	NORMAL=0
 	QUICK=1
 
+class Contact(object):
+	'''The surface parameters given to every contact joint created by an
+:class:`Environment`: friction (``mu``), restitution (``bounce``, above
+``bouncevel``), and the softness of the contact (``softerp`` and ``softcfm``). At
+most ``maxcontacts`` contacts are generated per pair of geometries.'''
+	def __init__(self, mu=5000, bounce=0.2, bouncevel=0.05, softerp=0.2, softcfm=1e-5, maxcontacts=4):
+		self.mu=mu
+		self.bounce=bounce
+		self.bouncevel=bouncevel
+		self.softerp=softerp
+		self.softcfm=softcfm
+		self.maxcontacts=maxcontacts
+
+class Sleep(object):
+	'''The parameters for putting resting bodies to sleep: a body whose linear
+and angular speeds stay below ``linear`` and ``angular`` for ``time`` seconds is
+disabled until something wakes it (a collision with a moving body, or a change to
+its state through :class:`Body`). Exactly how bodies at rest against each other
+fall asleep depends on the backend.'''
+	def __init__(self, linear=0.05, angular=0.05, time=0.5):
+		self.linear=linear
+		self.angular=angular
+		self.time=time
+
+class Backend(object):
+	'''The base class of physics backends. A backend creates the native
+objects behind the classes of this module, and steps them:
+
+* :func:`World` and :func:`Space` make the world and collision space of an
+  :class:`Environment`. The world must support ``getGravity`` and ``setGravity``.
+* :func:`Body` makes a body, which must support ``getPosition``,
+  ``setPosition``, ``getQuaternion``, ``setQuaternion``, ``getLinearVel``,
+  ``setLinearVel`` and ``addForce`` (as in PyODE); :func:`SetMass` gives it a
+  :class:`Mass`.
+* :func:`Sphere`, :func:`Box` and :func:`TriMesh` make geometries, which must
+  support ``setBody``, ``getBody``, ``setPosition`` and ``getPosition``, plus
+  ``getRadius``/``setRadius`` or ``getLengths``/``setLengths`` respectively.
+* :func:`Step` runs collision and takes one step.
+
+Geometries must also support ``setCategoryBits``, ``getCategoryBits``,
+``setCollideBits`` and ``getCollideBits``, and bodies ``enable``, ``disable`` and
+``isEnabled``.
+
+After a step, :attr:`touches` must hold a list of ``(key1, key2, pos, normal,
+depth)`` tuples, one for each pair of geometries in contact where either has
+:attr:`Geometry.notify` set, where the keys are as given by :func:`Key`. The
+counters :attr:`pairs` and :attr:`tests` must hold the number of candidate pairs
+found by the broadphase, and the number that were tested in the narrowphase.
+
+The remaining methods have default implementations, which keep the previous
+state of each :class:`Body` on the object itself; a backend that stores its
+state in arrays may override them.
+
+.. note::
+
+	The methods without defaults must be defined by a subclass.'''
+	def World(self, env):
+		raise NotImplementedError('Backend must define .World()')
+	def Space(self, env, stype):
+		raise NotImplementedError('Backend must define .Space()')
+	def Body(self, env):
+		raise NotImplementedError('Backend must define .Body()')
+	def SetMass(self, body, mass):
+		raise NotImplementedError('Backend must define .SetMass()')
+	def Sphere(self, env, radius):
+		raise NotImplementedError('Backend must define .Sphere()')
+	def Box(self, env, dims):
+		raise NotImplementedError('Backend must define .Box()')
+	def TriMeshData(self, vertices, indices):
+		raise NotImplementedError('Backend must define .TriMeshData()')
+	def TriMesh(self, env, data):
+		raise NotImplementedError('Backend must define .TriMesh()')
+	#: See above.
+	touches=()
+	#: See above.
+	pairs=0
+	#: See above.
+	tests=0
+	def Key(self, geom):
+		'''Returns a hashable key identifying the native geometry ``geom``.'''
+		return geom
+	def SetNotify(self, env, geom, notify):
+		'''Called when the :attr:`Geometry.notify` of ``geom`` (a :class:`Geometry`) changes.'''
+		pass
+	def SetSleep(self, env, sleep):
+		'''Configure (or, if ``sleep`` is ``None``, disable) sleeping; see :class:`Sleep`.'''
+		if sleep is not None:
+			raise NotImplementedError('Backend must define .SetSleep()')
+	def Exclude(self, env, geom1, geom2, exclude=True):
+		'''Called when a pair is excluded (or included again); see :func:`Environment.Exclude`.'''
+		pass
+	def Remove(self, env, geom):
+		'''Remove ``geom`` from the space of ``env``.'''
+		env.space.remove(geom)
+	def Step(self, env, size):
+		'''Run collision and take one step of ``size`` seconds. Returns the number of contacts.'''
+		raise NotImplementedError('Backend must define .Step()')
+	def Save(self, env):
+		'''Remember the current state of every body of ``env`` as its previous state.'''
+		for body in env.bodies:
+			self.Reset(body)
+	def Reset(self, body):
+		'''Remember the current state of ``body`` (a :class:`Body`) as its previous state.'''
+		body.prevpos=body.body.getPosition()
+		body.prevquat=body.body.getQuaternion()
+	def Poses(self, env, bodies):
+		'''See :func:`Environment.Poses`.'''
+		return (numpy.array([b.prevpos for b in bodies], numpy.float64),
+				numpy.array([b.body.getPosition() for b in bodies], numpy.float64),
+				numpy.array([b.prevquat for b in bodies], numpy.float64),
+				numpy.array([b.body.getQuaternion() for b in bodies], numpy.float64))
+
+class ODEBackend(Backend):
+	'''A :class:`Backend` using PyODE, which is imported when the first world
+is made. Contacts are made into contact joints (see :class:`Contact`) in a joint
+group that is emptied after every step.'''
+	def __init__(self):
+		self.ode=None
+	def Load(self):
+		'''Import PyODE (this is done automatically by :func:`World`).'''
+		import ode
+		self.ode=ode
+		self.SPACE_MAP={STYPE.SIMPLE: ode.SimpleSpace,
+						STYPE.QTREE: ode.QuadTreeSpace,
+						STYPE.HASH: ode.HashSpace}
+		self.SIM_MAP={SIM.NORMAL: ode.World.step,
+					  SIM.QUICK: ode.World.quickStep}
+	def World(self, env):
+		if self.ode is None:
+			self.Load()
+		env.contactgroup=self.ode.JointGroup()
+		return self.ode.World()
+	def Space(self, env, stype):
+		return self.SPACE_MAP[stype]()
+	def Body(self, env):
+		return self.ode.Body(env.world)
+	def SetMass(self, body, mass):
+		m=self.ode.Mass()
+		i=mass.inertia
+		m.setParameters(mass.mass, 0, 0, 0, i[0, 0], i[1, 1], i[2, 2], i[0, 1], i[0, 2], i[1, 2])
+		body.setMass(m)
+	def Sphere(self, env, radius):
+		return self.ode.GeomSphere(env.space, radius)
+	def Box(self, env, dims):
+		return self.ode.GeomBox(env.space, tuple(dims))
+	def TriMeshData(self, vertices, indices):
+		data=self.ode.TriMeshData()
+		data.build(vertices.tolist(), indices.tolist())
+		return data
+	def TriMesh(self, env, data):
+		return self.ode.GeomTriMesh(data, env.space)
+	def SetSleep(self, env, sleep):
+		w=env.world
+		w.setAutoDisableFlag(sleep is not None)
+		if sleep is not None:
+			w.setAutoDisableLinearThreshold(sleep.linear)
+			w.setAutoDisableAngularThreshold(sleep.angular)
+			w.setAutoDisableTime(sleep.time)
+	def Step(self, env, size):
+		self.contacts=0
+		self.pairs=0
+		self.tests=0
+		self.touches=[]
+		self.env=env
+		env.space.collide(None, self._Near)
+		self.SIM_MAP[env.sim](env.world, size)
+		env.contactgroup.empty()
+		self.env=None
+		return self.contacts
+	def _Near(self, args, g1, g2):
+		ode=self.ode
+		env=self.env
+		self.pairs+=1
+		b1=g1.getBody()
+		b2=g2.getBody()
+		if b1 is None and b2 is None:
+			return
+		if b1 is not None and b2 is not None and ode.areConnected(b1, b2):
+			return
+		o1=env.geoms.get(g1)
+		o2=env.geoms.get(g2)
+		if env.excluded and frozenset((o1, o2)) in env.excluded:
+			return
+		if env.filter is not None and not env.filter(o1, o2):
+			return
+		self.tests+=1
+		c=env.contact
+		contacts=ode.collide(g1, g2)
+		if contacts and ((o1 is not None and o1.notify) or (o2 is not None and o2.notify)):
+			pos, normal, depth, ga, gb=contacts[0].getContactGeomParams()
+			self.touches.append((g1, g2, pos, normal, depth))
+		for con in contacts[:c.maxcontacts]:
+			con.setMu(c.mu)
+			con.setBounce(c.bounce)
+			con.setBounceVel(c.bouncevel)
+			con.setSoftERP(c.softerp)
+			con.setSoftCFM(c.softcfm)
+			j=ode.ContactJoint(env.world, env.contactgroup, con)
+			j.attach(b1, b2)
+		self.contacts+=min(len(contacts), c.maxcontacts)
+
+def DefaultBackend():
+	'''Returns an :class:`ODEBackend` if PyODE is installed, or a
+:class:`npphys.NumpyBackend` otherwise.'''
+	try:
+		import ode
+	except ImportError:
+		import npphys
+		logger.info('PyODE is not available; using the NumPy physics backend')
+		return npphys.NumpyBackend()
+	return ODEBackend()
+
 class Environment(object):
-	SPACE_MAP={STYPE.SIMPLE: ode.SimpleSpace,
-			   STYPE.QTREE: ode.QuadTreeSpace,
-			   STYPE.HASH: ode.HashSpace}
-	SIM_MAP={SIM.NORMAL: ode.World.step,
-			 SIM.QUICK: ode.World.quickStep}
-	def __init__(self, stype=STYPE.QTREE, gravity=None, sim=SIM.NORMAL):
-		self.world=ode.World()
+	'''An :class:`Environment` is a physics world, with a collision space,
+simulated by ``backend`` (by default, that returned by :func:`DefaultBackend`).
+
+The simulation is advanced at a fixed rate of ``rate`` steps per second,
+regardless of the frame rate, by calling :func:`Advance` once per frame with the
+elapsed time. Leftover time is accumulated for the next frame; if more than
+``maxsteps`` steps are due at once (e.g., after a stall), the excess is dropped,
+so that the simulation slows down rather than spiralling. Since rendering falls
+between steps, :attr:`alpha` is the fraction of a step that has elapsed since the
+last one, and :func:`Body.Interpolated` uses it to blend the last two states.
+
+Every step runs collision detection over the space, resolves the contacts found
+(see :class:`Contact`), and steps the world. Collision may be limited with masks
+(see :class:`Geometry`), :func:`Exclude` and :attr:`filter`; if ``sleep`` (a
+:class:`Sleep`) is given, resting bodies are put to sleep; and if ``events`` (an
+:class:`event.EventQueue`) is given, contacts of notifying geometries are posted
+to it. :attr:`pairs` and :attr:`tests` count the work done by the last step.'''
+	def __init__(self, stype=STYPE.QTREE, gravity=None, sim=SIM.NORMAL, rate=60, maxsteps=5, contact=None, backend=None,
+				 sleep=None, events=None):
+		#: The :class:`Backend`.
+		self.backend=(DefaultBackend() if backend is None else backend)
+		self.sim=sim
+		#: The :class:`Contact` parameters.
+		self.contact=(Contact() if contact is None else contact)
+		self.world=self.backend.World(self)
 		if gravity is not None:
 			self.world.setGravity(tuple(gravity))
-		self.space=self.SPACE_MAP[stype]()
-		self.contactgroup=ode.JointGroup()
-		self.sim=sim
+		self.space=self.backend.Space(self, stype)
+		#: The length of a step, in seconds.
+		self.dt=1.0/rate
+		#: The largest number of steps taken by one :func:`Advance`.
+		self.maxsteps=maxsteps
+		#: The time not yet simulated, in seconds.
+		self.accumulator=0.0
+		#: The fraction of a step between the last step and the present.
+		self.alpha=0.0
+		#: The :class:`Body` objects in this environment.
+		self.bodies=[]
+		#: The number of steps taken.
+		self.steps=0
+		#: The number of contacts found in the last step.
+		self.contacts=0
+		#: The total time dropped because too many steps were due.
+		self.dropped=0.0
+		#: The number of candidate pairs found by the broadphase in the last step.
+		self.pairs=0
+		#: The number of pairs tested by the narrowphase in the last step.
+		self.tests=0
+		#: Maps :func:`Backend.Key`\ s to the :class:`Geometry` objects in this environment.
+		self.geoms={}
+		#: A set of ``frozenset``\ s of pairs of :class:`Geometry` objects never to be collided.
+		self.excluded=set()
+		#: If not ``None``, a callable ``filter(geom1, geom2)`` which returns false
+		#: for pairs of :class:`Geometry` objects which should not collide. This is
+		#: called for every pair that passes the broadphase, so it is slow; prefer
+		#: masks and :func:`Exclude`.
+		self.filter=None
+		#: An :class:`event.EventQueue` to put :class:`event.ContactEvent`\ s in, or ``None``.
+		self.events=events
+		#: The touches (see :attr:`Backend.touches`) of the last step, keyed by ``frozenset``\ s of the pairs of keys.
+		self.touching={}
+		self.sleep=None
+		self.SetSleep(sleep)
+	def SetSleep(self, sleep):
+		'''Set the :class:`Sleep` parameters, or disable sleeping (if ``None``).'''
+		self.sleep=sleep
+		self.backend.SetSleep(self, sleep)
+	def Register(self, geom):
+		'''Add a :class:`Geometry` to :attr:`geoms`. This is done by the geometry.'''
+		self.geoms[self.backend.Key(geom.geom)]=geom
+	def Exclude(self, geom1, geom2):
+		'''Never collide the :class:`Geometry` objects ``geom1`` and ``geom2``.'''
+		self.excluded.add(frozenset((geom1, geom2)))
+		self.backend.Exclude(self, geom1, geom2)
+	def Include(self, geom1, geom2):
+		'''Undo :func:`Exclude`.'''
+		self.excluded.discard(frozenset((geom1, geom2)))
+		self.backend.Exclude(self, geom1, geom2, False)
 	def _get_gravity(self):
 		return Vector(*self.world.getGravity())
 	def _set_gravity(self, grav):
 		self.world.setGravity(tuple(grav))
 	gravity=property(_get_gravity, _set_gravity)
-	def Step(self, size):
-		self.SIM_MAP[self.sim](self.world, size)
+	def Step(self, size=None):
+		'''Take one step of ``size`` seconds (by default, :attr:`dt`), including
+collision.'''
+		if size is None:
+			size=self.dt
+		backend=self.backend
+		self.contacts=backend.Step(self, size)
+		self.pairs=backend.pairs
+		self.tests=backend.tests
+		self.steps+=1
+		if backend.touches or self.touching:
+			self.Notify(backend.touches)
+	def Notify(self, touches):
+		'''Post :class:`event.ContactEvent`\ s for the ``touches`` (see
+:attr:`Backend.touches`) that began this step, and for those that ended.'''
+		geoms=self.geoms
+		now={}
+		for k1, k2, pos, normal, depth in touches:
+			now[frozenset((k1, k2))]=(k1, k2, pos, normal, depth)
+		if self.events is not None:
+			for key, (k1, k2, pos, normal, depth) in now.iteritems():
+				if key not in self.touching:
+					self.events.Put(ContactEvent(CONTACT.BEGIN, geoms.get(k1), geoms.get(k2),
+												 Vector(*pos), Vector(*normal), depth))
+		for key, touch in self.touching.iteritems():
+			if key not in now:
+				k1, k2, pos, normal, depth=touch
+				g1=geoms.get(k1)
+				g2=geoms.get(k2)
+				if not (self._Awake(g1) or self._Awake(g2)):
+					#Sleeping bodies aren't collided, but are still touching
+					now[key]=touch
+				elif self.events is not None:
+					self.events.Put(ContactEvent(CONTACT.END, g1, g2, Vector(*pos), Vector(*normal), 0.0))
+		self.touching=now
+	@staticmethod
+	def _Awake(geom):
+		body=(None if geom is None else geom.geom.getBody())
+		return body is not None and body.isEnabled()
+	def Poses(self, bodies):
+		'''Returns ``(prevpos, pos, prevquat, quat)``: ``(N, 3)`` and ``(N, 4)``
+arrays of the previous and current positions and orientations of ``bodies``
+(a sequence of :class:`Body` objects in this environment).'''
+		return self.backend.Poses(self, bodies)
+	def Advance(self, elapsed):
+		'''Advance the simulation by ``elapsed`` seconds of real time, in fixed
+steps (see above). Returns the number of steps taken.'''
+		self.accumulator+=elapsed
+		steps=0
+		while self.accumulator>=self.dt:
+			if steps>=self.maxsteps:
+				self.dropped+=self.accumulator-self.accumulator%self.dt
+				self.accumulator%=self.dt
+				break
+			self.backend.Save(self)
+			self.Step(self.dt)
+			self.accumulator-=self.dt
+			steps+=1
+		self.alpha=self.accumulator/self.dt
+		return steps
 
 class Mass(object):
-	def __init__(self, mass):
-		self.mass=mass
+	'''The mass properties of a body: the total :attr:`mass`, and the 3x3
+:attr:`inertia` tensor about the center of mass (by default, that of a unit
+sphere of that mass). These are plain values, independent of the backend.'''
+	def __init__(self, mass, inertia=None):
+		#: The total mass.
+		self.mass=float(mass)
+		if inertia is None:
+			inertia=numpy.eye(3)*(0.4*self.mass)
+		#: The inertia tensor, as a 3x3 ``numpy`` array.
+		self.inertia=numpy.array(inertia, numpy.float64)
 	def __iadd__(self, other):
-		self.mass.add(other.mass)
+		self.mass+=other.mass
+		self.inertia+=other.inertia
+		return self
 	@classmethod
 	def Box(cls, density, dims, absolute=False):
-		m=ode.Mass()
-		if absolute:
-			m.setBoxTotal(density, *dims)
-		else:
-			m.setBox(density, *dims)
-		return cls(m)
+		'''The mass of a solid box of size ``dims``, of the given ``density``
+(or, if ``absolute`` is true, of total mass ``density``).'''
+		x, y, z=dims[0], dims[1], dims[2]
+		m=(density if absolute else density*x*y*z)
+		return cls(m, numpy.diag([m*(y*y+z*z)/12.0, m*(x*x+z*z)/12.0, m*(x*x+y*y)/12.0]))
 	@classmethod
 	def Sphere(cls, density, radius, absolute=False):
-		m=ode.Mass()
-		if absolute:
-			m.setSphereTotal(density, radius)
-		else:
-			m.setSphere(density, radius)
-		return cls(m)
+		'''The mass of a solid sphere of the given ``radius`` and ``density``
+(or, if ``absolute`` is true, of total mass ``density``).'''
+		m=(density if absolute else density*4.0/3.0*numpy.pi*radius**3)
+		return cls(m, numpy.eye(3)*(0.4*m*radius*radius))
 
 class Body(object):
-	def __init__(self, env, mass):
+	'''A rigid body in ``env``, with the given :class:`Mass` (if any). The
+body remembers its state before the last step of its :class:`Environment`, so
+that it can be drawn in between (see :func:`Interpolated`).'''
+	def __init__(self, env, mass=None):
 		self.env=env
-		self.body=ode.Body(env.world)
+		self.body=env.backend.Body(env)
+		self._mass=None
+		if mass is not None:
+			self.mass=mass
+		env.backend.Reset(self)
+		env.bodies.append(self)
 	def _get_mass(self):
-		return self.body.getMass()
+		return self._mass
 	def _set_mass(self, mass):
-		self.body.setMass(mass.mass)
+		self._mass=mass
+		self.env.backend.SetMass(self.body, mass)
+	#: The :class:`Mass` (or ``None``, if never set).
+	mass=property(_get_mass, _set_mass)
+	def _get_pos(self):
+		return Vector(*self.body.getPosition())
+	def _set_pos(self, pos):
+		self.body.setPosition(tuple(pos.FastTo3()))
+		self.body.enable()
+		self.env.backend.Reset(self)
+	#: The position, as a 3D :class:`vmath.Vector`. Setting it also sets the
+	#: previous position, so that the body doesn't appear to move there.
+	pos=property(_get_pos, _set_pos)
+	def _get_quat(self):
+		return Vector(*self.body.getQuaternion())
+	def _set_quat(self, quat):
+		self.body.setQuaternion(tuple(quat))
+		self.body.enable()
+		self.env.backend.Reset(self)
+	#: The orientation, as a unit quaternion ``(w, x, y, z)``.
+	quat=property(_get_quat, _set_quat)
+	def _get_vel(self):
+		return Vector(*self.body.getLinearVel())
+	def _set_vel(self, vel):
+		self.body.setLinearVel(tuple(vel.FastTo3()))
+		self.body.enable()
+	#: The linear velocity, as a 3D :class:`vmath.Vector`.
+	vel=property(_get_vel, _set_vel)
+	def _get_awake(self):
+		return bool(self.body.isEnabled())
+	def _set_awake(self, awake):
+		if awake:
+			self.body.enable()
+		else:
+			self.body.disable()
+	#: Whether or not the body is awake (see :class:`Sleep`).
+	awake=property(_get_awake, _set_awake)
+	def AddForce(self, force):
+		'''Apply ``force`` (a 3D :class:`vmath.Vector`) over the next step.'''
+		self.body.enable()
+		self.body.addForce(tuple(force.FastTo3()))
+	def Interpolated(self, alpha=None):
+		'''Returns ``(pos, quat)``, the state ``alpha`` (by default,
+:attr:`Environment.alpha`) of the way from the previous state to the current.'''
+		if alpha is None:
+			alpha=self.env.alpha
+		prevpos, pos, prevquat, quat=self.env.Poses([self])
+		p=prevpos[0]+(pos[0]-prevpos[0])*alpha
+		return Vector(*p), Slerp(prevquat[0], quat[0], alpha)
+	def Apply(self, transform, alpha=None):
+		'''Set the ``pos`` and ``rot`` of ``transform`` (a
+:class:`scenegraph.PRSTransform`) to the interpolated state.'''
+		pos, quat=self.Interpolated(alpha)
+		transform.pos=pos
+		transform.rot=AxisAngle(quat)
+
+class Binding(object):
+	'''A :class:`Binding` links :class:`Body` objects to
+:class:`scenegraph.Renderable`\ s, so that the renderables are drawn where the
+bodies are. Linking a node replaces its transform with a
+:class:`scenegraph.StoreTransform` in :attr:`store`; :func:`Sync` then updates
+every linked transform at once, interpolating between physics steps (see
+:class:`Environment`), with a handful of array operations rather than per-body
+objects.'''
+	def __init__(self, env, store=None):
+		#: The :class:`Environment` of the bodies.
+		self.env=env
+		#: The :class:`scenegraph.TransformStore` the transforms are kept in.
+		self.store=(TransformStore() if store is None else store)
+		#: The linked :class:`Body` objects.
+		self.bodies=[]
+		#: The linked nodes, in the same order.
+		self.nodes=[]
+		#: The :attr:`store` slots of the linked nodes, in the same order.
+		self.slots=[]
+		self._indices=None
+	@property
+	def indices(self):
+		'''The :attr:`slots`, as an integer array (made when first needed after a change).'''
+		if self._indices is None:
+			self._indices=numpy.array(self.slots, numpy.intp)
+		return self._indices
+	def Link(self, body, node):
+		'''Draw ``node`` where ``body`` is.'''
+		node.transform=StoreTransform(self.store)
+		self.bodies.append(body)
+		self.nodes.append(node)
+		self.slots.append(node.transform.index)
+		self._indices=None
+	def Unlink(self, body):
+		'''Stop updating the node linked to ``body``, which is given a
+:class:`scenegraph.PRSTransform` of the body's pose.'''
+		i=self.bodies.index(body)
+		node=self.nodes[i]
+		node.transform=PRSTransform()
+		body.Apply(node.transform)
+		self.store.Free(self.slots[i])
+		del self.bodies[i]
+		del self.nodes[i]
+		del self.slots[i]
+		self._indices=None
+	def Sync(self, alpha=None):
+		'''Update all of the linked transforms to the interpolated poses of their
+bodies, ``alpha`` (by default, :attr:`Environment.alpha`) of the way from the
+previous step to the current.'''
+		if not self.bodies:
+			return
+		if alpha is None:
+			alpha=self.env.alpha
+		prevpos, pos, prevquat, quat=self.env.Poses(self.bodies)
+		pos=prevpos+(pos-prevpos)*alpha
+		self.store.Set(self.indices, pos, SlerpArray(prevquat, quat, alpha))
 
 class Geometry(object):
+	'''The base class of collision geometries. Subclasses create their native
+geometry (:attr:`geom`) and then call :func:`Setup`.'''
+	def Setup(self):
+		'''Register with the :class:`Environment`, and apply the masks to a new native geometry.'''
+		self.env.Register(self)
+		if not hasattr(self, '_category'):
+			self._category=self.geom.getCategoryBits()
+			self._collide=self.geom.getCollideBits()
+			self._notify=False
+		else:
+			self.geom.setCategoryBits(self._category)
+			self.geom.setCollideBits(self._collide)
+			self.env.backend.SetNotify(self.env, self, self._notify)
 	def Attach(self, body):
 		self.geom.setBody(body.body)
+	def _get_category(self):
+		return self._category
+	def _set_category(self, bits):
+		self._category=bits
+		self.geom.setCategoryBits(bits)
+	#: The category bit mask (by default, all bits set).
+	category=property(_get_category, _set_category)
+	def _get_collide(self):
+		return self._collide
+	def _set_collide(self, bits):
+		self._collide=bits
+		self.geom.setCollideBits(bits)
+	#: The mask of categories this geometry collides with (by default, all).
+	collide=property(_get_collide, _set_collide)
+	def _get_notify(self):
+		return self._notify
+	def _set_notify(self, notify):
+		self._notify=notify
+		self.env.backend.SetNotify(self.env, self, notify)
+	#: Whether or not to post :class:`event.ContactEvent`\ s for this geometry
+	#: (see :attr:`Environment.events`).
+	notify=property(_get_notify, _set_notify)
+	def _get_pos(self):
+		return Vector(*self.geom.getPosition())
+	def _set_pos(self, pos):
+		self.geom.setPosition(tuple(pos.FastTo3()))
+	#: The position (of a geometry not attached to a body), as a 3D :class:`vmath.Vector`.
+	pos=property(_get_pos, _set_pos)
 	def BuildMass(self, density, absolute=False):
 		raise NotImplementedError('Geometry derivative must define .BuildMass()')
 
+def Triangulate(mode, n):
+	'''Returns an ``(M, 3)`` array of the triangles (as indices into the
+vertices) drawn by a primitive of mode ``mode`` with ``n`` vertices, with
+consistent winding. Modes that draw no triangles (points and lines) give an
+empty array.'''
+	if mode==GL.GL_TRIANGLES:
+		return numpy.arange(n-n%3).reshape(-1, 3)
+	if mode==GL.GL_TRIANGLE_STRIP and n>=3:
+		i=numpy.arange(n-2)
+		tris=numpy.column_stack((i, i+1, i+2))
+		odd=tris[1::2]
+		odd[:, [0, 1]]=odd[:, [1, 0]] #Every other triangle is wound the other way
+		return tris
+	if mode in (GL.GL_TRIANGLE_FAN, GL.GL_POLYGON) and n>=3:
+		i=numpy.arange(1, n-1)
+		return numpy.column_stack((numpy.zeros_like(i), i, i+1))
+	if mode==GL.GL_QUADS:
+		q=numpy.arange(n-n%4).reshape(-1, 4)
+		return numpy.column_stack((q[:, 0], q[:, 1], q[:, 2], q[:, 0], q[:, 2], q[:, 3])).reshape(-1, 3)
+	if mode==GL.GL_QUAD_STRIP and n>=4:
+		i=numpy.arange(0, n-n%2-2, 2)
+		return numpy.column_stack((i, i+1, i+3, i, i+3, i+2)).reshape(-1, 3)
+	return numpy.zeros((0, 3), numpy.intp)
+
+def Weld(vertices, indices, epsilon=1e-6):
+	'''Merge the vertices (an ``(N, 3)`` array) that are within about
+``epsilon`` of each other, remapping ``indices`` (an ``(M, 3)`` array) to match.
+Triangles that become degenerate are dropped. Returns the new ``(vertices,
+indices)``.'''
+	if not len(vertices):
+		return vertices, indices
+	keys=numpy.round(vertices/epsilon).astype(numpy.int64)
+	keys, first, inverse=numpy.unique(keys, axis=0, return_index=True, return_inverse=True)
+	indices=inverse[indices]
+	ok=(indices[:, 0]!=indices[:, 1])&(indices[:, 1]!=indices[:, 2])&(indices[:, 0]!=indices[:, 2])
+	return vertices[first], indices[ok]
+
+def MeshArrays(mesh):
+	'''Returns the ``(vertices, indices)`` arrays of the triangles drawn by
+``mesh`` (a :class:`scenegraph.Mesh`), before welding.'''
+	verts=[]
+	tris=[]
+	base=0
+	for face in mesh.faces:
+		n=len(face.vertices)
+		t=Triangulate(face.mode, n)
+		if not len(t):
+			continue
+		verts.extend([v.pos[:3] for v in face.vertices])
+		tris.append(t+base)
+		base+=n
+	if not tris:
+		return numpy.zeros((0, 3)), numpy.zeros((0, 3), numpy.intp)
+	return numpy.array(verts, numpy.float64), numpy.concatenate(tris)
+
 class Mesh(Geometry):
+	'''A triangle mesh geometry. ``mesh`` is either a :class:`scenegraph.Mesh`
+(whose faces may be of any of the triangle modes, including strips, fans and
+quads) or a pair of arrays ``(vertices, indices)``, of shapes ``(N, 3)`` and
+``(M, 3)``.
+
+Shared vertices are welded (see :func:`Weld`), so the collision mesh is indexed
+rather than a soup. The welded arrays are cached per :class:`scenegraph.Mesh` and
+:attr:`scenegraph.Mesh.version`, as is the data each backend builds from them,
+so geometries made from the same mesh share them, and :func:`Rebuild` does
+nothing unless the mesh has :func:`scenegraph.Mesh.Changed`.'''
+	#: Maps :class:`scenegraph.Mesh` objects to ``(version, vertices, indices, datas)``,
+	#: where ``datas`` maps backends to the data built for them.
+	CACHE=weakref.WeakKeyDictionary()
 	def __init__(self, env, mesh):
 		self.env=env
 		self.mesh=mesh
-		self.data=ode.TriMeshData()
+		self.version=None
 		self.Rebuild()
-		self.geom=ode.GeomTriMesh(self.data, env.space)
+		self.geom=env.backend.TriMesh(env, self.data)
+		self.Setup()
 	def Rebuild(self):
-		#Note that this build assumes either a GL_TRIANGLE_STRIP or compatible
-		#mode, such as GL_QUADS. Winding doesn't matter (AFAIK), so if you've
-		#used CCW winding for the polygons for the renderer, it won't hurt.
-		#Note that vertices are split often.
-		vertices=[]
-		indices=[]
-		for face in self.mesh.faces:
-			if len(face.vertices)>2:
-				vertices.extend(face.vertices[:2])
-				for vertex in face.vertices[2:]:
-					vertices.append(vertex)
-					l=len(vertices)
-					indices.append((l-3, l-2, l-1))
-		vertices=[i.pos for i in vertices]
-		self.data.build(vertices, indices)
+		'''Rebuild the collision data, if the mesh has changed.'''
+		mesh=self.mesh
+		if isinstance(mesh, tuple):
+			if self.version is None:
+				verts, indices=Weld(numpy.asarray(mesh[0], numpy.float64)[:, :3], numpy.asarray(mesh[1]))
+				self.data=self.env.backend.TriMeshData(verts, indices)
+				self.version=0
+			return
+		if self.version==mesh.version:
+			return
+		cached=self.CACHE.get(mesh)
+		if cached is None or cached[0]!=mesh.version:
+			verts, indices=Weld(*MeshArrays(mesh))
+			cached=self.CACHE[mesh]=(mesh.version, verts, indices, weakref.WeakKeyDictionary())
+		version, verts, indices, datas=cached
+		backend=self.env.backend
+		data=datas.get(backend)
+		if data is None:
+			data=datas[backend]=backend.TriMeshData(verts, indices)
+		self.version, self.data=version, data
+		if hasattr(self, 'geom'):
+			#The data of a trimesh can't be replaced, so replace the geom
+			body=self.geom.getBody()
+			self.env.geoms.pop(self.env.backend.Key(self.geom), None)
+			self.env.backend.Remove(self.env, self.geom)
+			self.geom=self.env.backend.TriMesh(self.env, self.data)
+			if body is not None:
+				self.geom.setBody(body)
+			self.Setup()
 
 class Sphere(Geometry):
 	def __init__(self, env, radius):
 		self.env=env
-		self.geom=ode.GeomSphere(env.space, radius)
+		self.geom=env.backend.Sphere(env, radius)
+		self.Setup()
 	def _get_radius(self):
 		return self.geom.getRadius()
 	def _set_radius(self, rad):
@@ -119,7 +730,8 @@ class Sphere(Geometry):
 class Box(Geometry):
 	def __init__(self, env, dims):
 		self.env=env
-		self.geom=ode.GeomBox(env.space, tuple(dims.FastTo3()))
+		self.geom=env.backend.Box(env, tuple(dims.FastTo3()))
+		self.Setup()
 	def _get_dims(self):
 		return Vector(*self.geom.getLengths())
 	def _set_dims(self, dims):
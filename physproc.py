@@ -0,0 +1,437 @@
+'''
+.. mindscape -- Mindscape Engine
+physproc -- Physics in a Worker Process
+=======================================
+
+This module runs a :class:`phys.Environment` in a separate process, so that a
+long physics step never stalls rendering. A :class:`PhysicsProcess` starts the
+worker, which owns the environment and steps it at its fixed rate in real time;
+the render loop talks to it only through shared memory:
+
+* Commands (add a body, apply a force, ...) are fixed-size records written into
+  a single-producer, single-consumer ring (:class:`Ring`). Neither side ever
+  takes a lock or waits on the other: the producer advances the head, the
+  consumer the tail, and each only reads the other's counter. If the ring is
+  full, commands are held back locally and sent as room appears.
+* After every step, the worker publishes the poses of all bodies (the previous
+  and current positions and orientations, so that the reader can interpolate)
+  into one of three shared buffers--a double buffer, plus a spare, so that the
+  worker always has a buffer to write that is neither the latest one nor the one
+  the reader is holding. :func:`PhysicsProcess.Latest` returns a
+  :class:`Snapshot` of ``numpy`` views of the latest buffer, without copying.
+
+Bodies are identified by the integers returned when they are added, in order
+from zero. Static geometries (with no density) have no body, and no identifier.
+Since the commands are asynchronous, a new body appears in the snapshots only
+after the worker has processed the command.
+
+The protocol relies on aligned 8-byte stores being atomic and seen in program
+order by the other process, which is true of the platforms Mindscape runs on.
+'''
+
+import time
+import ctypes
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+from collections import deque
+from timeit import default_timer as clock
+
+import numpy
+
+import phys
+from phys import STYPE, SIM
+from vmath import Vector, SlerpArray, AxisAngle
+from scenegraph import TransformStore, StoreTransform, PRSTransform
+from log import main, DV1, DV2, DV3, obCode, Guard
+logger=main.getChild('physproc')
+guard=Guard(logger)
+
+class CMD:
+	'''An enumeration of the commands sent to the worker.'''
+	#: Stop the worker.
+	QUIT=0
+	#: Add a sphere: ``radius, density, x, y, z``. A density of zero makes a static geometry.
+	SPHERE=1
+	#: Add a box: ``dx, dy, dz, density, x, y, z``. A density of zero makes a static geometry.
+	BOX=2
+	#: Apply a force for the next step: ``fx, fy, fz``.
+	FORCE=3
+	#: Set the position of a body: ``x, y, z``.
+	POS=4
+	#: Set the linear velocity of a body: ``vx, vy, vz``.
+	VEL=5
+	#: Set the gravity: ``gx, gy, gz``.
+	GRAVITY=6
+
+#: The layout of a command record: the command, the body, and up to 8 arguments.
+RECORD=numpy.dtype([('cmd', '<u4'), ('id', '<u4'), ('args', '<f8', (8,))])
+
+class HDR:
+	'''The slots of the shared header of a :class:`PhysicsProcess`.'''
+	#: The buffer most recently published.
+	FRONT=0
+	#: The buffer the reader holds.
+	READING=1
+	#: The number of buffers published.
+	SEQ=2
+	#: The number of steps taken.
+	STEPS=3
+	#: The number of contacts in the last step.
+	CONTACTS=4
+	#: The total time dropped by the worker (see :class:`phys.Environment`).
+	DROPPED=5
+	#: Where each buffer's body counts start.
+	COUNT=6
+	#: Where each buffer's publication times start.
+	TIME=9
+	#: Where each buffer's :attr:`phys.Environment.alpha` at publication starts.
+	ALPHA=12
+	#: The header size.
+	SIZE=15
+
+#: The number of pose buffers.
+BUFFERS=3
+#: The columns of a pose buffer row: previous and current position, previous and current quaternion.
+PREVPOS, POS, PREVQUAT, QUAT=slice(0, 3), slice(3, 6), slice(6, 10), slice(10, 14)
+#: The width of a pose buffer row.
+WIDTH=14
+
+class Ring(object):
+	'''A single-producer, single-consumer ring of :data:`RECORD`\ s in shared
+memory. One process may only :func:`Put`, and the other only :func:`Get`.'''
+	def __init__(self, capacity=4096):
+		#: The number of records.
+		self.capacity=capacity
+		self.raw=RawArray('c', capacity*RECORD.itemsize)
+		#: Head (records put) and tail (records got), which only ever increase.
+		self.counters=RawArray(ctypes.c_int64, 2)
+		self.Attach()
+	def Attach(self):
+		'''Create the ``numpy`` views; done again in the worker, since views aren't pickled.'''
+		self.records=numpy.frombuffer(self.raw, RECORD)
+		self.pos=numpy.frombuffer(self.counters, numpy.int64)
+	def __getstate__(self):
+		return {'capacity': self.capacity, 'raw': self.raw, 'counters': self.counters}
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.Attach()
+	def Free(self):
+		'''Returns the number of records that may be put.'''
+		return self.capacity-(self.pos[0]-self.pos[1])
+	def Put(self, cmd, id, args=()):
+		'''Add a record, returning ``False`` (and doing nothing) if the ring is full.'''
+		head=self.pos[0]
+		if head-self.pos[1]>=self.capacity:
+			return False
+		rec=self.records[head%self.capacity]
+		rec['cmd']=cmd
+		rec['id']=id
+		rec['args'][:len(args)]=args
+		#Publish only once the record is written
+		self.pos[0]=head+1
+		return True
+	def Get(self):
+		'''Returns the records waiting (as a copy), and frees their slots.'''
+		head=self.pos[0]
+		tail=self.pos[1]
+		if head==tail:
+			return self.records[:0]
+		idx=numpy.arange(tail, head)%self.capacity
+		recs=self.records[idx]
+		self.pos[1]=head
+		return recs
+
+class Snapshot(object):
+	'''The poses of the bodies as of one step of the worker, as (N, 3) and (N, 4)
+``numpy`` views into shared memory. They are valid until the next
+:func:`PhysicsProcess.Latest`, and must not be modified.'''
+	def __init__(self, buf, count, time, alpha, dt, seq):
+		rows=buf[:count]
+		#: The positions before the last step.
+		self.prevpos=rows[:, PREVPOS]
+		#: The positions after the last step.
+		self.pos=rows[:, POS]
+		#: The orientations before the last step.
+		self.prevquat=rows[:, PREVQUAT]
+		#: The orientations after the last step.
+		self.quat=rows[:, QUAT]
+		#: The number of bodies.
+		self.count=count
+		#: The time at which the snapshot was published.
+		self.time=time
+		#: The fraction of a step between the last step and the publication.
+		self.alpha=alpha
+		self.dt=dt
+		#: The publication number, which increases with every snapshot.
+		self.seq=seq
+	def Alpha(self, now=None):
+		'''Returns the fraction of a step from the previous step to ``now`` (by
+default, the present), clamped to 1, for interpolation.'''
+		if now is None:
+			now=time.time()
+		return max(0.0, min(1.0, self.alpha+(now-self.time)/self.dt))
+
+class PhysicsProcess(object):
+	'''Runs a :class:`phys.Environment` (made with the given arguments; see
+there) in a worker process, with room for ``capacity`` bodies and ``commands``
+queued commands. The worker is started by :func:`Start` and stopped by
+:func:`Stop` (or by using the object as a context manager).
+
+``backend`` must be picklable (both :class:`phys.ODEBackend` and
+:class:`npphys.NumpyBackend` are); if ``None``, the worker uses
+:func:`phys.DefaultBackend`.'''
+	def __init__(self, stype=STYPE.QTREE, gravity=None, sim=SIM.NORMAL, rate=60, maxsteps=5, contact=None, backend=None,
+				 sleep=None, capacity=1024, commands=4096):
+		self.config=dict(stype=stype, gravity=(None if gravity is None else tuple(gravity)), sim=sim, rate=rate,
+						 maxsteps=maxsteps, contact=contact, backend=backend, sleep=sleep)
+		#: The largest number of bodies.
+		self.capacity=capacity
+		#: The length of a step, in seconds.
+		self.dt=1.0/rate
+		#: The command :class:`Ring`.
+		self.ring=Ring(commands)
+		self.rawheader=RawArray('d', HDR.SIZE)
+		self.rawbuffers=[RawArray('d', capacity*WIDTH) for i in xrange(BUFFERS)]
+		self.header=numpy.frombuffer(self.rawheader, numpy.float64)
+		self.buffers=[numpy.frombuffer(raw, numpy.float64).reshape(capacity, WIDTH) for raw in self.rawbuffers]
+		#: Commands waiting for room in the ring.
+		self.backlog=deque()
+		#: The number of bodies added.
+		self.bodies=0
+		self.process=None
+	def Start(self):
+		'''Start the worker process.'''
+		self.process=multiprocessing.Process(target=_Worker, name='physics',
+											 args=(self.config, self.ring, self.rawheader, self.rawbuffers))
+		self.process.daemon=True
+		self.process.start()
+	def Stop(self, timeout=1.0):
+		'''Stop the worker process, waiting up to ``timeout`` seconds before killing it.'''
+		if self.process is None:
+			return
+		self.Send(CMD.QUIT)
+		deadline=clock()+timeout
+		while self.backlog and clock()<deadline:
+			time.sleep(0.001)
+			self.Flush()
+		self.process.join(max(0.0, deadline-clock()))
+		if self.process.is_alive():
+			logger.warning('Physics worker did not stop; terminating it')
+			self.process.terminate()
+		self.process=None
+	def __enter__(self):
+		self.Start()
+		return self
+	def __exit__(self, type, value, tb):
+		self.Stop()
+	def Flush(self):
+		'''Move as many held-back commands into the ring as will fit.'''
+		backlog=self.backlog
+		ring=self.ring
+		while backlog and ring.Put(*backlog[0]):
+			backlog.popleft()
+	def Send(self, cmd, id=0, args=()):
+		'''Queue a command; see :class:`CMD`. This never blocks.'''
+		if self.backlog:
+			self.backlog.append((cmd, id, args))
+			self.Flush()
+		elif not self.ring.Put(cmd, id, args):
+			if guard.DV2:
+				logger.log(DV2, 'Command ring full; holding back commands')
+			self.backlog.append((cmd, id, args))
+	def _Add(self, cmd, args, density):
+		if not density:
+			self.Send(cmd, 0, args)
+			return None
+		if self.bodies>=self.capacity:
+			raise ValueError('PhysicsProcess is full (capacity %d)'%(self.capacity,))
+		id=self.bodies
+		self.bodies+=1
+		self.Send(cmd, id, args)
+		return id
+	def AddSphere(self, radius, pos, density=1.0):
+		'''Add a sphere of the given ``radius`` at ``pos`` (a 3D
+:class:`vmath.Vector`). Returns the body's identifier, or ``None`` if
+``density`` is zero, in which case the sphere is static.'''
+		return self._Add(CMD.SPHERE, (radius, density)+tuple(pos.FastTo3()), density)
+	def AddBox(self, dims, pos, density=1.0):
+		'''Add a box of the given ``dims`` at ``pos`` (both 3D
+:class:`vmath.Vector`\ s). Returns as :func:`AddSphere`.'''
+		return self._Add(CMD.BOX, tuple(dims.FastTo3())+(density,)+tuple(pos.FastTo3()), density)
+	def AddForce(self, id, force):
+		'''Apply ``force`` (a 3D :class:`vmath.Vector`) to a body over its next step.'''
+		self.Send(CMD.FORCE, id, tuple(force.FastTo3()))
+	def SetPosition(self, id, pos):
+		'''Move a body to ``pos`` (a 3D :class:`vmath.Vector`).'''
+		self.Send(CMD.POS, id, tuple(pos.FastTo3()))
+	def SetVelocity(self, id, vel):
+		'''Set the linear velocity of a body to ``vel`` (a 3D :class:`vmath.Vector`).'''
+		self.Send(CMD.VEL, id, tuple(vel.FastTo3()))
+	def SetGravity(self, gravity):
+		'''Set the gravity (a 3D :class:`vmath.Vector`).'''
+		self.Send(CMD.GRAVITY, 0, tuple(gravity.FastTo3()))
+	def Latest(self):
+		'''Returns a :class:`Snapshot` of the latest published poses. This never
+blocks; it also sends any held-back commands.'''
+		if self.backlog:
+			self.Flush()
+		h=self.header
+		while True:
+			front=int(h[HDR.FRONT])
+			h[HDR.READING]=front
+			#If the worker published meanwhile, it may now be writing into front
+			if int(h[HDR.FRONT])==front:
+				break
+		return Snapshot(self.buffers[front], int(h[HDR.COUNT+front]), h[HDR.TIME+front], h[HDR.ALPHA+front],
+						self.dt, int(h[HDR.SEQ]))
+	@property
+	def steps(self):
+		'''The number of steps the worker has taken.'''
+		return int(self.header[HDR.STEPS])
+	@property
+	def contacts(self):
+		'''The number of contacts in the worker's last step.'''
+		return int(self.header[HDR.CONTACTS])
+
+class Binding(object):
+	'''Like :class:`phys.Binding`, but for the bodies of a :class:`PhysicsProcess`,
+identified by number.'''
+	def __init__(self, proc, store=None):
+		#: The :class:`PhysicsProcess`.
+		self.proc=proc
+		#: The :class:`scenegraph.TransformStore` the transforms are kept in.
+		self.store=(TransformStore() if store is None else store)
+		#: The linked body identifiers.
+		self.bodies=[]
+		#: The linked nodes, in the same order.
+		self.nodes=[]
+		#: The :attr:`store` slots of the linked nodes, in the same order.
+		self.slots=[]
+		self._arrays=None
+	@property
+	def ids(self):
+		'''The :attr:`bodies`, as an integer array (made when first needed after a change).'''
+		return self._Arrays()[0]
+	@property
+	def indices(self):
+		'''The :attr:`slots`, as an integer array (made when first needed after a change).'''
+		return self._Arrays()[1]
+	def _Arrays(self):
+		if self._arrays is None:
+			self._arrays=(numpy.array(self.bodies, numpy.intp), numpy.array(self.slots, numpy.intp))
+		return self._arrays
+	def Link(self, id, node):
+		'''Draw ``node`` where the body ``id`` is.'''
+		node.transform=StoreTransform(self.store)
+		self.bodies.append(id)
+		self.nodes.append(node)
+		self.slots.append(node.transform.index)
+		self._arrays=None
+	def Unlink(self, id):
+		'''Stop updating the node linked to body ``id``, which is given a
+:class:`scenegraph.PRSTransform` of the body's last published pose.'''
+		i=self.bodies.index(id)
+		node=self.nodes[i]
+		node.transform=PRSTransform()
+		snap=self.proc.Latest()
+		if id<snap.count:
+			node.transform.pos=Vector(*snap.pos[id])
+			node.transform.rot=AxisAngle(Vector(*snap.quat[id]))
+		self.store.Free(self.slots[i])
+		del self.bodies[i]
+		del self.nodes[i]
+		del self.slots[i]
+		self._arrays=None
+	def Sync(self, alpha=None):
+		'''Update all of the linked transforms from the latest snapshot,
+interpolated ``alpha`` (by default, :func:`Snapshot.Alpha`) of the way from the
+previous step to the current. Bodies the worker has not added yet are skipped.'''
+		if not self.bodies:
+			return
+		snap=self.proc.Latest()
+		if alpha is None:
+			alpha=snap.Alpha()
+		ids=self.ids
+		indices=self.indices
+		if snap.count<=ids.max():
+			ready=ids<snap.count
+			ids=ids[ready]
+			indices=indices[ready]
+		prevpos=snap.prevpos[ids]
+		pos=prevpos+(snap.pos[ids]-prevpos)*alpha
+		self.store.Set(indices, pos, SlerpArray(snap.prevquat[ids], snap.quat[ids], alpha))
+
+def _Worker(config, ring, rawheader, rawbuffers):
+	'''The worker process: run the environment until told to quit.'''
+	header=numpy.frombuffer(rawheader, numpy.float64)
+	buffers=[numpy.frombuffer(raw, numpy.float64).reshape(-1, WIDTH) for raw in rawbuffers]
+	gravity=config.pop('gravity')
+	env=phys.Environment(gravity=(None if gravity is None else Vector(*gravity)), **config)
+	bodies=[]
+	last=clock()
+	while True:
+		recs=ring.Get()
+		if len(recs):
+			if _Apply(env, bodies, recs):
+				return
+			#Make new bodies visible at once
+			_Publish(env, bodies, header, buffers)
+		now=clock()
+		steps=env.Advance(now-last)
+		last=now
+		if steps:
+			_Publish(env, bodies, header, buffers)
+		#Sleep until the next step is due, but keep polling for commands
+		time.sleep(min(env.dt*(1.0-env.alpha), 0.002))
+
+def _Apply(env, bodies, recs):
+	'''Carry out the command records ``recs``; returns ``True`` if told to quit.'''
+	for cmd, id, args in recs.tolist():
+		if cmd==CMD.QUIT:
+			return True
+		elif cmd==CMD.SPHERE or cmd==CMD.BOX:
+			if cmd==CMD.SPHERE:
+				geom=phys.Sphere(env, args[0])
+				density, pos=args[1], args[2:5]
+			else:
+				geom=phys.Box(env, Vector(*args[:3]))
+				density, pos=args[3], args[4:7]
+			if density:
+				body=phys.Body(env, geom.BuildMass(density))
+				geom.Attach(body)
+				body.pos=Vector(*pos)
+				bodies.append(body)
+			else:
+				geom.pos=Vector(*pos)
+		elif cmd==CMD.FORCE:
+			bodies[id].AddForce(Vector(*args[:3]))
+		elif cmd==CMD.POS:
+			bodies[id].pos=Vector(*args[:3])
+		elif cmd==CMD.VEL:
+			bodies[id].vel=Vector(*args[:3])
+		elif cmd==CMD.GRAVITY:
+			env.gravity=Vector(*args[:3])
+	return False
+
+def _Publish(env, bodies, header, buffers):
+	'''Write the poses of ``bodies`` into a free buffer, and make it the front.'''
+	front=int(header[HDR.FRONT])
+	reading=int(header[HDR.READING])
+	back=[i for i in xrange(BUFFERS) if i!=front and i!=reading][0]
+	n=len(bodies)
+	if n:
+		buf=buffers[back]
+		prevpos, pos, prevquat, quat=env.Poses(bodies)
+		buf[:n, PREVPOS]=prevpos
+		buf[:n, POS]=pos
+		buf[:n, PREVQUAT]=prevquat
+		buf[:n, QUAT]=quat
+	header[HDR.COUNT+back]=n
+	header[HDR.TIME+back]=time.time()
+	header[HDR.ALPHA+back]=env.alpha
+	header[HDR.STEPS]=env.steps
+	header[HDR.CONTACTS]=env.contacts
+	header[HDR.DROPPED]=env.dropped
+	#Flip only once the buffer is complete
+	header[HDR.FRONT]=back
+	header[HDR.SEQ]+=1
@@ -0,0 +1,348 @@
+'''
+.. mindscape -- Mindscape Engine
+pipeline -- Update and Submit Phases
+====================================
+
+Rendering a :class:`scenegraph.Scene` directly (``with scene: scene.Render()``)
+does everything--composing transformations, laying out, rasterizing text--on the
+GL thread, in between the GL calls. A :class:`Pipeline` splits a frame in two:
+
+* The *update* phase (:func:`Pipeline.Update`) walks the scene, calls
+  :func:`scenegraph.Renderable.Prepare` on every node, composes each node's
+  transformation into a world matrix (with ``numpy``, one batched product per
+  level of the tree), culls the nodes whose :attr:`scenegraph.Renderable.bounds`
+  are outside the camera's view, and returns an immutable :class:`DrawList`.
+  It makes no GL calls.
+* The *submit* phase (:func:`Pipeline.Submit`) only issues GL: for each item of
+  a draw list, it sets up the state the node's ancestors would have (changing
+  only what differs from the previous item), multiplies in the world matrix,
+  and calls :func:`scenegraph.Renderable.Draw`.
+
+:func:`Pipeline.Frame` submits the current frame, then runs the update for the
+next one on a thread while the buffers are swapped, so that the update overlaps
+with waiting for the display; the scene thereby appears one frame late. (Under
+the GIL, an update overlapping the submission only contends with it; starting it
+afterwards is faster, even with one processor.) A typical main loop looks like::
+
+	pipe=Pipeline(scene)
+	while not events.quit:
+		events.Pump()
+		events.Dispatch(scene)
+		sched.Tick()
+		pipe.Frame(pygame.display.flip)
+	pipe.Close()
+
+Nodes that are :attr:`scenegraph.Renderable.ATOMIC` (such as
+:class:`layout.Widget`\ s), whose transformation can't be computed without GL
+(see :func:`scenegraph.Transform.Matrix`), or which set their own matrix mode
+are drawn whole, with their children, as one item, as they would be otherwise.
+
+:func:`Pipeline.Frame` doesn't overlap the update with the submission, but
+:func:`Pipeline.Update` and :func:`Pipeline.Submit` may be called from different
+threads, so nothing a node draws from may be changed by the update. What each node's :func:`scenegraph.Renderable.Prepare`
+returns is kept in the :class:`DrawList`, and passed to its
+:func:`scenegraph.Renderable.Draw`, so that it draws the frame that was
+prepared. Nodes drawn whole can't be drawn from such a snapshot (a
+:class:`layout.Container` lays itself out as it's drawn, for instance), so each
+of them has a lock, held while its subtree is prepared and while it is drawn:
+an update waits for its submission, and vice versa. The scene must not be
+otherwise changed during :func:`Pipeline.Frame`.
+
+To keep the update cheap, the world matrices of the last update are kept, and
+only composed again if the nodes, their parents, or any of their
+transformations' matrices have changed (see :func:`scenegraph.Transform.Matrix`).
+'''
+
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+import numpy
+
+from gl import GL
+from log import main, DV1, DV2, DV3, obCode, Guard
+logger=main.getChild('pipeline')
+guard=Guard(logger)
+
+class DrawList(object):
+	'''A :class:`DrawList` is what :func:`Pipeline.Update` makes of a scene: the
+nodes to draw, in order, with their world matrices and the nodes whose state
+applies to them. It isn't changed after it is made, so that it may be submitted
+while the next is being made.'''
+	def __init__(self, scene, nodes, matrices, chains, atomic, prepared, locks, culled):
+		#: The :class:`scenegraph.Scene`.
+		self.scene=scene
+		#: A tuple of the :class:`scenegraph.Renderable`\ s to draw.
+		self.nodes=tuple(nodes)
+		#: A read-only ``(N, 16)`` array of the world matrices of :attr:`nodes`, column-major
+		#: (for an atomic node, that of its parent, since it applies its own transformation).
+		self.matrices=matrices
+		self.matrices.flags.writeable=False
+		#: A tuple, for each of :attr:`nodes`, of a tuple of the nodes whose state (other than
+		#: their transformation) applies to it, outermost first.
+		self.chains=tuple(chains)
+		#: A tuple, for each of :attr:`nodes`, of whether it is drawn whole (see the module documentation).
+		self.atomic=tuple(atomic)
+		#: A tuple, for each of :attr:`nodes`, of what its :func:`scenegraph.Renderable.Prepare`
+		#: returned (or ``None``, if it is drawn whole).
+		self.prepared=tuple(prepared)
+		#: A tuple, for each of :attr:`nodes`, of the lock held while it is drawn, if it is drawn whole (or ``None``).
+		self.locks=tuple(locks)
+		#: The number of nodes culled.
+		self.culled=culled
+	def __len__(self):
+		return len(self.nodes)
+
+class Pipeline(object):
+	'''A :class:`Pipeline` draws ``scene`` in an update phase and a submit phase
+(see the module documentation). The update runs on a thread while the
+buffers are swapped, unless ``threaded`` is false, in which case :func:`Frame`
+just updates and then submits (and the scene isn't a frame late). With more than
+one of ``workers``, the nodes are :func:`scenegraph.Renderable.Prepare`\ d in
+parallel on a pool of them.'''
+	def __init__(self, scene, workers=1, threaded=True):
+		#: The :class:`scenegraph.Scene` drawn.
+		self.scene=scene
+		#: The number of threads preparing.
+		self.workers=workers
+		#: Whether or not to update on a thread while swapping.
+		self.threaded=threaded
+		#: The ``multiprocessing.pool.ThreadPool`` preparing, if there is more than one of :attr:`workers`.
+		self.pool=(ThreadPool(workers) if workers>1 else None)
+		#: The :class:`DrawList` to be submitted by the next :func:`Frame`, or ``None``.
+		self.current=None
+		#: A ``dict`` mapping each node drawn whole (as of the last update) to its lock.
+		self.locks={}
+		#: The number of updates that had to compose the world matrices.
+		self.composed=0
+		self._last=None
+	def Close(self):
+		'''Stop the threads.'''
+		if self.pool is not None:
+			self.pool.close()
+			self.pool.join()
+			self.pool=None
+	def Frame(self, swap=None):
+		'''Draw a frame: submit :attr:`current`, then update the next on a thread
+while calling ``swap`` (such as ``pygame.display.flip``), if given, so that the
+update goes on while it waits for the display. If not :attr:`threaded`, just
+update, submit and swap.'''
+		if not self.threaded:
+			self.Submit(self.Update())
+			if swap is not None:
+				swap()
+			return
+		if self.current is None:
+			self.current=self.Update()
+		self.Submit(self.current)
+		self.current=None
+		result=[]
+		updating=threading.Thread(target=self._Update, args=(result,))
+		updating.start()
+		try:
+			if swap is not None:
+				swap()
+		finally:
+			updating.join()
+		drawlist, error=result[0]
+		if error is not None:
+			raise error[0], error[1], error[2]
+		self.current=drawlist
+	def _Update(self, result):
+		try:
+			result.append((self.Update(), None))
+		except:
+			result.append((None, sys.exc_info()))
+	def Update(self):
+		'''Walk the scene, preparing, composing and culling, and return a :class:`DrawList`.
+This makes no GL calls.'''
+		scene=self.scene
+		nodes=[]
+		parents=[]
+		depths=[]
+		chains=[]
+		atomic=[]
+		local=[]
+		#(The nodes drawn whole, with their locks)
+		whole=[]
+		oldlocks=self.locks
+		locks={}
+		stack=[(child, -1, 0, ()) for child in reversed(scene.children)]
+		while stack:
+			node, parent, depth, chain=stack.pop()
+			index=len(nodes)
+			nodes.append(node)
+			parents.append(parent)
+			depths.append(depth)
+			mat=(None if node.ATOMIC or node.mmode is not None else node.transform.Matrix())
+			if mat is None:
+				#Drawn whole, in the state of its parent
+				lock=oldlocks.get(node)
+				if lock is None:
+					lock=threading.Lock()
+				locks[node]=lock
+				whole.append((node, lock))
+				chains.append(chain)
+				atomic.append(True)
+				local.append(IDENTITY)
+				continue
+			#(If it changes any state other than its transformation)
+			if node.enable or node.disable or node.texture is not None or node.modifications:
+				chain=chain+(node,)
+			chains.append(chain)
+			atomic.append(False)
+			local.append(mat)
+			children=node.children
+			if children:
+				stack.extend([(child, index, depth+1, chain) for child in reversed(children)])
+		self.locks=locks
+		prepared=self.Prepare([(None if atomic[i] else node) for i, node in enumerate(nodes)], whole)
+		count=len(nodes)
+		if not count:
+			return DrawList(scene, (), numpy.zeros((0, 16)), (), (), (), (), 0)
+		last=self._last
+		if last is not None and last[0]==nodes and last[1]==parents and all(a is b for a, b in zip(last[2], local)):
+			world, matrices=last[3], last[4]
+		else:
+			world=self.Compose(numpy.array(local), numpy.array(parents), numpy.array(depths))
+			#(Column-major, for glMultMatrixd)
+			matrices=numpy.ascontiguousarray(world.transpose(0, 2, 1).reshape(count, 16))
+			self._last=(nodes, parents, local, world, matrices)
+			self.composed+=1
+		keep=self.Cull(scene.camera, nodes, world, atomic)
+		culled=count-int(keep.sum())
+		nodelocks=[(locks[node] if atomic[i] else None) for i, node in enumerate(nodes)]
+		if culled:
+			which=numpy.nonzero(keep)[0]
+			matrices=matrices[which]
+			nodes=[nodes[i] for i in which]
+			chains=[chains[i] for i in which]
+			atomic=[atomic[i] for i in which]
+			prepared=[prepared[i] for i in which]
+			nodelocks=[nodelocks[i] for i in which]
+		return DrawList(scene, nodes, matrices, chains, atomic, prepared, nodelocks, culled)
+	def Prepare(self, nodes, whole=()):
+		'''Returns a list of the results of :func:`scenegraph.Renderable.Prepare`
+on every one of ``nodes`` (``None`` for any that are ``None``), and prepares
+the subtrees of the nodes of ``whole``, a sequence of ``(node, lock)``, each
+while holding its lock (in parallel, if there are several :attr:`workers`).'''
+		if self.pool is not None and len(nodes)+len(whole)>self.workers:
+			size=-(-len(nodes)//self.workers)
+			wsize=-(-len(whole)//self.workers)
+			chunks=[(nodes[i*size:(i+1)*size], whole[i*wsize:(i+1)*wsize]) for i in xrange(self.workers)]
+			prepared=[]
+			for part in self.pool.map(_PrepareAll, chunks):
+				prepared.extend(part)
+			return prepared
+		return _PrepareAll((nodes, whole))
+	@staticmethod
+	def Compose(local, parents, depths):
+		'''Returns the ``(N, 4, 4)`` world matrices of nodes with the ``(N, 4, 4)``
+``local`` matrices, the parent indices ``parents`` (-1 for none) and the depths
+``depths``, by one batched product per depth.'''
+		world=numpy.empty((len(local)+1, 4, 4))
+		#(Slot 0 is the identity, as the parent of the top nodes; node i is in slot i+1)
+		world[0]=numpy.eye(4)
+		order=numpy.argsort(depths, kind='mergesort')
+		bounds=numpy.searchsorted(depths[order], numpy.arange(depths.max()+2))
+		for start, end in zip(bounds[:-1], bounds[1:]):
+			level=order[start:end]
+			world[level+1]=numpy.matmul(world[parents[level]+1], local[level])
+		return world[1:]
+	@staticmethod
+	def Planes(mat):
+		'''Returns the six planes (as ``(a, b, c, d)`` rows, normalized, facing
+inward) of the view volume of the 4x4 projection and view matrix ``mat``.'''
+		planes=numpy.array([mat[3]+mat[0], mat[3]-mat[0], mat[3]+mat[1], mat[3]-mat[1], mat[3]+mat[2], mat[3]-mat[2]])
+		planes/=numpy.sqrt((planes[:, :3]**2).sum(axis=1))[:, None]
+		return planes
+	def Cull(self, camera, nodes, world, atomic):
+		'''Returns a boolean array of which ``nodes`` (with ``world`` matrices) are
+at least partly in the view of ``camera``. Only nodes with
+:attr:`scenegraph.Renderable.bounds` (and not atomic) are culled, and only if
+the camera's projection is known.'''
+		keep=numpy.ones(len(nodes), bool)
+		proj=camera.Projection()
+		if proj is None:
+			return keep
+		bounded=[i for i, node in enumerate(nodes) if node.bounds is not None and not atomic[i]]
+		if not bounded:
+			return keep
+		bounded=numpy.array(bounded)
+		radii=numpy.array([nodes[i].bounds for i in bounded], numpy.float64)
+		#(Scaled by the largest scale of each matrix)
+		radii*=numpy.sqrt((world[bounded, :3, :3]**2).sum(axis=1)).max(axis=1)
+		planes=self.Planes(proj.dot(camera.View()))
+		dist=world[bounded, :3, 3].dot(planes[:, :3].T)+planes[:, 3]
+		keep[bounded[~(dist>-radii[:, None]).all(axis=1)]]=False
+		return keep
+	@staticmethod
+	def Apply(node):
+		'''Set up the state ``node`` changes, other than its transformation (as
+:func:`scenegraph.Renderable.PushState` would).'''
+		if node.enable or node.disable:
+			GL.glPushAttrib(GL.GL_ENABLE_BIT)
+			for en in node.enable:
+				GL.glEnable(en)
+			for dis in node.disable:
+				GL.glDisable(dis)
+		if node.texture is not None:
+			node.texture.Apply()
+		for mod in node.modifications:
+			mod.Apply()
+	@staticmethod
+	def Revert(node):
+		'''Undo :func:`Apply` (as :func:`scenegraph.Renderable.PopState` would).'''
+		for mod in node.modifications:
+			mod.Revert()
+		if node.enable or node.disable:
+			GL.glPopAttrib()
+	def Submit(self, drawlist):
+		'''Draw ``drawlist`` (a :class:`DrawList`), making only GL calls.'''
+		scene=drawlist.scene
+		with scene:
+			#(As scene.Render does, before its children)
+			GL.glMatrixMode(GL.GL_MODELVIEW)
+			GL.glLoadIdentity()
+			GL.glMatrixMode(GL.GL_PROJECTION)
+			GL.glLoadIdentity()
+			with scene.camera:
+				scene.camera.Render()
+			GL.glMatrixMode(GL.GL_MODELVIEW)
+			applied=[]
+			for node, matrix, chain, atomic, prepared, lock in zip(drawlist.nodes, drawlist.matrices, drawlist.chains,
+																   drawlist.atomic, drawlist.prepared, drawlist.locks):
+				#Keep the state common to the last node, revert the rest, and apply what's new
+				common=0
+				while common<len(applied) and common<len(chain) and applied[common] is chain[common]:
+					common+=1
+				while len(applied)>common:
+					self.Revert(applied.pop())
+				for other in chain[common:]:
+					self.Apply(other)
+					applied.append(other)
+				GL.glPushMatrix()
+				GL.glMultMatrixd(matrix)
+				if atomic:
+					with lock:
+						with node:
+							node.Render()
+				else:
+					node.Draw(prepared)
+				GL.glPopMatrix()
+			while applied:
+				self.Revert(applied.pop())
+
+#: The local matrix of the nodes drawn whole (which apply their own transformations).
+IDENTITY=numpy.eye(4)
+
+def _PrepareAll(args):
+	nodes, whole=args
+	for node, lock in whole:
+		with lock:
+			below=[node]
+			while below:
+				other=below.pop()
+				other.Prepare()
+				below.extend(other.children)
+	return [(None if node is None else node.Prepare()) for node in nodes]
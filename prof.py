@@ -0,0 +1,290 @@
+'''
+.. mindscape -- Mindscape Engine
+prof -- Profiler
+================
+
+This module implements an opt-in frame profiler for the scene graph. When a
+:class:`Profiler` is enabled (see :func:`Profiler.Enable`), every
+:class:`scenegraph.Renderable` rendered through
+:func:`scenegraph.Renderable.RenderChildren` is timed in each of its phases
+(see :class:`PHASE`), along with the number of GL calls made during each phase.
+The results of the last few frames are kept in a ring buffer, and may be
+summarized (:func:`Profiler.Summary`), drawn as a live overlay (see
+:class:`layout.ProfileOverlay`), or exported to the Chrome trace event format
+(:func:`Profiler.Export`) for viewing in ``chrome://tracing``.
+
+When no profiler is enabled, the only cost to the renderer is a check of
+:data:`active` against ``None`` per :func:`scenegraph.Renderable.RenderChildren`
+call. GL calls are counted by wrapping the current :mod:`gl` backend in a
+:class:`gl.CountingBackend` while the profiler is enabled.
+
+A typical main loop looks like::
+
+	prof.Profiler().Enable()
+	while True:
+		prof.BeginFrame()
+		with scene:
+			scene.Render()
+		prof.EndFrame()
+		pygame.display.flip()
+
+:func:`BeginFrame` and :func:`EndFrame` do nothing if there is no active
+profiler, so they may be left in place.
+'''
+
+import json
+import collections
+import weakref
+from timeit import default_timer as clock
+
+from gl import GL, CountingBackend
+from log import main, DV1, DV2, DV3, obCode
+logger=main.getChild('prof')
+
+#: The currently enabled :class:`Profiler`, or ``None`` if profiling is disabled.
+active=None
+
+class PHASE:
+	'''An enumeration of the phases recorded for each node.'''
+	#: :func:`scenegraph.Renderable.PushState`
+	PUSH='push'
+	#: :func:`scenegraph.Renderable.Render`, including the rendering of children.
+	DRAW='draw'
+	#: :func:`scenegraph.Renderable.RenderChildren`, as called from within the node's :func:`scenegraph.Renderable.Render`.
+	CHILDREN='children'
+	#: :func:`scenegraph.Renderable.PopState`
+	POP='pop'
+	#: :func:`scenegraph.Texture.Apply`
+	TEXTURE='texture'
+	#: :func:`scenegraph.Mesh.Compile`
+	COMPILE='compile'
+
+class NodeStats(object):
+	'''Aggregated timing information for one node during one frame.'''
+	def __init__(self, name):
+		#: A string identifying the node (see :func:`Profiler.Name`).
+		self.name=name
+		#: The number of times the node was rendered this frame.
+		self.count=0
+		#: A ``dict`` mapping a :class:`PHASE` to total wall time (in seconds).
+		self.times={}
+		#: A ``dict`` mapping a :class:`PHASE` to a total number of GL calls.
+		self.glcalls={}
+	def Add(self, phase, dur, glcalls):
+		'''Accumulate a measurement of the given phase.'''
+		self.times[phase]=self.times.get(phase, 0)+dur
+		self.glcalls[phase]=self.glcalls.get(phase, 0)+glcalls
+	@property
+	def total(self):
+		'''The total time spent on this node, including its children.'''
+		return sum([self.times.get(i, 0) for i in (PHASE.PUSH, PHASE.DRAW, PHASE.POP)])
+	@property
+	def own(self):
+		'''The time spent on this node, excluding the rendering of children.'''
+		return self.total-self.times.get(PHASE.CHILDREN, 0)
+	@property
+	def owngl(self):
+		'''The number of GL calls made by this node, excluding those of its children.'''
+		gl=self.glcalls
+		return gl.get(PHASE.PUSH, 0)+gl.get(PHASE.DRAW, 0)+gl.get(PHASE.POP, 0)-gl.get(PHASE.CHILDREN, 0)
+
+class Frame(object):
+	'''The record of a single profiled frame.'''
+	def __init__(self, number, start):
+		#: The sequential frame number.
+		self.number=number
+		#: The time at which the frame started (from ``timeit.default_timer``).
+		self.start=start
+		#: The time at which the frame ended, or ``None`` if it's still running.
+		self.end=None
+		#: A list of ``(node id, phase, start, duration, glcalls)`` tuples, in order of completion.
+		self.spans=[]
+		#: A ``dict`` mapping node ids to :class:`NodeStats`.
+		self.nodes={}
+		#: The total number of GL calls made during the frame.
+		self.glcalls=0
+	@property
+	def duration(self):
+		'''The wall time of the frame, in seconds.'''
+		return (clock() if self.end is None else self.end)-self.start
+
+class Profiler(object):
+	'''A :class:`Profiler` records per-node, per-phase timings and GL call
+counts for the last ``frames`` frames.
+
+If ``spans`` is false, only the aggregated :class:`NodeStats` are kept for each
+frame, which is cheaper, but cannot be exported as a trace.'''
+	def __init__(self, frames=120, spans=True):
+		#: A ring buffer (``collections.deque``) of completed :class:`Frame`\ s.
+		self.frames=collections.deque(maxlen=frames)
+		#: Whether or not to record individual spans.
+		self.spans=spans
+		#: The :class:`Frame` in progress, or ``None``.
+		self.current=None
+		#: The :class:`gl.CountingBackend` installed while enabled, or ``None``.
+		self.counter=None
+		self.number=0
+		self._names=weakref.WeakKeyDictionary()
+	@property
+	def glcalls(self):
+		'''A running count of GL calls made while this profiler is enabled.'''
+		return (0 if self.counter is None else self.counter.calls)
+	def Enable(self):
+		'''Make this the :data:`active` profiler, wrapping the current
+:data:`gl.GL` backend so that GL calls may be counted. Any previously active
+profiler is disabled first.'''
+		global active
+		if active is not None:
+			active.Disable()
+		self.counter=CountingBackend(GL.Current())
+		GL.Use(self.counter)
+		active=self
+		logger.info('Profiler %s enabled', obCode(self))
+	def Disable(self):
+		'''Stop profiling, restoring the wrapped GL backend.'''
+		global active
+		if self.counter is not None:
+			if GL.Current() is self.counter:
+				GL.Use(self.counter.backend)
+			self.counter=None
+		if active is self:
+			active=None
+		logger.info('Profiler %s disabled', obCode(self))
+	def BeginFrame(self):
+		'''Start recording a new frame. If a frame is in progress, it is ended first.'''
+		if self.current is not None:
+			self.EndFrame()
+		self.current=Frame(self.number, clock())
+		self.current.glcalls=self.glcalls
+		self.number+=1
+	def EndFrame(self):
+		'''Finish the current frame and push it into the ring buffer.'''
+		frame=self.current
+		if frame is None:
+			return
+		frame.end=clock()
+		frame.glcalls=self.glcalls-frame.glcalls
+		self.frames.append(frame)
+		self.current=None
+	def Name(self, node):
+		'''Returns a (cached) human-readable name for ``node``, taken from its
+``name`` attribute if it has one, or its type and identity otherwise. Names
+are only cached while their nodes exist.'''
+		name=self._names.get(node)
+		if name is None:
+			name=getattr(node, 'name', None) or '%s@%x'%(type(node).__name__, id(node))
+			self._names[node]=name
+		return name
+	def Begin(self):
+		'''Returns a token marking the start of a measurement; pass this to :func:`End`.'''
+		return clock(), self.glcalls
+	def End(self, node, phase, token):
+		'''Record a measurement of ``phase`` on ``node``, which started when ``token`` was
+returned from :func:`Begin`.'''
+		self.Record(node, phase, token[0], clock(), self.glcalls-token[1])
+	def Record(self, node, phase, start, end, glcalls):
+		'''Record a measurement of ``phase`` on ``node`` taken between ``start`` and ``end``.'''
+		if self.current is None:
+			self.BeginFrame()
+		frame=self.current
+		key=id(node)
+		stats=frame.nodes.get(key)
+		if stats is None:
+			stats=frame.nodes[key]=NodeStats(self.Name(node))
+		stats.Add(phase, end-start, glcalls)
+		if self.spans:
+			frame.spans.append((key, phase, start, end-start, glcalls))
+	def RenderNode(self, node):
+		'''Render ``node`` exactly as :func:`scenegraph.Renderable.RenderChildren`
+would, recording its :attr:`PHASE.PUSH`, :attr:`PHASE.DRAW` and :attr:`PHASE.POP`
+phases.'''
+		t0, g0=clock(), self.glcalls
+		node.PushState()
+		t1, g1=clock(), self.glcalls
+		try:
+			node.Render()
+		finally:
+			t2, g2=clock(), self.glcalls
+			node.PopState()
+			t3=clock()
+			self.Record(node, PHASE.PUSH, t0, t1, g1-g0)
+			self.Record(node, PHASE.DRAW, t1, t2, g2-g1)
+			self.Record(node, PHASE.POP, t2, t3, self.glcalls-g2)
+		self.current.nodes[id(node)].count+=1
+	def RenderChildren(self, node):
+		'''Render the children of ``node``, recording the :attr:`PHASE.CHILDREN`
+phase on it.'''
+		token=self.Begin()
+		try:
+			for child in node.children:
+				self.RenderNode(child)
+		finally:
+			self.End(node, PHASE.CHILDREN, token)
+	def Summary(self, count=None):
+		'''Returns a list of ``(name, own time, total time, own GL calls)``
+tuples, averaged per frame over the frames in the ring buffer and sorted by
+descending own time. Times are in seconds. If ``count`` is given, only that
+many entries are returned.'''
+		if not self.frames:
+			return []
+		totals={}
+		for frame in self.frames:
+			for key, stats in frame.nodes.iteritems():
+				ent=totals.get(key)
+				if ent is None:
+					ent=totals[key]=[stats.name, 0, 0, 0]
+				ent[1]+=stats.own
+				ent[2]+=stats.total
+				ent[3]+=stats.owngl
+		n=float(len(self.frames))
+		res=sorted([(ent[0], ent[1]/n, ent[2]/n, ent[3]/n) for ent in totals.itervalues()], key=lambda i: -i[1])
+		if count is not None:
+			res=res[:count]
+		return res
+	def FrameTime(self):
+		'''Returns the average frame duration (in seconds) over the ring buffer.'''
+		if not self.frames:
+			return 0
+		return sum([i.duration for i in self.frames])/len(self.frames)
+	def FrameGL(self):
+		'''Returns the average number of GL calls per frame over the ring buffer.'''
+		if not self.frames:
+			return 0
+		return sum([i.glcalls for i in self.frames])/float(len(self.frames))
+	def Trace(self):
+		'''Returns the ring buffer contents as a Chrome trace event ``dict``
+(with timestamps in microseconds relative to the first frame).'''
+		events=[]
+		if not self.frames:
+			return {'traceEvents': events}
+		origin=self.frames[0].start
+		us=lambda t: (t-origin)*1e6
+		for frame in self.frames:
+			events.append({'name': 'frame %d'%(frame.number,), 'cat': 'frame', 'ph': 'X',
+						   'ts': us(frame.start), 'dur': frame.duration*1e6, 'pid': 0, 'tid': 0,
+						   'args': {'glcalls': frame.glcalls}})
+			events.append({'name': 'glcalls', 'ph': 'C', 'ts': us(frame.start), 'pid': 0,
+						   'args': {'glcalls': frame.glcalls}})
+			for key, phase, start, dur, glcalls in frame.spans:
+				events.append({'name': frame.nodes[key].name, 'cat': phase, 'ph': 'X',
+							   'ts': us(start), 'dur': dur*1e6, 'pid': 0, 'tid': 0,
+							   'args': {'phase': phase, 'glcalls': glcalls}})
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+	def Export(self, f):
+		'''Writes the Chrome trace JSON (see :func:`Trace`) to ``f``, which may
+be a file name or a file-like object.'''
+		if isinstance(f, basestring):
+			with open(f, 'w') as fo:
+				json.dump(self.Trace(), fo)
+		else:
+			json.dump(self.Trace(), f)
+
+def BeginFrame():
+	'''Calls :func:`Profiler.BeginFrame` on the :data:`active` profiler, if there is one.'''
+	if active is not None:
+		active.BeginFrame()
+
+def EndFrame():
+	'''Calls :func:`Profiler.EndFrame` on the :data:`active` profiler, if there is one.'''
+	if active is not None:
+		active.EndFrame()
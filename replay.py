@@ -0,0 +1,272 @@
+'''
+.. mindscape -- Mindscape Engine
+replay -- Input Recording and Replay
+====================================
+
+This module records the stream of engine events (see :mod:`event`) to a
+compact binary log, and plays it back, so that an interactive session can be
+reproduced exactly--e.g., to benchmark the UI under identical input across
+commits.
+
+To record, attach a :class:`Recorder` to the :class:`event.EventQueue` of a
+main loop; every batch of events dispatched is written, tagged with its frame
+number::
+
+	events=EventQueue()
+	events.recorder=Recorder('session.rec')
+
+To replay, use a :class:`Replayer` in place of the :class:`event.EventQueue`
+(it has the same :func:`Pump`/:func:`Dispatch`/:attr:`quit` interface), or call
+:func:`Play`, which runs every recorded frame at a fixed timestep, as fast as
+possible, without any window::
+
+	Play(Replayer('session.rec'), scene, step=lambda dt: ...)
+
+Only the typed events generated by the engine (:class:`event.KeyEvent`,
+:class:`event.MouseMoveEvent`, :class:`event.MouseButtonEvent` and
+:class:`event.WheelEvent`) are recorded; application-defined :class:`event.Event`\ s
+are skipped (and counted in :attr:`Recorder.skipped`).
+
+The log consists of a header (:data:`HEADER`: a magic string, the format
+version, and the nominal frame time) followed by records, each beginning with
+:data:`RECORD` (the frame number, a record kind, and the event subtype), then a
+kind-specific payload. An :attr:`KIND.END` record marks the last frame.
+'''
+
+import struct
+
+from vmath import Vector
+from event import KBD, KeyEvent, MouseMoveEvent, MouseButtonEvent, WheelEvent
+
+from log import main, DV1, DV2, DV3, obCode
+logger=main.getChild('replay')
+
+MAGIC=b'MSRP'
+VERSION=1
+
+#: The log header: magic, version, nominal seconds per frame.
+HEADER=struct.Struct('<4sHd')
+#: The record prefix: frame number, :class:`KIND`, subtype.
+RECORD=struct.Struct('<IBB')
+
+class KIND:
+	'''An enumeration of the kinds of records in a log.'''
+	#: The end of the log (the frame number is that of the last frame).
+	END=0
+	#: A :class:`event.KeyEvent` with a ``key``.
+	KEY=1
+	#: A :class:`event.KeyEvent` with a ``char``.
+	CHAR=2
+	#: A :class:`event.MouseMoveEvent`.
+	MOVE=3
+	#: A :class:`event.MouseButtonEvent`.
+	BUTTON=4
+	#: A :class:`event.WheelEvent`.
+	WHEEL=5
+
+#: The payload of each :class:`KIND`, except :attr:`KIND.CHAR` (a length, then UTF-8 bytes).
+PAYLOAD={KIND.END: struct.Struct('<'),
+		 KIND.KEY: struct.Struct('<i'),
+		 KIND.CHAR: struct.Struct('<H'),
+		 KIND.MOVE: struct.Struct('<ddddBB'), #pos, rel, number of buttons, button bitmask
+		 KIND.BUTTON: struct.Struct('<ddB'),
+		 KIND.WHEEL: struct.Struct('<dddd')}
+
+def _Open(f, mode):
+	if isinstance(f, basestring):
+		return open(f, mode), True
+	return f, False
+
+class Recorder(object):
+	'''A :class:`Recorder` writes events to ``f`` (a path, or a binary file
+object). ``dt`` is the nominal time per frame, which is stored in the header as a
+default for :func:`Play`.
+
+Events are buffered in memory, and written out every ``flush`` frames (and on
+:func:`Close`). A :class:`Recorder` is also a context manager, which closes it
+on exit.'''
+	def __init__(self, f, dt=1/30.0, flush=60):
+		self.file, self.owned=_Open(f, 'wb')
+		#: The number of the current frame.
+		self.frame=0
+		#: The number of frames between writes.
+		self.flush=flush
+		#: The number of events recorded.
+		self.recorded=0
+		#: The number of events that couldn't be recorded.
+		self.skipped=0
+		self.buffer=[HEADER.pack(MAGIC, VERSION, dt)]
+	def Record(self, ev):
+		'''Record the event ``ev`` in the current frame.'''
+		buf=self.buffer
+		tp=type(ev)
+		if tp is MouseMoveEvent:
+			mask=0
+			for i, b in enumerate(ev.buttons):
+				if b:
+					mask|=1<<i
+			buf.append(RECORD.pack(self.frame, KIND.MOVE, ev.subtype))
+			buf.append(PAYLOAD[KIND.MOVE].pack(ev.pos[0], ev.pos[1], ev.rel[0], ev.rel[1], len(ev.buttons), mask))
+		elif tp is KeyEvent:
+			if ev.subtype==KBD.CHAR:
+				data=ev.char.encode('utf-8')
+				buf.append(RECORD.pack(self.frame, KIND.CHAR, ev.subtype))
+				buf.append(PAYLOAD[KIND.CHAR].pack(len(data)))
+				buf.append(data)
+			else:
+				buf.append(RECORD.pack(self.frame, KIND.KEY, ev.subtype))
+				buf.append(PAYLOAD[KIND.KEY].pack(ev.key))
+		elif tp is MouseButtonEvent:
+			buf.append(RECORD.pack(self.frame, KIND.BUTTON, ev.subtype))
+			buf.append(PAYLOAD[KIND.BUTTON].pack(ev.pos[0], ev.pos[1], ev.button))
+		elif tp is WheelEvent:
+			buf.append(RECORD.pack(self.frame, KIND.WHEEL, ev.subtype))
+			buf.append(PAYLOAD[KIND.WHEEL].pack(ev.pos[0], ev.pos[1], ev.delta[0], ev.delta[1]))
+		else:
+			self.skipped+=1
+			return
+		self.recorded+=1
+	def NextFrame(self):
+		'''End the current frame. This is called by :func:`event.EventQueue.Dispatch`.'''
+		self.frame+=1
+		if self.frame%self.flush==0:
+			self.Flush()
+	def Flush(self):
+		'''Write out the buffered records.'''
+		self.file.write(b''.join(self.buffer))
+		del self.buffer[:]
+	def Close(self):
+		'''Write the :attr:`KIND.END` record, flush, and close the file (if it was opened from a path).'''
+		if self.file is None:
+			return
+		self.buffer.append(RECORD.pack(self.frame, KIND.END, 0))
+		self.Flush()
+		if self.owned:
+			self.file.close()
+		else:
+			self.file.flush()
+		self.file=None
+		logger.info('Recorded %d events over %d frames (%d skipped)', self.recorded, self.frame, self.skipped)
+	def __enter__(self):
+		return self
+	def __exit__(self, tp, val, tb):
+		self.Close()
+
+def Load(f):
+	'''Returns the contents of the log ``f`` (a path, or a binary file object).'''
+	f, owned=_Open(f, 'rb')
+	try:
+		return f.read()
+	finally:
+		if owned:
+			f.close()
+
+def Decode(data):
+	'''Decode the log contents ``data``. Returns ``(dt, frames, events)``, where
+``frames`` is the number of frames recorded, and ``events`` is a list of
+``(frame, event)`` pairs, in order. Raises ``ValueError`` if ``data`` isn't a log.'''
+	if len(data)<HEADER.size:
+		raise ValueError('Not a replay log (too short)')
+	magic, version, dt=HEADER.unpack_from(data, 0)
+	if magic!=MAGIC:
+		raise ValueError('Not a replay log (bad magic %r)'%(magic,))
+	if version!=VERSION:
+		raise ValueError('Unsupported replay log version %d'%(version,))
+	off=HEADER.size
+	events=[]
+	frames=0
+	while off<len(data):
+		frame, kind, sub=RECORD.unpack_from(data, off)
+		off+=RECORD.size
+		payload=PAYLOAD.get(kind)
+		if payload is None:
+			raise ValueError('Bad record kind %d at offset %d'%(kind, off-RECORD.size))
+		fields=payload.unpack_from(data, off)
+		off+=payload.size
+		if kind==KIND.END:
+			frames=frame
+			break
+		elif kind==KIND.KEY:
+			ev=KeyEvent(sub, key=fields[0])
+		elif kind==KIND.CHAR:
+			ev=KeyEvent(sub, char=data[off:off+fields[0]].decode('utf-8'))
+			off+=fields[0]
+		elif kind==KIND.MOVE:
+			x, y, dx, dy, n, mask=fields
+			ev=MouseMoveEvent(Vector(x, y), Vector(dx, dy), tuple([(mask>>i)&1 for i in xrange(n)]))
+		elif kind==KIND.BUTTON:
+			ev=MouseButtonEvent(sub, Vector(fields[0], fields[1]), fields[2])
+		elif kind==KIND.WHEEL:
+			ev=WheelEvent(Vector(fields[0], fields[1]), Vector(fields[2], fields[3]))
+		events.append((frame, ev))
+		frames=frame+1
+	return dt, frames, events
+
+class Replayer(object):
+	'''A :class:`Replayer` plays back the log ``f`` (a path, or a binary file
+object) one frame per :func:`Dispatch`. It may be used in place of an :class:`event.EventQueue`;
+:attr:`quit` is set once the last recorded frame has been dispatched.'''
+	def __init__(self, f):
+		#: The contents of the log.
+		self.data=Load(f)
+		self.Rewind()
+	def Rewind(self):
+		'''Start over from the first frame. The events are decoded afresh, since
+handlers may modify them (e.g., :class:`layout.Container` makes ``pos`` relative).'''
+		dt, frames, events=Decode(self.data)
+		#: The nominal time per frame, from the log.
+		self.dt=dt
+		#: The number of frames in the log.
+		self.frames=frames
+		#: The list of ``(frame, event)`` pairs in the log.
+		self.events=events
+		#: The number of the next frame to be dispatched.
+		self.frame=0
+		#: Set to ``True`` once every frame has been dispatched.
+		self.quit=(frames==0)
+		#: The :class:`event.Event`\ s of the next frame.
+		self.pending=[]
+		self.index=0
+	def Pump(self):
+		'''Load the next frame's events into :attr:`pending`.'''
+		events=self.events
+		i=self.index
+		while i<len(events) and events[i][0]==self.frame:
+			self.pending.append(events[i][1])
+			i+=1
+		self.index=i
+	def Dispatch(self, target):
+		'''Trigger the next frame's events on ``target``, and return them.'''
+		if not self.pending:
+			self.Pump()
+		batch=self.pending
+		self.pending=[]
+		for ev in batch:
+			target.Trigger(ev)
+		self.frame+=1
+		if self.frame>=self.frames:
+			self.quit=True
+		return batch
+
+def Play(replayer, scene, step=None, dt=None, render=True):
+	'''Play every frame of ``replayer`` (a :class:`Replayer`) into ``scene`` (a
+:class:`scenegraph.Scene`), from the start. For each frame, the events are
+dispatched, then ``step(dt)`` is called (if given) with the fixed timestep ``dt``
+(by default, :attr:`Replayer.dt`), then the scene is rendered (if ``render`` is
+true).
+
+This doesn't set up a GL backend; to run without a window, use a
+:class:`gl.RecordingBackend` first. Returns the number of frames played.'''
+	if dt is None:
+		dt=replayer.dt
+	replayer.Rewind()
+	frames=0
+	while not replayer.quit:
+		replayer.Dispatch(scene)
+		if step is not None:
+			step(dt)
+		if render:
+			with scene:
+				scene.Render()
+		frames+=1
+	return frames
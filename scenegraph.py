@@ -24,7 +24,9 @@ Any :class:`Renderable` may be one of the following:
   changed information is not compiled into the display list until the next
   compilation pass, which, at the latest, will be during the next render
   frame.
-* AnimatedMesh: Todo!
+* :class:`AnimatedMesh`: A mesh deformed by the bones of a :class:`Skeleton`, as posed by
+  an :class:`Animation`. All of its vertices are skinned at once, with ``numpy``,
+  into a vertex buffer that is updated each frame.
 * Sprite: A texture that is to face the camera, no matter the orientation.
 
 Additionally, the following objects exist in various parts outside the
@@ -33,18 +35,24 @@ hierarchy of the scene graph:
 * :class:`Vertex`: An object containing all the data needed to define a vertex.
 * :class:`Face`: An object containing a set of vertices, and a primitive rendering mode.
 * :class:`Texture`: A bound texture.
+* :class:`FrameBuffer`: A texture that may be rendered into.
 * :class:`Transform`: A transformation.
+* :class:`Skeleton`: A hierarchy of bones, as used by an :class:`AnimatedMesh`.
+* :class:`Animation`: Keyframes of the poses of the bones of a :class:`Skeleton`.
 '''
 
-import pygame
+import ctypes
+
 import numpy
-from OpenGL.GL import *
-from OpenGL.GLU import *
 
-from vmath import Vector, Matrix
+from vmath import Vector, Matrix, PoseMatrices, SlerpArray
+from gl import GL
 from event import EventHandler
-from log import main, DV1, DV2, DV3, obCode
+from log import main, DV1, DV2, DV3, obCode, Guard
+import prof
+import scheduler
 logger=main.getChild('sg')
+guard=Guard(logger)
 
 class Modification(object):
 	'''The :class:`Modification` is a generic class that applies some state
@@ -79,6 +87,15 @@ depend on the matrix stacks to do that.'''
 	def Revert(self):
 		'''Raises an error.'''
 		raise NotImplementedError('Reversion is not allowed for transformations.')
+	def Matrix(self):
+		'''Returns the transformation as a 4x4 ``numpy`` array (acting on column
+vectors, so that ``glMultMatrixd`` expects its transpose), or ``None`` if it
+can't be computed without GL. By default, it can't.
+
+Implementations return the same array for as long as the transformation is
+unchanged (so it mustn't be modified), which lets a :class:`pipeline.Pipeline`
+tell that nothing has moved.'''
+		return None
 
 class PRSTransform(Transform):
 	'''The :class:`PRSTransform` is the general-case transform for any object.
@@ -94,14 +111,109 @@ such a null-transform by default if none is given.)'''
 		self.rot=rot #Tuple of (angle, axis) where axis is (or is castable to) Vec3
 		#: A 3D :class:`vmath.Vector` to scale by.
 		self.scale=scale
+		self._key=None
+		self._matrix=None
 	def Apply(self):
 		'''Apply the transformation to the current matrix.'''
 		if self.pos is not None:
-			glTranslated(*self.pos.FastTo3())
+			GL.glTranslated(*self.pos.FastTo3())
 		if self.rot is not None:
-			glRotated(self.rot[0], *self.rot[1].FastTo3())
+			GL.glRotated(self.rot[0], *self.rot[1].FastTo3())
 		if self.scale is not None:
-			glScaled(*self.scale.FastTo3())
+			GL.glScaled(*self.scale.FastTo3())
+	def Matrix(self):
+		'''Returns the transformation as a 4x4 ``numpy`` array (see :func:`Transform.Matrix`).'''
+		pos, rot, scale=self.pos, self.rot, self.scale
+		#(The attributes may be changed in place, so compare their values)
+		key=((None if pos is None else pos.tostring()),
+			 (None if rot is None else (rot[0], rot[1].tostring())),
+			 (None if scale is None else scale.tostring()))
+		if key==self._key:
+			return self._matrix
+		mat=numpy.eye(4)
+		if self.pos is not None:
+			mat[:3, 3]=self.pos.FastTo3()
+		if self.rot is not None:
+			angle=numpy.radians(self.rot[0])
+			axis=numpy.asarray(self.rot[1].FastTo3(), numpy.float64)
+			norm=numpy.sqrt(axis.dot(axis))
+			if norm:
+				#(As glRotate does it)
+				x, y, z=axis/norm
+				c=numpy.cos(angle)
+				s=numpy.sin(angle)
+				t=1-c
+				mat[:3, :3]=mat[:3, :3].dot([[t*x*x+c, t*x*y-s*z, t*x*z+s*y],
+											 [t*x*y+s*z, t*y*y+c, t*y*z-s*x],
+											 [t*x*z-s*y, t*y*z+s*x, t*z*z+c]])
+		if self.scale is not None:
+			mat[:3, :3]*=self.scale.FastTo3()
+		self._key=key
+		self._matrix=mat
+		return mat
+
+class TransformStore(object):
+	'''A :class:`TransformStore` holds the matrices of many
+:class:`StoreTransform`\ s in one contiguous ``(N, 16)`` array
+(:attr:`matrices`), so that they can all be updated at once with array
+operations (see :func:`Set`) rather than one object at a time. Slots are
+allocated with :func:`Allocate`; the array grows (by doubling) as needed.
+:attr:`version` is incremented by every change made through these methods; if
+you write :attr:`matrices` directly, increment it too.'''
+	IDENTITY=numpy.eye(4, dtype=numpy.float64).flatten()
+	def __init__(self, capacity=64):
+		#: The ``(capacity, 16)`` array of column-major matrices.
+		self.matrices=numpy.tile(self.IDENTITY, (capacity, 1))
+		#: The number of slots ever allocated.
+		self.count=0
+		#: A counter incremented whenever :attr:`matrices` changes.
+		self.version=0
+		self.free=[]
+	def Allocate(self):
+		'''Returns the index of a new slot, set to the identity.'''
+		if self.free:
+			index=self.free.pop()
+		else:
+			index=self.count
+			self.count+=1
+			if index>=len(self.matrices):
+				grown=numpy.tile(self.IDENTITY, (2*len(self.matrices), 1))
+				grown[:len(self.matrices)]=self.matrices
+				self.matrices=grown
+		self.matrices[index]=self.IDENTITY
+		self.version+=1
+		return index
+	def Free(self, index):
+		'''Return the slot ``index`` for reuse.'''
+		self.free.append(index)
+	def Set(self, indices, pos, quat):
+		'''Set the slots ``indices`` (an integer array) to the poses given by the
+``(N, 3)`` array of positions ``pos`` and the ``(N, 4)`` array of unit
+quaternions ``quat`` (see :func:`vmath.PoseMatrices`).'''
+		self.matrices[indices]=PoseMatrices(pos, quat)
+		self.version+=1
+
+class StoreTransform(Transform):
+	'''A :class:`StoreTransform` multiplies the current matrix by slot
+:attr:`index` of a :class:`TransformStore` (allocating one if ``index`` isn't
+given).'''
+	def __init__(self, store, index=None):
+		#: The :class:`TransformStore`.
+		self.store=store
+		#: The slot index.
+		self.index=(store.Allocate() if index is None else index)
+		self._version=None
+		self._matrix=None
+	def Apply(self):
+		'''Apply the transformation to the current matrix.'''
+		GL.glMultMatrixd(self.store.matrices[self.index])
+	def Matrix(self):
+		'''Returns the transformation as a 4x4 ``numpy`` array (see :func:`Transform.Matrix`).'''
+		store=self.store
+		if store.version!=self._version:
+			self._matrix=store.matrices[self.index].reshape(4, 4).T.copy()
+			self._version=store.version
+		return self._matrix
 
 class MultiTransform(Transform):
 	'''The :class:'MultiTransform` simply applies a list of transformations (as
@@ -110,10 +222,27 @@ attribute) in the order given.'''
 	def __init__(self, *transforms):
 		#: A ``list`` of :class:`Transform`\ s to apply in order.
 		self.transforms=list(transforms)
-	def Apply(swelf):
+		self._parts=None
+		self._matrix=None
+	def Apply(self):
 		'''Apply the transformation to the current matrix.'''
 		for tran in self.transforms:
 			tran.Apply()
+	def Matrix(self):
+		'''Returns the product of the transformations (see :func:`Transform.Matrix`),
+or ``None`` if any of them can't be computed.'''
+		parts=[tran.Matrix() for tran in self.transforms]
+		if any(part is None for part in parts):
+			return None
+		old=self._parts
+		if old is not None and len(old)==len(parts) and all(a is b for a, b in zip(old, parts)):
+			return self._matrix
+		mat=numpy.eye(4)
+		for other in parts:
+			mat=mat.dot(other)
+		self._parts=parts
+		self._matrix=mat
+		return mat
 
 class MatrixTransform(Transform):
 	'''The :class:`MatrixTransform` multiplies the current matrix directly by
@@ -121,9 +250,19 @@ the :class:`vmath.Matrix` given.'''
 	def __init__(self, matrix):
 		#: A :class:`vmath.Matrix` to multiply into the current matrix.
 		self.matrix=matrix
+		self._key=None
+		self._matrix=None
 	def Apply(self):
 		'''Apply the transformation to the current matrix.'''
-		glMultMatrixd(*numpy.array(self.matrix.transpose().flatten())[0])
+		GL.glMultMatrixd(*numpy.array(self.matrix.transpose().flatten())[0])
+	def Matrix(self):
+		'''Returns the transformation as a 4x4 ``numpy`` array (see :func:`Transform.Matrix`).'''
+		mat=numpy.array(self.matrix, numpy.float64)
+		key=mat.tostring()
+		if key!=self._key:
+			self._key=key
+			self._matrix=mat
+		return self._matrix
 
 class ModBlendFunc(Modification):
 	'''This is a simple :class:`Modification` which changes the current GL
@@ -136,7 +275,7 @@ call'''
 		self.dstfunc=dstfunc
 	def Apply(self):
 		'''Apply the blending function.'''
-		glBlendFunc(self.srcfunc, self.dstfunc)
+		GL.glBlendFunc(self.srcfunc, self.dstfunc)
 	def Revert(self):
 		'''Does nothing.
 
@@ -158,8 +297,8 @@ the parameter.'''
 		self.magfilter=magfilter
 	def Apply(self):
 		'''Applies the texture filters.'''
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, self.minfilter)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, self.magfilter)
+		GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, self.minfilter)
+		GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, self.magfilter)
 	def Revert(self):
 		'''Does nothing.
 
@@ -182,8 +321,8 @@ the parameter.'''
 		self.wrapt=wrapt
 	def Apply(self):
 		'''Apply the wrapping mode.'''
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, self.wraps)
-		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, self.wrapt)
+		GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, self.wraps)
+		GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, self.wrapt)
 	def Revert(self):
 		'''Does nothing.
 
@@ -228,13 +367,19 @@ If the surface parameter is ``None``, the texture will be allocated, but no
 data will be uploaded to it.'''
 	#: A ``set`` of all active Texture objects (class attr)
 	ALL=set()
-	#: The default :class:`ModTexFilter` if none is specified in the constructor (class attr)
-	DEFAULT_FILTER=ModTexFilter(GL_LINEAR, GL_LINEAR)
-	#: The default :class:`ModTexWrap` if none is specified in the constructor (class attr)
-	DEFAULT_WRAP=ModTexWrap(GL_REPEAT, GL_REPEAT)
+	#: The default :class:`ModTexFilter` if none is specified in the constructor (class attr; GL_LINEAR if left ``None``)
+	DEFAULT_FILTER=None
+	#: The default :class:`ModTexWrap` if none is specified in the constructor (class attr; GL_REPEAT if left ``None``)
+	DEFAULT_WRAP=None
 	def __init__(self, surf=None, filter=None, wrap=None):
+		#The defaults are made here, rather than in the class body, so that
+		#importing this module doesn't need to resolve GL constants.
+		if Texture.DEFAULT_FILTER is None:
+			Texture.DEFAULT_FILTER=ModTexFilter(GL.GL_LINEAR, GL.GL_LINEAR)
+		if Texture.DEFAULT_WRAP is None:
+			Texture.DEFAULT_WRAP=ModTexWrap(GL.GL_REPEAT, GL.GL_REPEAT)
 		#: An unsigned integer which represents GL's handle to the texture.
-		self.id=glGenTextures(1)
+		self.id=GL.glGenTextures(1)
 		#: A ``pygame.Surface`` from which the texture data is loaded.
 		self.surf=surf
 		#: A :class:`ModTexFilter` specifying how the texture is to be filtered.
@@ -257,17 +402,25 @@ texture parameters.
 	(and their drivers) tend to prioritize speed of access over speed of uploading
 	(for obvious reasons), so this will likely not be an efficient way to animate
 	textures, and should only be done as necessary.'''
-		glBindTexture(GL_TEXTURE_2D, self.id)
+		import pygame
+		if guard.DV1:
+			logger.log(DV1, 'Reloading texture %s (%dx%d)', obCode(self), self.surf.get_width(), self.surf.get_height())
+		GL.glBindTexture(GL.GL_TEXTURE_2D, self.id)
 		self.filter.Apply()
 		self.wrap.Apply()
-		glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.surf.get_width(),
-					 self.surf.get_height(), 0, GL_RGBA, GL_UNSIGNED_BYTE,
-					 pygame.image.tostring(self.surf, 'RGBA', True))
-		glFlush()
+		GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, self.surf.get_width(),
+						self.surf.get_height(), 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+						pygame.image.tostring(self.surf, 'RGBA', True))
+		GL.glFlush()
 	def Apply(self):
 		'''Bind the texture such that it is available for the next rendering operation.'''
-		glEnable(GL_TEXTURE_2D)
-		glBindTexture(GL_TEXTURE_2D, self.id)
+		p=prof.active
+		if p is not None:
+			token=p.Begin()
+		GL.glEnable(GL.GL_TEXTURE_2D)
+		GL.glBindTexture(GL.GL_TEXTURE_2D, self.id)
+		if p is not None:
+			p.End(self, prof.PHASE.TEXTURE, token)
 	def Revert(self):
 		'''Does nothing.
 
@@ -277,7 +430,90 @@ texture parameters.
 	disable GL_TEXTURE_2D. This is easiest done by having it so that
 	GL_TEXTURE_2D is enabled only so long as that geometry is rendering--by
 	putting it in the :attr:`Renderable.enable` set.'''
-		glDisable(GL_TEXTURE_2D) #XXX Should we actually rebind the old texture? What if there isn't one?
+		GL.glDisable(GL.GL_TEXTURE_2D) #XXX Should we actually rebind the old texture? What if there isn't one?
+
+class FrameBuffer(object):
+	'''A :class:`FrameBuffer` is a framebuffer object with a :class:`Texture`
+of ``width`` by ``height`` pixels (with an alpha channel) as its color buffer,
+so that a scene (or part of one) may be rendered once, and drawn as a single
+textured quad thereafter. Used as a context manager, it directs rendering into
+the texture (with a viewport covering all of it, and no scissor test) until the end of the block,
+after which the previous framebuffer and viewport are restored. These may be
+nested. If ``depth`` is true, a depth buffer is attached as well, for
+rendering 3D scenes.'''
+	#: The framebuffer names bound by the enclosing blocks (class attr).
+	STACK=[]
+	def __init__(self, width, height, depth=False):
+		#: The framebuffer object name.
+		self.id=GL.glGenFramebuffers(1)
+		#: The depth renderbuffer name, or ``None`` if there's no depth buffer.
+		self.depth=(GL.glGenRenderbuffers(1) if depth else None)
+		#: The :class:`Texture` rendered into.
+		self.tex=Texture(wrap=ModTexWrap(GL.GL_CLAMP_TO_EDGE, GL.GL_CLAMP_TO_EDGE))
+		self.width=0
+		self.height=0
+		self.Resize(width, height)
+	def Resize(self, width, height):
+		'''(Re)allocate the texture at the given size (which loses its contents).'''
+		self.width=width
+		self.height=height
+		GL.glBindTexture(GL.GL_TEXTURE_2D, self.tex.id)
+		self.tex.filter.Apply()
+		self.tex.wrap.Apply()
+		GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, width, height, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
+		GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.id)
+		GL.glFramebufferTexture2D(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0, GL.GL_TEXTURE_2D, self.tex.id, 0)
+		if self.depth is not None:
+			GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self.depth)
+			GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_DEPTH_COMPONENT24, width, height)
+			GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER, GL.GL_DEPTH_ATTACHMENT, GL.GL_RENDERBUFFER, self.depth)
+			GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, 0)
+		status=GL.glCheckFramebufferStatus(GL.GL_FRAMEBUFFER)
+		if status is not None and status!=GL.GL_FRAMEBUFFER_COMPLETE:
+			logger.warning('Framebuffer %s (%dx%d) is incomplete (status 0x%x)', obCode(self), width, height, status)
+		GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, (self.STACK[-1] if self.STACK else 0))
+	def __enter__(self):
+		GL.glPushAttrib(GL.GL_VIEWPORT_BIT|GL.GL_SCISSOR_BIT)
+		GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.id)
+		self.STACK.append(self.id)
+		GL.glViewport(0, 0, self.width, self.height)
+		#(Any scissor box is in the enclosing framebuffer's coordinates)
+		GL.glDisable(GL.GL_SCISSOR_TEST)
+	def __exit__(self, *exc_info):
+		self.STACK.pop()
+		GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, (self.STACK[-1] if self.STACK else 0))
+		GL.glPopAttrib()
+	def Delete(self):
+		'''Free the framebuffer object and depth buffer (but not the texture, which is freed as usual).'''
+		GL.glDeleteFramebuffers([self.id])
+		self.id=None
+		if self.depth is not None:
+			GL.glDeleteRenderbuffers([self.depth])
+			self.depth=None
+	def Draw(self, minima=(-1, -1), maxima=(1, 1), blend=True):
+		'''Draw the texture as a quad from ``minima`` to ``maxima`` (by default,
+filling the viewport, given identity matrices), blended over what's there (or,
+if ``blend`` is false, replacing it).'''
+		GL.glPushAttrib(GL.GL_ENABLE_BIT|GL.GL_COLOR_BUFFER_BIT)
+		GL.glDisable(GL.GL_DEPTH_TEST)
+		if blend:
+			GL.glEnable(GL.GL_BLEND)
+			GL.glBlendFunc(GL.GL_ONE, GL.GL_ONE_MINUS_SRC_ALPHA)
+		else:
+			GL.glDisable(GL.GL_BLEND)
+		with self.tex:
+			GL.glColor4d(1, 1, 1, 1)
+			GL.glBegin(GL.GL_QUADS)
+			GL.glTexCoord2d(0, 0)
+			GL.glVertex2d(minima[0], minima[1])
+			GL.glTexCoord2d(1, 0)
+			GL.glVertex2d(maxima[0], minima[1])
+			GL.glTexCoord2d(1, 1)
+			GL.glVertex2d(maxima[0], maxima[1])
+			GL.glTexCoord2d(0, 1)
+			GL.glVertex2d(minima[0], maxima[1])
+			GL.glEnd()
+		GL.glPopAttrib()
 
 class Renderable(EventHandler):
 	'''The :class:`Renderable` class implements anything and everything that
@@ -294,8 +530,20 @@ propagating) of keyword arguments is copied down the inheritance chain, meaning
 that the :attr:`texture` argument has the same meaning on a :class:`WSSprite`
 as it does a :class:`Mesh`, or even a :class:`Camera` (though it is not used
 there). Keep this inheritance in mind when considering how to, e.g., move a
-:class:`Mesh`, change the texture of a :class:`WSSprite`, etc.'''
+:class:`Mesh`, change the texture of a :class:`WSSprite`, etc.
+
+Besides being rendered recursively, as above, a scene may be drawn through a
+:class:`pipeline.Pipeline`, which walks it ahead of time (calling
+:func:`Prepare` on each node, and culling those with :attr:`bounds` outside the
+view), and then draws each node separately (see :func:`Draw`), with its
+transformation composed in advance.'''
+	#: Whether or not a :class:`pipeline.Pipeline` must draw this node and all of its
+	#: children together, through :func:`Render`, rather than node by node (class attr).
+	ATOMIC=False
+	#: The node being drawn by :func:`Draw`, whose children are therefore skipped (class attr).
+	DRAWING=None
 	def __init__(self, *children, **kwargs):
+		EventHandler.__init__(self)
 		#: A list of :class:`Renderable`\ s, which may be empty.
 		self.children=[]
 		#: A :class:`Renderable` of which this is a child, or ``None``.
@@ -316,6 +564,9 @@ there). Keep this inheritance in mind when considering how to, e.g., move a
 		self.texture=kwargs.get('texture', None)
 		#: A ``set`` of modifications to be :func:`Modification.Apply`'d before rendering; default empty.
 		self.modifications=kwargs.get('modifications', set())
+		#: The radius of a sphere, about this node's origin in its own coordinates, containing
+		#: its own geometry (not its children's), so that it can be culled; or ``None`` (the default) to never cull it.
+		self.bounds=kwargs.get('bounds', None)
 	def PushState(self):
 		'''Push the state (set up everything before actually rendering).
 
@@ -328,14 +579,14 @@ there). Keep this inheritance in mind when considering how to, e.g., move a
 
 	This is guaranteed to call :func:`PopState` for you, even if an error occurs.'''
 		if self.enable or self.disable:
-			glPushAttrib(GL_ENABLE_BIT)
+			GL.glPushAttrib(GL.GL_ENABLE_BIT)
 			for en in self.enable:
-				glEnable(en)
+				GL.glEnable(en)
 			for dis in self.disable:
-				glDisable(dis)
+				GL.glDisable(dis)
 		if self.mmode is not None:
-			glMatrixMode(self.mmode)
-		glPushMatrix()
+			GL.glMatrixMode(self.mmode)
+		GL.glPushMatrix()
 		self.transform.Apply()
 		if self.texture is not None:
 			self.texture.Apply()
@@ -346,10 +597,10 @@ there). Keep this inheritance in mind when considering how to, e.g., move a
 		for mod in self.modifications:
 			mod.Revert()
 		if self.mmode is not None:
-			glMatrixMode(self.mmode)
-		glPopMatrix()
+			GL.glMatrixMode(self.mmode)
+		GL.glPopMatrix()
 		if self.enable or self.disable:
-			glPopAttrib()
+			GL.glPopAttrib()
 	#Context-manager hacks
 	def __enter__(self):
 		self.PushState()
@@ -362,6 +613,27 @@ there). Keep this inheritance in mind when considering how to, e.g., move a
 
 	This must be defined in a subclass.'''
 		raise NotImplementedError('Renderable derivative must implement .Render()')
+	def Prepare(self):
+		'''Do whatever work rendering needs that doesn't involve GL (such as
+laying out, or rasterizing text), and return what :func:`Draw` needs of it. A
+:class:`pipeline.Pipeline` calls this on every node before drawing, possibly
+from another thread, while the previous frame is drawn; so it mustn't make GL
+calls, or change anything :func:`Draw` relies on--which is why the result is
+passed to :func:`Draw`, rather than kept here. (Nodes drawn whole, such as
+:attr:`ATOMIC` ones, are prepared and drawn one at a time instead.) By default,
+this does nothing, and returns ``None``.'''
+		return None
+	def Draw(self, prepared=None):
+		'''Render this node, but not its children (as a :class:`pipeline.Pipeline`
+does, given that the state has been set up), using ``prepared``, the result of
+:func:`Prepare` (or, if ``None``, preparing it first, if it needs to be). By
+default, this calls :func:`Render` with :func:`RenderChildren` doing nothing
+for this node.'''
+		Renderable.DRAWING=self
+		try:
+			self.Render()
+		finally:
+			Renderable.DRAWING=None
 	def RenderChildren(self):
 		'''Render all child objects.
 
@@ -375,18 +647,43 @@ This is intended to be called from within a defined :func:`Render` method.
 	such a pairing, nor should you call it if you're concerned about losing some
 	of your state information; it's best to call this at the end of :func:`Render`
 	and depend on your own :func:`PopState` method to do whatever cleanup is
-	needed.'''
+	needed.
+
+.. note::
+
+	If a :class:`prof.Profiler` is enabled, the children are rendered through
+	:func:`prof.Profiler.RenderChildren` instead, which times each of them.'''
+		if self is Renderable.DRAWING:
+			return
+		if prof.active is not None:
+			prof.active.RenderChildren(self)
+			return
 		for child in self.children:
 			with child:
 				child.Render()
 	def TriggerChildren(self, ev):
-		'''Propagate an :class:`Event` to child :class:`Renderable`\ s.
+		'''Propagate an :class:`Event` to child :class:`Renderable`\ s (skipping
+those with nothing subscribed to it). Children whose :attr:`parent` isn't this
+node were appended to :attr:`children` directly, so their subscriptions aren't
+in :attr:`event.EventHandler.listening`; they're always visited.
 
 .. note::
 
 	See :func:`event.EventHandler.Trigger`.'''
 		for child in self.children:
-			child.Trigger(ev)
+			if child.listening or child.parent is not self:
+				child.Trigger(ev)
+	def ChildAdded(self, child):
+		'''Called by :func:`SetParent` after ``child`` is appended to :attr:`children`.
+By default, this adds the child's subscriptions to the summary (:attr:`event.EventHandler.listening`)
+of this node and its ancestors; subclasses which override this must call it.'''
+		if child.listening:
+			self.UpdateListening(child.listening, 1)
+	def ChildRemoved(self, child):
+		'''Called by :func:`ClearParent` after ``child`` is removed from :attr:`children`.
+See :func:`ChildAdded`.'''
+		if child.listening:
+			self.UpdateListening(child.listening, -1)
 	def SetParent(self, par):
 		'''Set the parent of this :class:`Renderable`. The state at which this
 renderable enters its :func:`Render` method will now be a subset of the states
@@ -396,10 +693,20 @@ appropriately. If a parent was previously set, it will be cleared.
 
 .. note::
 
-	This operation will never fail.'''
+	This operation will never fail.
+
+.. warning::
+
+	Children appended directly to :attr:`children` bypass this. Their
+	subscriptions aren't added to their ancestors' summaries (see
+	:class:`event.EventHandler`), so they only receive events their parent is
+	triggered with for other reasons (see :func:`TriggerChildren`), and they
+	don't know their :attr:`parent` (so a :class:`layout.Widget` can't
+	:func:`layout.Widget.Invalidate` its ancestors).'''
 		self.ClearParent()
 		self.parent=par
 		par.children.append(self)
+		par.ChildAdded(self)
 	def ClearParent(self):
 		'''Clears the parent of this :class:`Renderable`, if one exists. It is
 thereby removed from that tree, and will not render if that tree contains the
@@ -412,11 +719,14 @@ is removed from the :attr:`children` collection of the parent, and this object's
 
 	This operation will never fail.'''
 		if self.parent is not None:
+			par=self.parent
+			self.parent=None
 			try:
-				self.parent.children.remove(self)
+				par.children.remove(self)
 			except ValueError:
 				pass
-			self.parent=None
+			else:
+				par.ChildRemoved(self)
 
 class Camera(Renderable):
 	'''This class is the base class to two more specific cameras, but it also
@@ -431,7 +741,7 @@ in the scene.'''
 		self.center=center
 		#: A 3D :class:`vmath.Vector` representing up direction.
 		self.up=up
-		self.mmode=GL_MODELVIEW
+		self.mmode=GL.GL_MODELVIEW
 	def PushState(self):
 		'''Does nothing. (The default :func:`Renderable.PushState` would interfere with the matrix mode.)'''
 		pass #Do not affect the matrix stack; this one must remain current.
@@ -440,9 +750,28 @@ in the scene.'''
 		pass #Ditto.
 	def Render(self):
 		'''Sets up the camera transformation.'''
-		glMatrixMode(GL_MODELVIEW)
-		gluLookAt(*(tuple(self.pos.FastTo3())+tuple(self.center.FastTo3())+tuple(self.up.FastTo3())))
+		GL.glMatrixMode(GL.GL_MODELVIEW)
+		GL.gluLookAt(*(tuple(self.pos.FastTo3())+tuple(self.center.FastTo3())+tuple(self.up.FastTo3())))
 		self.RenderChildren()
+	def View(self):
+		'''Returns the camera transformation (as ``gluLookAt`` makes it) as a 4x4
+``numpy`` array (see :func:`Transform.Matrix`).'''
+		pos=numpy.asarray(self.pos.FastTo3(), numpy.float64)
+		f=numpy.asarray(self.center.FastTo3(), numpy.float64)-pos
+		f/=numpy.sqrt(f.dot(f))
+		s=numpy.cross(f, numpy.asarray(self.up.FastTo3(), numpy.float64))
+		s/=numpy.sqrt(s.dot(s))
+		u=numpy.cross(s, f)
+		mat=numpy.eye(4)
+		mat[0, :3]=s
+		mat[1, :3]=u
+		mat[2, :3]=-f
+		mat[:3, 3]=-mat[:3, :3].dot(pos)
+		return mat
+	def Projection(self):
+		'''Returns the projection as a 4x4 ``numpy`` array, or ``None`` if it isn't
+known (as here, in the base class).'''
+		return None
 
 class PerspectiveCamera(Camera):
 	'''A :class:`Perspective` camera is a :class:`Camera` whose projection
@@ -458,12 +787,23 @@ constructor (and attributes) are applied.'''
 		self.near=near
 		#: The far clipping plane. (>0)
 		self.far=far
-		self.mmode=GL_PROJECTION
+		self.mmode=GL.GL_PROJECTION
 	def Render(self):
 		'''Apply the camera projection.'''
 		super(PerspectiveCamera, self).Render()
-		glMatrixMode(GL_PROJECTION)
-		gluPerspective(self.fov, self.aspect, self.near, self.far)
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.gluPerspective(self.fov, self.aspect, self.near, self.far)
+	def Projection(self):
+		'''Returns the projection (as ``gluPerspective`` makes it) as a 4x4 ``numpy`` array.'''
+		f=1.0/numpy.tan(numpy.radians(self.fov)/2)
+		near, far=self.near, self.far
+		mat=numpy.zeros((4, 4))
+		mat[0, 0]=f/self.aspect
+		mat[1, 1]=f
+		mat[2, 2]=(far+near)/(near-far)
+		mat[2, 3]=2*far*near/(near-far)
+		mat[3, 2]=-1
+		return mat
 
 class OrthographicCamera(Camera):
 	'''A :class:`Perspective` camera is a :class:`Camera` whose projection
@@ -479,12 +819,12 @@ constructor (and attributes) are applied.'''
 		self.bottom=bottom
 		#: The topmost coordinate.
 		self.top=top
-		self.mmode=GL_PROJECTION
+		self.mmode=GL.GL_PROJECTION
 	def Render(self):
 		'''Apply the camera projection.'''
 		super(PerspectiveCamera, self).Render()
-		glMatrixMode(GL_PROJECTION)
-		gluOrtho2D(self.left, self.right, self.bottom, self.top)
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.gluOrtho2D(self.left, self.right, self.bottom, self.top)
 
 class Scene(Renderable):
 	'''A :class:`Scene` is intended to be the scenegraph parent of all other
@@ -510,13 +850,13 @@ Despite this design intention, it is entirely possible to have multiple
 
 		with scene:
 			scene.Render()'''
-		glMatrixMode(GL_MODELVIEW)
-		glLoadIdentity()
-		glMatrixMode(GL_PROJECTION)
-		glLoadIdentity()
+		GL.glMatrixMode(GL.GL_MODELVIEW)
+		GL.glLoadIdentity()
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.glLoadIdentity()
 		with self.camera:
 			self.camera.Render()
-		glMatrixMode(GL_MODELVIEW)
+		GL.glMatrixMode(GL.GL_MODELVIEW)
 		self.RenderChildren()
 
 class Mesh(Renderable):
@@ -529,6 +869,21 @@ Aside from this feature, they are no different from any other :class:`Renderable
 		self.faces=list(faces)
 		#: Whether or not to compile this :class:`Mesh`.
 		self.compile=kwargs.get('compile', True)
+		#: Whether or not to compile as a deferred task of the :data:`scheduler.active`
+		#: :class:`scheduler.Scheduler` (if there is one), rather than during rendering.
+		#: The mesh is drawn uncompiled until then.
+		self.defer=kwargs.get('defer', False)
+		self.task=None
+		#: A counter incremented by :func:`Changed`; anything derived from the
+		#: geometry (the display list, a :class:`phys.Mesh`, ...) is rebuilt when
+		#: it no longer matches.
+		self.version=0
+		#: The :attr:`version` last compiled, or ``None``.
+		self.compiled=None
+	def Changed(self):
+		'''Note that the :attr:`faces` (or their vertices) have been modified, so
+that the display list is recompiled when next rendered.'''
+		self.version+=1
 	def Compile(self, execute=False):
 		'''Compile the mesh.
 
@@ -538,27 +893,239 @@ Aside from this feature, they are no different from any other :class:`Renderable
 	attribute. However, without the :attr:`compile` attribute set, the compiled
 	display list won't actually be called on rendering. (One surmises the resultant
 	display list could, of course, be used elsewhere for hackish reasons...).'''
+		p=prof.active
+		if p is not None:
+			token=p.Begin()
+		if guard.DV1:
+			logger.log(DV1, 'Compiling mesh %s (%d faces)', obCode(self), len(self.faces))
 		if not hasattr(self, 'list'):
-			self.list=glGenLists(1)
-		glNewList(self.list, (GL_COMPILE_AND_EXECUTE if execute else GL_COMPILE))
+			self.list=GL.glGenLists(1)
+		GL.glNewList(self.list, (GL.GL_COMPILE_AND_EXECUTE if execute else GL.GL_COMPILE))
 		self.Render(True)
-		glEndList()
+		GL.glEndList()
+		self.compiled=self.version
+		if p is not None:
+			p.End(self, prof.PHASE.COMPILE, token)
+	def _DeferredCompile(self):
+		self.Compile()
+		self.task=None
 	def Render(self, justgeometry=False):
 		'''Renders the mesh. if :attr:`compile` is True, this will also compile
-the mesh, if needed.'''
+the mesh, if needed (see :attr:`defer`).'''
 		if self.compile and not justgeometry:
-			if hasattr(self, 'list'):
-				glCallList(self.list)
-			else:
+			if self.compiled==self.version:
+				GL.glCallList(self.list)
+				self.RenderChildren()
+				return
+			if not self.defer or scheduler.active is None:
 				self.Compile(True)
-			self.RenderChildren()
-			return
+				self.RenderChildren()
+				return
+			if self.task is None:
+				self.task=scheduler.active.Defer(self._DeferredCompile)
 		for face in self.faces:
 			with face:
 				face.Render()
 		if not justgeometry:
 			self.RenderChildren()
 
+class Skeleton(object):
+	'''A :class:`Skeleton` is a hierarchy of bones, given as ``parents``, a
+sequence of the index of each bone's parent (-1 for a root), and ``bind``, a
+``(B, 4, 4)`` array of the bones' transformations (acting on column vectors, as
+:func:`Transform.Matrix` returns them) relative to the mesh in its bind pose.
+
+Poses are evaluated for all of the bones at once: the local transformations are
+composed down the hierarchy with one batched product per level of the tree.'''
+	def __init__(self, parents, bind):
+		#: The ``(B,)`` integer array of parent indices.
+		self.parents=numpy.array(parents, numpy.intp)
+		bind=numpy.asarray(bind, numpy.float64)
+		#: The ``(B, 4, 4)`` array of the inverses of the bind pose transformations.
+		self.inverse=numpy.linalg.inv(bind)
+		depths=numpy.zeros(len(self.parents), numpy.intp)
+		for index, parent in enumerate(self.parents):
+			if parent>=index:
+				raise ValueError('Bone %d has parent %d; parents must come before their children'%(index, parent))
+			if parent>=0:
+				depths[index]=depths[parent]+1
+		#: A list of the arrays of the indices of the bones at each depth.
+		self.levels=[numpy.nonzero(depths==depth)[0] for depth in xrange(depths.max()+1 if len(depths) else 0)]
+	def __len__(self):
+		return len(self.parents)
+	def Compose(self, local):
+		'''Returns the ``(B, 4, 4)`` transformations of the bones relative to the
+mesh, given the ``(B, 4, 4)`` ``local`` transformations of each relative to its parent.'''
+		world=numpy.empty((len(local)+1, 4, 4))
+		#(Slot 0 is the identity, as the parent of the roots; bone i is in slot i+1)
+		world[0]=numpy.eye(4)
+		for level in self.levels:
+			world[level+1]=numpy.matmul(world[self.parents[level]+1], local[level])
+		return world[1:]
+	def Palette(self, pos, quat):
+		'''Returns the ``(B, 3, 4)`` skinning matrices (the upper three rows of each
+bone's transformation times its inverse bind pose) for the pose given by the
+``(B, 3)`` array of bone positions ``pos`` and the ``(B, 4)`` array of unit
+quaternions ``quat``, relative to each bone's parent.'''
+		local=PoseMatrices(pos, quat).reshape(-1, 4, 4).transpose(0, 2, 1)
+		return numpy.matmul(self.Compose(local), self.inverse)[:, :3]
+
+class Animation(object):
+	'''An :class:`Animation` is a set of keyframe tracks, one for each bone of a
+:class:`Skeleton`, sampled at the same ``(F,)`` ``times`` (in seconds, ascending):
+``pos`` is an ``(F, B, 3)`` array of bone positions and ``quat`` an ``(F, B, 4)``
+array of unit quaternions (``(w, x, y, z)``), each relative to the bone's
+parent. If ``loop`` is true, the animation repeats after the last keyframe;
+otherwise, it holds it.'''
+	def __init__(self, times, pos, quat, loop=True):
+		#: The ``(F,)`` array of keyframe times.
+		self.times=numpy.array(times, numpy.float64)
+		#: The ``(F, B, 3)`` array of bone positions.
+		self.pos=numpy.array(pos, numpy.float64)
+		#: The ``(F, B, 4)`` array of bone rotations.
+		self.quat=numpy.array(quat, numpy.float64)
+		#: Whether or not the animation repeats.
+		self.loop=loop
+		if not (len(self.times)==len(self.pos)==len(self.quat)):
+			raise ValueError('The times, positions and rotations must have as many keyframes')
+	@property
+	def duration(self):
+		'''The time of the last keyframe.'''
+		return self.times[-1]
+	def Sample(self, time):
+		'''Returns the ``(B, 3)`` positions and ``(B, 4)`` rotations of the bones at
+``time``, interpolating linearly and spherically (see :func:`vmath.SlerpArray`)
+between the nearest keyframes.'''
+		times=self.times
+		if self.loop and times[-1]>times[0]:
+			time=times[0]+(time-times[0])%(times[-1]-times[0])
+		if len(times)==1 or time<=times[0]:
+			return self.pos[0], self.quat[0]
+		if time>=times[-1]:
+			return self.pos[-1], self.quat[-1]
+		key=int(numpy.searchsorted(times, time, 'right'))-1
+		t=(time-times[key])/(times[key+1]-times[key])
+		pos=self.pos[key]+t*(self.pos[key+1]-self.pos[key])
+		return pos, SlerpArray(self.quat[key], self.quat[key+1], t)
+
+class AnimatedMesh(Renderable):
+	'''An :class:`AnimatedMesh` is a triangle mesh deformed by a :class:`Skeleton`.
+The mesh is given in its bind pose, packed into arrays: the ``(N, 3)``
+``positions`` and ``normals`` (which may be ``None``) of its vertices, and the
+``indices`` of the vertices of each triangle. Each vertex is influenced by up to
+``K`` bones: ``bones`` is an ``(N, K)`` integer array of their indices, and
+``weights`` an ``(N, K)`` array of how much each moves it (normalized to sum to
+1; unused slots should have a weight of 0).
+
+Each frame, the :attr:`animation` is sampled at :attr:`time`, and every vertex
+is skinned at once, as the weighted sum of its bones' matrices (see
+:func:`Skeleton.Palette`) applied to its bind position and normal. The result
+is uploaded to a dynamic vertex buffer and drawn with ``glDrawElements``.
+Skinning makes no GL calls, and is done by :func:`Prepare` (which a
+:class:`pipeline.Pipeline` calls ahead of drawing, on another thread); the mesh
+is only skinned and uploaded again when :attr:`time` or :attr:`animation` change.
+
+The skinned normals aren't renormalized; enable GL_NORMALIZE if the bones scale.'''
+	def __init__(self, positions, normals, indices, skeleton, bones, weights, **kwargs):
+		super(AnimatedMesh, self).__init__(**kwargs)
+		positions=numpy.asarray(positions, numpy.float64)
+		count=len(positions)
+		#: The :class:`Skeleton`.
+		self.skeleton=skeleton
+		#: The ``(N, K)`` integer array of the bones influencing each vertex.
+		self.bones=numpy.array(bones, numpy.intp).reshape(count, -1)
+		#: The ``(N, K)`` array of the weights of :attr:`bones`.
+		self.weights=numpy.array(weights, numpy.float64).reshape(count, -1)
+		#: The ``uint32`` array of the vertex indices of the triangles.
+		self.indices=numpy.array(indices, numpy.uint32).ravel()
+		#: Whether or not there are normals.
+		self.normals=normals is not None
+		#The bind pose, as columns of (N, 4, 2) matrices: the position (w=1) and
+		#normal (w=0), so that both are skinned by one product
+		self.bind=numpy.zeros((count, 4, 2))
+		self.bind[:, :3, 0]=positions
+		self.bind[:, 3, 0]=1
+		if normals is not None:
+			self.bind[:, :3, 1]=normals
+		#: The :class:`Animation` played, or ``None`` to show the bind pose.
+		self.animation=kwargs.get('animation', None)
+		#: The time (in seconds) into :attr:`animation` shown.
+		self.time=kwargs.get('time', 0.0)
+		#: The name of the vertex buffer object, or ``None`` until first drawn.
+		self.vbo=None
+		#: The name of the index buffer object, or ``None`` until first drawn.
+		self.ibo=None
+		#: The ``(animation, time)`` last uploaded, or ``None``.
+		self.uploaded=None
+		self._skinned=None
+	def Pose(self):
+		'''Returns the ``(B, 3, 4)`` skinning matrices of the current pose.'''
+		skel=self.skeleton
+		if self.animation is None:
+			return numpy.tile(numpy.eye(4)[:3], (len(skel), 1, 1))
+		return skel.Palette(*self.animation.Sample(self.time))
+	def Skin(self, palette=None):
+		'''Returns an ``(N, 6)`` ``float32`` array of the vertex positions and
+normals, interleaved, skinned by ``palette`` (by default, :func:`Pose`). This
+makes no GL calls.'''
+		if palette is None:
+			palette=self.Pose()
+		#Blend each vertex's matrices ((N, 3, 4)), then transform both columns at once
+		blended=numpy.einsum('nk,nkij->nij', self.weights, palette[self.bones])
+		skinned=numpy.matmul(blended, self.bind)
+		out=numpy.empty((len(skinned), 6), numpy.float32)
+		out[:, :3]=skinned[:, :, 0]
+		out[:, 3:]=skinned[:, :, 1]
+		return out
+	def Prepare(self):
+		'''Skins the mesh, if the pose has changed since it was last skinned, and
+returns ``((animation, time), vertices)`` (see :func:`Skin`) for :func:`Draw`.'''
+		key=(self.animation, self.time)
+		skinned=self._skinned
+		if skinned is None or skinned[0]!=key:
+			skinned=self._skinned=(key, self.Skin())
+		return skinned
+	def Delete(self):
+		'''Free the buffer objects (which are made again if this is drawn).'''
+		if self.vbo is not None:
+			GL.glDeleteBuffers(2, [self.vbo, self.ibo])
+			self.vbo=self.ibo=None
+			self.uploaded=None
+	def Render(self):
+		'''Draws the mesh (see :func:`Draw`), and then its children.'''
+		self.Draw()
+		self.RenderChildren()
+	def Draw(self, prepared=None):
+		'''Uploads the vertices of ``prepared`` (the result of :func:`Prepare`,
+which is called if it isn't given), if they aren't already, and draws the
+triangles.'''
+		if prepared is None:
+			prepared=self.Prepare()
+		key, verts=prepared
+		if self.vbo is None:
+			self.vbo=GL.glGenBuffers(1)
+			self.ibo=GL.glGenBuffers(1)
+			GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+			GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, self.indices.nbytes, self.indices, GL.GL_STATIC_DRAW)
+			GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+		GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vbo)
+		if key!=self.uploaded:
+			#(Respecifying the whole buffer lets the driver orphan the old storage
+			#rather than wait for the last frame to finish with it)
+			GL.glBufferData(GL.GL_ARRAY_BUFFER, verts.nbytes, verts, GL.GL_DYNAMIC_DRAW)
+			self.uploaded=key
+		GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+		GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+		GL.glVertexPointer(3, GL.GL_FLOAT, 24, ctypes.c_void_p(0))
+		if self.normals:
+			GL.glEnableClientState(GL.GL_NORMAL_ARRAY)
+			GL.glNormalPointer(GL.GL_FLOAT, 24, ctypes.c_void_p(12))
+		GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+		GL.glDrawElements(GL.GL_TRIANGLES, len(self.indices), GL.GL_UNSIGNED_INT, ctypes.c_void_p(0))
+		GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+		GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+		GL.glPopClientAttrib()
+
 class Face(Renderable):
 	'''The :class:`Face` class represents one GL primitive as a primitive mode
 and a sequence of vertices (of the type :class:`Vertex`).'''
@@ -576,12 +1143,12 @@ and a sequence of vertices (of the type :class:`Vertex`).'''
 	Due to concerns highlighted in :func:`Renderable.RenderChildren`, the
 	:class:`Face` does not render its children until after the drawing of the
 	primitive is over, nor does it push the state of a :class:`Vertex`.'''
-		glBegin(self.mode)
+		GL.glBegin(self.mode)
 		for vertex in self.vertices:
 			#Can't transform--it performs things like pushing matrices that
 			#will error on our glBegin/End pair.
 			vertex.Render()
-		glEnd()
+		GL.glEnd()
 		self.RenderChildren()
 
 class Vertex(Renderable):
@@ -609,12 +1176,12 @@ and texture coordinates of these vertices.'''
 	not be called for a :class:`Vertex`, because these are likely to introduce
 	calls which are illegal between glBegin and glEnd.'''
 		if self.col is not None:
-			glColor4d(*self.col.FastTo4())
+			GL.glColor4d(*self.col.FastTo4())
 		if self.tex is not None:
-			glTexCoord3d(*self.tex.FastTo3())
+			GL.glTexCoord3d(*self.tex.FastTo3())
 		if self.norm is not None:
-			glNormal3d(*self.norm.FastTo3())
-		glVertex4f(*self.pos.FastTo4())
+			GL.glNormal3d(*self.norm.FastTo3())
+		GL.glVertex4f(*self.pos.FastTo4())
 
 class SSSprite(Renderable):
 	'''An :class:`SSSprite`, or a "Screen Space Sprite," is a sprite (fixed,
@@ -639,34 +1206,34 @@ be set.'''
 		if size is None:
 			size=self.size
 		#Reset the matrices
-		glMatrixMode(GL_MODELVIEW)
-		glPushMatrix()
-		glLoadIdentity()
-		glMatrixMode(GL_PROJECTION)
-		glPushMatrix()
-		glLoadIdentity()
+		GL.glMatrixMode(GL.GL_MODELVIEW)
+		GL.glPushMatrix()
+		GL.glLoadIdentity()
+		GL.glMatrixMode(GL.GL_PROJECTION)
+		GL.glPushMatrix()
+		GL.glLoadIdentity()
 		#Ensure we're actually using the texture
-		glEnable(GL_TEXTURE_2D)
+		GL.glEnable(GL.GL_TEXTURE_2D)
 		#Set the color such that modulation is essentially nullified
-		glColor4d(1, 1, 1, 1)
+		GL.glColor4d(1, 1, 1, 1)
 		#Render to the screen
 		low=(-1 if self.center else 0)
-		glBegin(GL_QUADS)
-		glTexCoord2d(0, 0)
-		glVertex3d(pos.x+low*size.x, pos.y+low*size.x, pos.z)
-		glTexCoord2d(1, 0)
-		glVertex3d(pos.x+size.x, pos.y+low*size.y, pos.z)
-		glTexCoord2d(1, 1)
-		glVertex3d(pos.x+size.x, pos.y+size.y, pos.z)
-		glTexCoord2d(0, 1)
-		glVertex3d(pos.x+low*size.x, pos.y+size.y, pos.z)
-		glEnd()
+		GL.glBegin(GL.GL_QUADS)
+		GL.glTexCoord2d(0, 0)
+		GL.glVertex3d(pos.x+low*size.x, pos.y+low*size.x, pos.z)
+		GL.glTexCoord2d(1, 0)
+		GL.glVertex3d(pos.x+size.x, pos.y+low*size.y, pos.z)
+		GL.glTexCoord2d(1, 1)
+		GL.glVertex3d(pos.x+size.x, pos.y+size.y, pos.z)
+		GL.glTexCoord2d(0, 1)
+		GL.glVertex3d(pos.x+low*size.x, pos.y+size.y, pos.z)
+		GL.glEnd()
 		#Disable the texture (others may re-enable it later)
-		glDisable(GL_TEXTURE_2D)
+		GL.glDisable(GL.GL_TEXTURE_2D)
 		#Restore matrices
-		glPopMatrix()
-		glMatrixMode(GL_MODELVIEW)
-		glPopMatrix()
+		GL.glPopMatrix()
+		GL.glMatrixMode(GL.GL_MODELVIEW)
+		GL.glPopMatrix()
 		self.RenderChildren()
 
 class WSSprite(SSSprite):
@@ -681,7 +1248,7 @@ the :class:`SSSprite`.'''
 	def Render(self):
 		'''Renders the sprite (by passing in the position override parameter to
 :func:`SSSprite.Render`).'''
-		x, y, z=gluProject(*self.pos.FastTo3(), view=numpy.array([-1, -1, 2, 2]))
+		x, y, z=GL.gluProject(*self.pos.FastTo3(), view=numpy.array([-1, -1, 2, 2]))
 		#The weird viewport above should (theoretically) give us an identity viewport.
 ##		print 'Render at', x, y, z
 		super(WSSprite, self).Render(Vector(x, y, z))
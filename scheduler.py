@@ -0,0 +1,237 @@
+'''
+.. mindscape -- Mindscape Engine
+scheduler -- Timers and Deferred Work
+=====================================
+
+This module gives the engine a notion of time. A :class:`Scheduler` is ticked
+once per frame (with :func:`Scheduler.Tick`), and runs, in order:
+
+* per-frame callbacks (:func:`Scheduler.EachFrame`), given the frame time;
+* fixed-rate and one-shot timers (:func:`Scheduler.Every`,
+  :func:`Scheduler.After`), which catch up (up to a limit) if a frame ran long,
+  and may post :attr:`event.EVENT.TIMER` events (:func:`Scheduler.Post`);
+* deferred tasks (:func:`Scheduler.Defer`), in priority order, until the
+  per-frame time :attr:`Scheduler.budget` is spent. A task is either a callable
+  (run once) or a generator, which is resumed once per step, so that a long job
+  may be spread over many frames by ``yield``\ ing periodically.
+
+A typical main loop looks like::
+
+	sched=Scheduler()
+	sched.Enable()
+	sched.Every(1/60.0, env.Step, 1/60.0)
+	while not events.quit:
+		events.Pump()
+		events.Dispatch(scene)
+		sched.Tick()
+		with scene:
+			scene.Render()
+
+While a scheduler is enabled (it is the :data:`active` one),
+:class:`scenegraph.Mesh`\ es and :class:`layout.Label`\ s with ``defer`` set
+compile or redraw themselves as deferred tasks, drawing the old (or uncompiled)
+version until the work is done, rather than doing it in the middle of a frame.
+'''
+
+import heapq
+import itertools
+from timeit import default_timer as clock
+
+from event import TimerEvent
+from log import main, DV1, DV2, DV3, obCode, Guard
+logger=main.getChild('scheduler')
+guard=Guard(logger)
+
+#: The currently enabled :class:`Scheduler`, or ``None``.
+active=None
+
+class Timer(object):
+	'''A timer, as returned by :func:`Scheduler.Every` and friends. Only
+:attr:`interval` and :attr:`count` are meant to be modified; use
+:func:`Scheduler.Cancel` to stop it.'''
+	def __init__(self, when, interval, func, args):
+		#: The scheduler time at which this timer next fires.
+		self.when=when
+		#: The time between firings, or ``None`` for a one-shot timer.
+		self.interval=interval
+		#: The number of times this timer has fired.
+		self.count=0
+		self.func=func
+		self.args=args
+		self.cancelled=False
+	def __lt__(self, other):
+		return self.when<other.when
+
+class Task(object):
+	'''A deferred task, as returned by :func:`Scheduler.Defer`.'''
+	def __init__(self, priority, seq, work):
+		#: The priority (lower runs first).
+		self.priority=priority
+		self.seq=seq
+		#: The callable or generator to run.
+		self.work=work
+		#: Whether or not the task has finished.
+		self.done=False
+		self.cancelled=False
+	def __lt__(self, other):
+		return (self.priority, self.seq)<(other.priority, other.seq)
+	def Step(self):
+		'''Run one step of the task; returns ``True`` once it has finished.'''
+		work=self.work
+		if hasattr(work, 'next'):
+			try:
+				work.next()
+			except StopIteration:
+				return True
+			return False
+		work()
+		return True
+
+class Scheduler(object):
+	'''A :class:`Scheduler` keeps its own time (:attr:`time`), which advances
+only in :func:`Tick`. ``budget`` is the number of seconds per tick that may be
+spent on deferred tasks (at least one step of one task is always run, so that
+work always progresses). A fixed-rate timer fires at most ``catchup`` times per
+tick; any further backlog is dropped.
+
+If ``events`` (an :class:`event.EventQueue`) is given, timer events made with
+:func:`Post` are queued there, to be dispatched with the next batch.'''
+	def __init__(self, budget=0.004, catchup=5, events=None):
+		#: The time per tick allowed for deferred tasks, in seconds.
+		self.budget=budget
+		#: The largest number of times a timer fires per tick.
+		self.catchup=catchup
+		#: The :class:`event.EventQueue` that posted events are put into.
+		self.events=events
+		#: The scheduler time, in seconds.
+		self.time=0.0
+		#: The number of ticks so far.
+		self.frame=0
+		#: The length of the last tick, in seconds.
+		self.dt=0.0
+		#: The time spent on deferred tasks in the last tick, in seconds.
+		self.spent=0.0
+		#: The number of task steps run in the last tick.
+		self.steps=0
+		self.frames=[]
+		self.timers=[]
+		self.tasks=[]
+		self.seq=itertools.count()
+		self.last=None
+	def Enable(self):
+		'''Make this the :data:`active` scheduler.'''
+		global active
+		active=self
+	def Disable(self):
+		'''Stop this being the :data:`active` scheduler.'''
+		global active
+		if active is self:
+			active=None
+	def EachFrame(self, func, *args):
+		'''Call ``func(dt, *args)`` every tick, where ``dt`` is the tick length. Returns ``func``.'''
+		self.frames.append((func, args))
+		return func
+	def RemoveFrame(self, func):
+		'''Stop calling ``func`` every tick.'''
+		self.frames=[i for i in self.frames if i[0] is not func]
+	def Every(self, interval, func, *args):
+		'''Call ``func(*args)`` every ``interval`` seconds. Returns a :class:`Timer`.'''
+		if interval<=0:
+			raise ValueError('Timer interval must be positive')
+		timer=Timer(self.time+interval, interval, func, args)
+		heapq.heappush(self.timers, timer)
+		return timer
+	def After(self, delay, func, *args):
+		'''Call ``func(*args)`` once, ``delay`` seconds from now. Returns a :class:`Timer`.'''
+		timer=Timer(self.time+delay, None, func, args)
+		heapq.heappush(self.timers, timer)
+		return timer
+	def Post(self, interval, subtype=None, repeat=True):
+		'''Post a :class:`event.TimerEvent` (with the given ``subtype``) to
+:attr:`events` every ``interval`` seconds (or once, if ``repeat`` is false).
+Returns a :class:`Timer`.'''
+		if self.events is None:
+			raise ValueError('Scheduler has no event queue to post to')
+		timer=(self.Every if repeat else self.After)(interval, self._Post, subtype)
+		timer.args=(subtype, timer)
+		return timer
+	def _Post(self, subtype, timer):
+		self.events.Put(TimerEvent(subtype, timer.count, self.time))
+	def Cancel(self, item):
+		'''Cancel a :class:`Timer` or :class:`Task`.'''
+		item.cancelled=True
+	def Defer(self, work, priority=0):
+		'''Run ``work`` (a callable, or a generator) as a deferred task. Tasks are
+run in order of ``priority`` (lower first), then in the order they were
+deferred. Returns a :class:`Task`.'''
+		task=Task(priority, next(self.seq), work)
+		heapq.heappush(self.tasks, task)
+		return task
+	def Pending(self):
+		'''Returns the number of timers and tasks outstanding.'''
+		return len(self.timers)+len(self.tasks)
+	def Tick(self, dt=None):
+		'''Advance the scheduler by ``dt`` seconds (by default, the wall time since
+the last tick), and run everything that's due.'''
+		now=clock()
+		if dt is None:
+			dt=(0.0 if self.last is None else now-self.last)
+		self.last=now
+		self.dt=dt
+		self.time+=dt
+		self.frame+=1
+		for func, args in self.frames:
+			func(dt, *args)
+		self.RunTimers()
+		self.RunTasks()
+	def RunTimers(self):
+		'''Fire every timer that's due. A timer whose function raises is logged,
+and fires again as usual.'''
+		timers=self.timers
+		time=self.time
+		while timers and timers[0].when<=time:
+			timer=heapq.heappop(timers)
+			if timer.cancelled:
+				continue
+			fired=0
+			while timer.when<=time and fired<self.catchup:
+				timer.count+=1
+				fired+=1
+				try:
+					timer.func(*timer.args)
+				except Exception:
+					logger.exception('Timer %s raised', obCode(timer))
+				if timer.interval is None or timer.cancelled:
+					break
+				timer.when+=timer.interval
+			if timer.interval is not None and not timer.cancelled:
+				if timer.when<=time:
+					if guard.DV1:
+						logger.log(DV1, 'Timer %s dropped %d firings', obCode(timer), int((time-timer.when)/timer.interval)+1)
+					timer.when=time+timer.interval
+				heapq.heappush(timers, timer)
+	def RunTasks(self):
+		'''Run deferred tasks until the :attr:`budget` is spent. A task which
+raises is logged, and finished.'''
+		tasks=self.tasks
+		start=clock()
+		end=start+self.budget
+		steps=0
+		while tasks:
+			task=heapq.heappop(tasks)
+			if task.cancelled:
+				continue
+			try:
+				done=task.Step()
+			except Exception:
+				logger.exception('Task %s raised', obCode(task))
+				done=True
+			if done:
+				task.done=True
+			else:
+				heapq.heappush(tasks, task)
+			steps+=1
+			if clock()>=end:
+				break
+		self.steps=steps
+		self.spent=clock()-start
@@ -1,5 +1,9 @@
+import sys
 import random
 
+import engine
+engine.Init()
+
 import pygame
 from pygame.locals import *
 from OpenGL.GL import *
@@ -7,7 +11,9 @@ from OpenGL.GL import *
 from vmath import Vector, Matrix
 from scenegraph import *
 from layout import *
-from event import Event
+from event import EventQueue, EVENT, KBD
+from replay import Recorder
+from scheduler import Scheduler
 
 pygame.init()
 
@@ -63,21 +69,31 @@ sld=Slider(*con.grid.CellPair(0, 1), bcol=Vector(0, 0.5, 0.5, 0.5), parent=con)
 
 ##print 'Textures:', Texture.ALL
 
-while True:
+events=EventQueue()
+sched=Scheduler(events=events)
+sched.Enable()
+
+def Spin(dt):
+	mesh.transform.rot[0]=(mesh.transform.rot[0]+30*dt)%360
+sched.EachFrame(Spin)
+if len(sys.argv)>2 and sys.argv[1]=='--record':
+	events.recorder=Recorder(sys.argv[2])
+
+while not events.quit:
 ##	print 'Residences:', glAreTexturesResident([i.id for i in Texture.ALL])
-	for ev in pygame.event.get():
-		if ev.type==QUIT or (ev.type==KEYDOWN and ev.key==K_ESCAPE):
-			exit()
-		for ev in Event.FromPygame(ev):
-			sc.Trigger(ev)
+	events.Pump()
+	for ev in events.pending:
+		if ev.type==EVENT.KBD and ev.subtype==KBD.KEYDOWN and ev.key==K_ESCAPE:
+			events.quit=True
+	events.Dispatch(sc)
+	sched.Tick()
 	glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
-	mesh.transform.rot[0]+=1
-	if mesh.transform.rot[0]>=360:
-		mesh.transform.rot[0]-=360
 ##	sld.value+=0.02
 ##	if sld.value>1:
 ##		sld.value=0
 	with sc:
 		sc.Render()
 	pygame.display.flip()
-	clock.tick(30)
\ No newline at end of file
+	clock.tick(30)
+if events.recorder is not None:
+	events.recorder.Close()
@@ -1,3 +1,6 @@
+import engine
+engine.Init()
+
 import pygame
 from pygame.locals import *
 from OpenGL.GL import *
@@ -33,7 +36,7 @@ mesh=Mesh(Face(GL_QUADS, Vertex(Vector(-1, -1, 0.1), Vector(1, 0, 0), tex=Vector
 						 Vertex(Vector(-1, 1, -0.1), Vector(1, 1, 1), tex=Vector(0, 1))), texture=tex)
 mesh.transform.rot=[0, Vector(0, 0, 1)]
 mesh.enable.add(GL_TEXTURE_2D)
-sc.children.append(mesh)
+mesh.SetParent(sc)
 
 lines=Mesh(Face(GL_LINES, Vertex(Vector(-1, 0, 0), Vector(1, 0, 0)),
 						  Vertex(Vector(1, 0, 0), Vector(1, 0, 0))),
@@ -43,13 +46,13 @@ lines=Mesh(Face(GL_LINES, Vertex(Vector(-1, 0, 0), Vector(1, 0, 0)),
 						  Vertex(Vector(0, 0, 1), Vector(0, 0, 1))))
 lines.disable.add(GL_DEPTH_TEST)
 lines.transform.pos=Vector(1.5, 0, 0)
-mesh.children.append(lines)
+lines.SetParent(mesh)
 
 spr=WSSprite(texture=tex)
-lines.children.append(spr)
+spr.SetParent(lines)
 
 ##test=SSSprite(texture=tex, center=True)
-##sc.children.append(test)
+##test.SetParent(sc)
 
 while True:
 	for ev in pygame.event.get():
@@ -189,4 +189,86 @@ is converted to a 4D vector).'''
 .. warning::
 
 	See :func:`Vector.FastTo2`.'''
-		return self._ToX(4, True)
\ No newline at end of file
+		return self._ToX(4, True)
+
+def Slerp(a, b, t):
+	'''Returns the spherical linear interpolation between the unit quaternions
+``a`` and ``b`` (sequences of ``(w, x, y, z)``, as used by ODE) at ``t`` (0 gives
+``a``, 1 gives ``b``), as a 4D :class:`Vector`. The shorter arc is always taken.'''
+	a=numpy.asarray(a, numpy.float64)
+	b=numpy.asarray(b, numpy.float64)
+	d=a.dot(b)
+	if d<0:
+		b=-b
+		d=-d
+	if d>0.9995:
+		#Nearly parallel; lerp (and normalize) to avoid dividing by ~0
+		q=a+t*(b-a)
+		q/=numpy.sqrt(q.dot(q))
+	else:
+		theta=numpy.arccos(d)
+		s=numpy.sin(theta)
+		q=(numpy.sin((1-t)*theta)/s)*a+(numpy.sin(t*theta)/s)*b
+	return Vector(*q)
+
+def AxisAngle(q):
+	'''Returns the unit quaternion ``q`` (``(w, x, y, z)``) as ``(angle, axis)``,
+where the angle is in degrees and the axis is a 3D :class:`Vector`, as used by
+:attr:`scenegraph.PRSTransform.rot`.'''
+	w=max(-1.0, min(1.0, q[0]))
+	s=numpy.sqrt(1-w*w)
+	if s<1e-9:
+		return 0.0, Vector(1, 0, 0)
+	return numpy.degrees(2*numpy.arccos(w)), Vector(q[1]/s, q[2]/s, q[3]/s)
+
+def SlerpArray(a, b, t):
+	'''The vectorized form of :func:`Slerp`: ``a`` and ``b`` are ``(N, 4)`` arrays
+of unit quaternions, and the result is an ``(N, 4)`` array.'''
+	a=numpy.asarray(a, numpy.float64)
+	b=numpy.array(b, numpy.float64)
+	d=numpy.einsum('ij,ij->i', a, b)
+	neg=d<0
+	b[neg]*=-1
+	d=numpy.abs(d)
+	near=d>0.9995
+	theta=numpy.arccos(numpy.minimum(d, 1.0))
+	s=numpy.sin(theta)
+	s[near]=1.0
+	wa=numpy.where(near, 1-t, numpy.sin((1-t)*theta)/s)
+	wb=numpy.where(near, t, numpy.sin(t*theta)/s)
+	q=wa[:, None]*a+wb[:, None]*b
+	q/=numpy.sqrt(numpy.einsum('ij,ij->i', q, q))[:, None]
+	return q
+
+def PoseMatrices(pos, quat, out=None):
+	'''Returns (or writes into ``out``) an ``(N, 16)`` array of 4D transformation
+matrices, in the column-major order expected by ``glMultMatrixd``, each of which
+rotates by the unit quaternion ``quat[i]`` (``(w, x, y, z)``) and then translates
+by ``pos[i]``. ``pos`` and ``quat`` are ``(N, 3)`` and ``(N, 4)`` arrays.'''
+	pos=numpy.asarray(pos, numpy.float64)
+	quat=numpy.asarray(quat, numpy.float64)
+	if out is None:
+		out=numpy.empty((len(pos), 16), numpy.float64)
+	w, x, y, z=quat[:, 0], quat[:, 1], quat[:, 2], quat[:, 3]
+	xx, yy, zz=x*x, y*y, z*z
+	xy, xz, yz=x*y, x*z, y*z
+	wx, wy, wz=w*x, w*y, w*z
+	#Column 0
+	out[:, 0]=1-2*(yy+zz)
+	out[:, 1]=2*(xy+wz)
+	out[:, 2]=2*(xz-wy)
+	out[:, 3]=0
+	#Column 1
+	out[:, 4]=2*(xy-wz)
+	out[:, 5]=1-2*(xx+zz)
+	out[:, 6]=2*(yz+wx)
+	out[:, 7]=0
+	#Column 2
+	out[:, 8]=2*(xz+wy)
+	out[:, 9]=2*(yz-wx)
+	out[:, 10]=1-2*(xx+yy)
+	out[:, 11]=0
+	#Column 3
+	out[:, 12:15]=pos
+	out[:, 15]=1
+	return out